@@ -0,0 +1,360 @@
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import shutil
+import sys
+from html.parser import HTMLParser
+from urllib.parse import unquote
+
+# ==========================================
+# 1. 設定エリア
+# ==========================================
+ASSETS_DIR = "assets"
+
+# アセットごとの sha256 と、ページごとの参照チャンク一覧
+ASSET_MANIFEST_FILE = "assets_manifest.json"
+
+# --- JS / CSS の中の参照 (Vite の出力の書き方だけを拾う) ---
+# 静的 import: from"./x.js" / import"./x.js" (ページ表示時に必ず読まれる)
+STATIC_IMPORT = re.compile(r'(?:\bfrom|\bimport)\s*"\./([^"]+)"')
+# 動的 import: import("./x.js") / import(`./x.js`)。直後の __vite__mapDeps([3,5,...]) が一緒に先読みされるチャンクの番号
+DYNAMIC_IMPORT = re.compile(r"""\bimport\(\s*["'`]\./([^"'`$]+)["'`]\s*\)""")
+MAP_DEPS_CALL = re.compile(r"__vite__mapDeps\(\[([\d,\s]*)\]\)")
+# 番号 -> チャンク名の表: m.f||(m.f=["./a.js","./b.css",...])
+MAP_DEPS_TABLE = re.compile(r"m\.f=\[([^\]]*)\]")
+# new URL("x.wasm", import.meta.url) (wasm、Web Worker、画像)
+ASSET_URL = re.compile(r"""new URL\(\s*["'`](?:\./)?([^"'`/]+)["'`]\s*,\s*import\.meta\.url\s*\)""")
+# CSS の url(./x.woff2) (フォントなど。data: URI は除く)
+CSS_URL = re.compile(r"""url\(\s*["']?(?!data:)(?:\./)?([^"')?#/\s]+)""")
+# __vite__mapDeps の組が付いている import() を探す範囲 (組の手前の文字数)
+MAP_DEPS_WINDOW = 400
+
+# --- HTML の中の参照 ---
+# <script src> / <link href> の assets/ 以下 (インラインの import("./assets/x.js") も含む)
+ASSET_PATH = re.compile(r"^\.?/?assets/([^/?#]+)$")
+INLINE_IMPORT = re.compile(r"""\bimport\(\s*["'`]\.?/?assets/([^"'`/?#]+)["'`]\s*\)""")
+# ページ内のその他の assets/ への文字列 (ノートブックのコードや出力の中の画像パスなど)。チャンクではないので警告だけ
+LOOSE_ASSET_REF = re.compile(r"""(?<![\w.-])\.?/?assets/([A-Za-z0-9_.\-]+)""")
+
+# run モード (--mode run) で読み込まれないエントリ (ファイル名のハッシュより前の部分)
+# marimo の入口のチャンクはモードに応じてこのどれかを動的 import する
+RUN_MODE_SKIP = {"home-page", "edit-page"}
+
+TEXT_EXTS = (".js", ".mjs", ".css")
+
+# 事前圧縮した兄弟ファイル (precompress.py が書く。チャンクとしては数えない)
+VARIANT_EXTS = (".br", ".gz")
+
+
+# ==========================================
+# 2. 参照の解析
+# ==========================================
+def list_assets():
+    if not os.path.isdir(ASSETS_DIR):
+        return []
+    return [n for n in os.listdir(ASSETS_DIR) if not n.endswith(VARIANT_EXTS)]
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_stem(name):
+    """ハッシュを除いたチャンク名 (例: edit-page-Boj4r8n8.js -> edit-page)"""
+    return re.sub(r"-[A-Za-z0-9_-]{8}$", "", os.path.splitext(name)[0])
+
+
+def parse_chunk_refs(text, is_css=False):
+    """JS / CSS の本文から (静的に読むチャンク, 遅延読み込みのチャンク) を取り出す
+
+    __vite__mapDeps の先読みの組は、import() 以外 (CSS だけの先読みなど) に付くものも含めてすべて数える。
+    run モードで使わないエントリ (RUN_MODE_SKIP) の import() と、それに付いた組だけは数えない。
+    """
+    if is_css:
+        return set(CSS_URL.findall(text)), set()
+
+    static = set(STATIC_IMPORT.findall(text))
+    lazy = set(ASSET_URL.findall(text))
+    skipped_at = []
+    for m in DYNAMIC_IMPORT.finditer(text):
+        if chunk_stem(m.group(1)) in RUN_MODE_SKIP:
+            skipped_at.append(m.end())
+        else:
+            lazy.add(m.group(1))
+
+    table = MAP_DEPS_TABLE.search(text)
+    deps_table = re.findall(r'"\./([^"]+)"', table.group(1)) if table else []
+    previous_end = 0
+    for m in MAP_DEPS_CALL.finditer(text):
+        # 組が付いているのは、1つ前の組から MAP_DEPS_WINDOW 文字以内でこの組より手前にある import()
+        # それが読み込まないエントリなら、その先読みの組も読まれない
+        start = max(previous_end, m.start() - MAP_DEPS_WINDOW)
+        previous_end = m.end()
+        before = text.rfind("import(", start, m.start())
+        if before != -1 and any(before < end <= m.start() for end in skipped_at):
+            continue
+        lazy |= {deps_table[int(i)] for i in m.group(1).split(",") if i.strip() and int(i) < len(deps_table)}
+    return static, lazy - static
+
+
+def asset_refs(name, names, cache):
+    """アセット1つが参照するチャンク (静的に読むもの, 遅延読み込みのもの) を返す"""
+    if name not in cache:
+        static, lazy = set(), set()
+        if name in names and name.endswith(TEXT_EXTS):
+            with open(os.path.join(ASSETS_DIR, name), "r", encoding="utf-8", errors="replace") as f:
+                static, lazy = parse_chunk_refs(f.read(), is_css=name.endswith(".css"))
+        cache[name] = (static - {name}, lazy - {name})
+    return cache[name]
+
+
+class _PageRefParser(HTMLParser):
+    """HTML のタグから assets/ への参照を集める (インラインの <script> の中身は別に返す)"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.refs = set()
+        self.inline_scripts = []
+        self._in_script = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        url = attrs.get("src") if tag == "script" else attrs.get("href") if tag == "link" else None
+        m = ASSET_PATH.match(url or "")
+        if m:
+            self.refs.add(m.group(1))
+        self._in_script = tag == "script" and "src" not in attrs
+
+    def handle_endtag(self, tag):
+        if tag == "script":
+            self._in_script = False
+
+    def handle_data(self, data):
+        if self._in_script:
+            self.inline_scripts.append(data)
+
+
+def unescape_text(text):
+    """JSON 文字列・HTML 実体参照・URL エンコードを戻す (マウント設定の中のコードを素の文字列として見るため)"""
+    text = text.replace('\\"', '"').replace("\\/", "/").replace("\\\\", "\\")
+    return unquote(html.unescape(text))
+
+
+def html_refs(text):
+    """ページの HTML から (読み込むチャンク, チャンク以外の assets/ への文字列) を取り出す
+
+    チャンクとして数えるのは <script src> / <link href> とインラインの import() だけ。
+    ノートブックのコードや出力に書かれた "assets/header.png" のような文字列は後者になる。
+    """
+    parser = _PageRefParser()
+    parser.feed(text)
+    parser.close()
+    chunks = set(parser.refs)
+    for script in parser.inline_scripts:
+        chunks |= set(INLINE_IMPORT.findall(unescape_text(script)))
+    loose = set(LOOSE_ASSET_REF.findall(unescape_text(text))) - chunks
+    return chunks, loose
+
+
+def page_assets(html_path, names, cache):
+    """ページが初回表示で読むチャンク / 遅延読み込みのチャンク / 見つからないチャンク / チャンク以外の参照"""
+    with open(html_path, "r", encoding="utf-8") as f:
+        chunks, loose = html_refs(f.read())
+
+    missing = chunks - names
+    initial = chunks & names
+
+    # 静的 import をたどって初回表示分を求める
+    todo = list(initial)
+    while todo:
+        static, _ = asset_refs(todo.pop(), names, cache)
+        for ref in static:
+            if ref not in names:
+                missing.add(ref)
+            elif ref not in initial:
+                initial.add(ref)
+                todo.append(ref)
+
+    # 残りの参照 (動的 import とその先読み, wasm, Web Worker など) をたどって遅延読み込み分を求める
+    reachable = set(initial)
+    todo = list(initial)
+    while todo:
+        static, lazy = asset_refs(todo.pop(), names, cache)
+        for ref in (static | lazy) - reachable:
+            if ref not in names:
+                missing.add(ref)
+                continue
+            reachable.add(ref)
+            todo.append(ref)
+
+    # チャンク以外の文字列は、実在するアセットを指していれば問題なし
+    unresolved = {ref for ref in loose if ref not in names and ref not in missing}
+    return initial, reachable - initial, missing, unresolved
+
+
+# ==========================================
+# 3. ストアの更新
+# ==========================================
+def sync_assets(src_dir):
+    """エクスポート先の assets/ をストアに取り込む。(コピー数, 内容が食い違ったファイル) を返す
+
+    ファイル名はハッシュ付きなので、同名で中身も同じなら何もしない。
+    """
+    os.makedirs(ASSETS_DIR, exist_ok=True)
+    copied, conflicts = 0, []
+    for name in os.listdir(src_dir):
+        src = os.path.join(src_dir, name)
+        dst = os.path.join(ASSETS_DIR, name)
+        if os.path.exists(dst):
+            if os.path.getsize(src) == os.path.getsize(dst) and file_sha256(src) == file_sha256(dst):
+                continue
+            conflicts.append(name)
+        shutil.copy2(src, dst)
+        copied += 1
+    return copied, conflicts
+
+
+def build_asset_manifest(pages, previous=None):
+    """全ページの参照を解析してマニフェストを作る (previous と同じファイルはハッシュを使い回す)"""
+    names = set(list_assets())
+    old_assets = (previous or {}).get("assets", {})
+    cache = {}
+
+    page_entries = {}
+    referenced = set()
+    for page in pages:
+        output = page["output"]
+        if not os.path.exists(output):
+            continue
+        initial, lazy, missing, unresolved = page_assets(output, names, cache)
+        referenced |= initial | lazy
+        page_entries[output] = {
+            "initial": sorted(initial), "lazy": sorted(lazy), "missing": sorted(missing), "unresolved": sorted(unresolved)
+        }
+
+    assets = {}
+    for name in sorted(referenced):
+        path = os.path.join(ASSETS_DIR, name)
+        size = os.path.getsize(path)
+        old = old_assets.get(name)
+        # 名前にハッシュが入っているので、同名・同サイズなら再計算しない
+        sha = old["sha256"] if old and old["size"] == size else file_sha256(path)
+        assets[name] = {"sha256": sha, "size": size}
+
+    for output, entry in page_entries.items():
+        html_bytes = os.path.getsize(output)
+        entry["initial_bytes"] = html_bytes + sum(assets[n]["size"] for n in entry["initial"])
+        entry["total_bytes"] = entry["initial_bytes"] + sum(assets[n]["size"] for n in entry["lazy"])
+
+    return {"assets": assets, "pages": page_entries, "unreferenced": sorted(names - referenced)}
+
+
+def prune_assets(manifest):
+    """どのページからも参照されていないチャンクを削除し、(件数, バイト数) を返す"""
+    removed, freed = 0, 0
+    for name in manifest["unreferenced"]:
+        path = os.path.join(ASSETS_DIR, name)
+        if os.path.isfile(path):
+            freed += os.path.getsize(path)
+            os.remove(path)
+            removed += 1
+            for ext in VARIANT_EXTS:
+                if os.path.exists(path + ext):
+                    os.remove(path + ext)
+    return removed, freed
+
+
+def changed_assets(manifest, previous):
+    """前回のマニフェストから追加・変更されたチャンク (デプロイでアップロードする分)"""
+    old = (previous or {}).get("assets", {})
+    return [n for n, a in manifest["assets"].items() if old.get(n, {}).get("sha256") != a["sha256"]]
+
+
+def load_asset_manifest(path=ASSET_MANIFEST_FILE):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_asset_manifest(manifest, path=ASSET_MANIFEST_FILE):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+
+
+# ==========================================
+# 4. レポート
+# ==========================================
+def mb(n):
+    return f"{n / 1024 / 1024:,.2f} MB"
+
+
+def print_report(manifest, previous, pruned=None):
+    print("-" * 72)
+    print(f"{'page':<16} {'initial':>8} {'initial size':>14} {'lazy':>6} {'total size':>14} {'missing':>8}")
+    for output, p in manifest["pages"].items():
+        print(
+            f"{output:<16} {len(p['initial']):>8} {mb(p['initial_bytes']):>14} "
+            f"{len(p['lazy']):>6} {mb(p['total_bytes']):>14} {len(p['missing']):>8}"
+        )
+    print("-" * 72)
+
+    store_bytes = sum(a["size"] for a in manifest["assets"].values())
+    print(f"📦 Asset store: {len(manifest['assets'])} chunks / {mb(store_bytes)}")
+    if pruned is not None:
+        print(f"🧹 Pruned {pruned[0]} unreferenced chunks ({mb(pruned[1])})")
+    elif manifest["unreferenced"]:
+        print(f"🗑️ {len(manifest['unreferenced'])} unreferenced chunks (use --prune to delete)")
+    changed = changed_assets(manifest, previous)
+    upload = sum(manifest["assets"][n]["size"] for n in changed)
+    print(f"⬆️ Changed since last manifest: {len(changed)} chunks ({mb(upload)})")
+
+
+def missing_pages(manifest):
+    """参照先のチャンクが assets/ に無いページ (ビルドの失敗として扱う)"""
+    return {output: p["missing"] for output, p in manifest["pages"].items() if p["missing"]}
+
+
+def unresolved_pages(manifest):
+    """チャンク以外で、assets/ に無いファイルを指す文字列があるページ (警告だけ)"""
+    return {output: p.get("unresolved", []) for output, p in manifest["pages"].items() if p.get("unresolved")}
+
+
+# ==========================================
+# 5. メイン
+# ==========================================
+def main(argv=None):
+    from build_factory import MANIFEST_FILE
+
+    parser = argparse.ArgumentParser(description="assets/ の参照関係を解析し、ページごとの転送量を表示する")
+    parser.add_argument("--manifest", default=MANIFEST_FILE, help="ビルドマニフェスト")
+    parser.add_argument("--prune", action="store_true", help="どのページからも参照されていないチャンクを削除する")
+    parser.add_argument("--save", action="store_true", help=f"{ASSET_MANIFEST_FILE} を更新する")
+    args = parser.parse_args(argv)
+
+    with open(args.manifest, "r", encoding="utf-8") as f:
+        pages = json.load(f)["pages"]
+    previous = load_asset_manifest()
+    manifest = build_asset_manifest(pages, previous)
+    pruned = prune_assets(manifest) if args.prune else None
+    print_report(manifest, previous, pruned)
+    if args.save:
+        save_asset_manifest(manifest)
+
+    for output, names in unresolved_pages(manifest).items():
+        print(f"⚠️ {output}: {len(names)} assets/ path(s) that are not build chunks do not exist (e.g. {names[0]}).")
+    broken = missing_pages(manifest)
+    for output, names in broken.items():
+        print(f"❌ {output}: {len(names)} referenced chunks are missing (e.g. {names[0]}). Rebuild the page.")
+    return 1 if broken else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
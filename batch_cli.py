@@ -0,0 +1,313 @@
+import argparse
+import math
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# ==========================================
+# 1. 設定エリア
+# ==========================================
+# 計算機ごとの入力列と既定値 (None は必須列)
+CALCULATORS = {
+    "nisa": {"monthly_yen": None, "years": None, "rate_pct": None},
+    "mortgage": {"loan_man": None, "rate_pct": None, "years": None, "method": "元利均等返済", "bonus_man": 0},
+    "pfc": {"weight": None, "body_fat": None, "activity": None, "goal": None, "protein_ratio": None, "fat_pct": None},
+}
+
+# 数値の入力の範囲 (ノートブックの入力欄と同じ。両端を含む)
+# 住宅ローンのボーナス分はこのほかに借入金額の半分まで
+INPUT_RANGES = {
+    "nisa": {"monthly_yen": (1000, 300000), "years": (1, 50), "rate_pct": (0.1, 15.0)},
+    "mortgage": {"loan_man": (100, 50000), "rate_pct": (0.0, 20.0), "years": (1, 50), "bonus_man": (0, 25000)},
+    "pfc": {"weight": (30, 150), "body_fat": (3, 50), "protein_ratio": (1.0, 4.0), "fat_pct": (10, 40)},
+}
+
+# 整数で受け付ける入力 (年数はスライダーの刻みが 1)
+INTEGER_INPUTS = {"years"}
+
+# 出力する結果列と型 (計算機, detail) ごと。エラーの行ではすべて空になる
+_NISA_RESULT = {"Year": pa.int64(), "Principal": pa.int64(), "Profit": pa.int64(), "Total": pa.int64()}
+_PFC_RESULT = {k: pa.float64() for k in ("LBM", "BMR", "TDEE", "Target", "P_g", "P_cal", "F_g", "F_cal", "C_g", "C_cal")}
+RESULT_COLUMNS = {
+    ("nisa", False): _NISA_RESULT,
+    ("nisa", True): _NISA_RESULT,
+    ("mortgage", False): {"初回返済額": pa.int64(), "返済回数": pa.int64(), "総支払額": pa.int64(), "利息合計": pa.int64()},
+    ("mortgage", True): {"月": pa.int64(), "年": pa.int64(), "支払額": pa.int64(), "残高": pa.int64(), "利息": pa.int64()},
+    ("pfc", False): _PFC_RESULT,
+    ("pfc", True): _PFC_RESULT,
+}
+
+# 文字列の入力列 (Parquet 出力用)。それ以外の入力列は整数で書かれていても float64 にそろえる
+STRING_INPUTS = {"method", "activity", "goal"}
+
+# pyarrow の型に対応する pandas の型 (欠損を持てる型。CSV の整数列が 1.0 にならないように)
+PANDAS_DTYPES = {pa.int64(): "Int64", pa.float64(): "Float64", pa.string(): "string"}
+
+# 1チャンクあたりの行数と、同時に投入しておくチャンク数 (ワーカー数に対する倍率)
+DEFAULT_CHUNK_ROWS = 500
+IN_FLIGHT_PER_WORKER = 2
+
+
+
+# ==========================================
+# 2. 入力チェックと計算 (ワーカープロセス側)
+# ==========================================
+def choice_values(calculator):
+    """選択式の入力と、受け付ける値 (ノートブックのドロップダウンの選択肢)"""
+    if calculator == "mortgage":
+        from mortgage_calc import REPAYMENT_METHODS
+
+        return {"method": REPAYMENT_METHODS}
+    if calculator == "pfc":
+        from pfc_calc import ACTIVITY_OPTIONS, GOAL_OPTIONS
+
+        return {"activity": tuple(ACTIVITY_OPTIONS.values()), "goal": tuple(GOAL_OPTIONS.values())}
+    return {}
+
+
+def validate_row(calculator, row):
+    """ノートブックの入力欄で選べない値なら ValueError (sim_api と共通の入力チェック)"""
+    for name, (low, high) in INPUT_RANGES[calculator].items():
+        try:
+            value = float(row[name])
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} は数値で入力してください: {row[name]!r}") from None
+        if not low <= value <= high:  # NaN もここで弾く
+            raise ValueError(f"{name} は {low}〜{high} の範囲で入力してください: {row[name]!r}")
+        if name in INTEGER_INPUTS and not value.is_integer():
+            raise ValueError(f"{name} は整数で入力してください: {row[name]!r}")
+
+    if calculator == "mortgage" and float(row["bonus_man"]) > float(row["loan_man"]) * 0.5:
+        raise ValueError(f"bonus_man は借入金額の半分までです: {row['bonus_man']!r}")
+
+    for name, allowed in choice_values(calculator).items():
+        value = row[name]
+        # CSV から読むと "-500" が -500 や -500.0 になるので、数値の選択肢は数値として比べる
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+            matched = any(_same_number(value, a) for a in allowed)
+        else:
+            matched = value in allowed
+        if not matched:
+            raise ValueError(f"{name} は {' / '.join(allowed)} のどれかを指定してください: {value!r}")
+
+
+def _same_number(value, option):
+    try:
+        return float(option) == value
+    except ValueError:
+        return False
+
+
+def calc_nisa(row, detail):
+    """積立NISA: 最終年 (detail なら全年) の行を返す"""
+    from nisa_calc import calculate_asset_growth
+
+    validate_row("nisa", row)
+    df = calculate_asset_growth(int(row["monthly_yen"]), int(row["years"]), float(row["rate_pct"]))
+    records = df.to_dict("records") if detail else df.tail(1).to_dict("records")
+    return records
+
+
+def calc_mortgage(row, detail):
+    """住宅ローン: 返済総額のサマリ (detail なら全月の返済予定表) を返す"""
+    from mortgage_calc import build_schedule
+
+    validate_row("mortgage", row)
+    schedule, total_pay, total_int = build_schedule(
+        row["loan_man"], float(row["rate_pct"]), int(row["years"]), row["method"], row["bonus_man"]
+    )
+    if detail:
+        return schedule.to_dict("records")
+    return [{
+        "初回返済額": int(schedule["支払額"].iloc[0]),
+        "返済回数": len(schedule),
+        "総支払額": total_pay,
+        "利息合計": total_int,
+    }]
+
+
+def calc_pfc(row, detail):
+    """PFC: 目標カロリーとPFCの内訳を返す"""
+    from pfc_calc import calculate_pfc
+
+    validate_row("pfc", row)
+    results = calculate_pfc(
+        float(row["weight"]), float(row["body_fat"]), str(row["activity"]), str(row["goal"]),
+        float(row["protein_ratio"]), float(row["fat_pct"])
+    )
+    return [{k: float(v) for k, v in results.items()}]
+
+
+CALC_FUNCS = {"nisa": calc_nisa, "mortgage": calc_mortgage, "pfc": calc_pfc}
+
+
+def run_chunk(calculator, records, detail):
+    """1チャンク分の入力行を計算し、入力列 + 結果列の DataFrame を返す"""
+    func = CALC_FUNCS[calculator]
+    out = []
+    for row in records:
+        try:
+            results = func(row, detail)
+            error = None
+        except Exception as e:
+            # 1行の不正値でバッチ全体を止めない
+            results = [{}]
+            error = f"{type(e).__name__}: {e}"
+        for result in results:
+            out.append({**row, **result, "error": error})
+
+    df = pd.DataFrame(out)
+    df["error"] = df["error"].astype("string")
+    return df
+
+
+# ==========================================
+# 3. 入出力 (メインプロセス側)
+# ==========================================
+def read_chunks(path, chunk_rows):
+    """CSV / Parquet を chunk_rows 行ずつ読み出す"""
+    if path.lower().endswith(".parquet"):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+def prepare_records(df, calculator, offset):
+    """入力列の検証と既定値の補完を行い、行番号付きの dict のリストにする"""
+    columns = CALCULATORS[calculator]
+    missing = [c for c, default in columns.items() if default is None and c not in df.columns]
+    if missing:
+        raise ValueError(f"入力に必要な列がありません: {', '.join(missing)}")
+
+    df = df.copy()
+    for c, default in columns.items():
+        if default is not None:
+            df[c] = df[c].fillna(default) if c in df.columns else default
+    df.insert(0, "row", range(offset, offset + len(df)))
+    return df[["row", *columns]].to_dict("records")
+
+
+def output_schema(calculator, detail):
+    """出力の列 (row, 入力列, 結果列, error) と型。どのチャンクでも同じ列を同じ順に書く"""
+    fields = [pa.field("row", pa.int64(), nullable=False)]
+    fields += [pa.field(c, pa.string() if c in STRING_INPUTS else pa.float64()) for c in CALCULATORS[calculator]]
+    fields += [pa.field(c, t) for c, t in RESULT_COLUMNS[(calculator, detail)].items()]
+    fields.append(pa.field("error", pa.string()))
+    return pa.schema(fields)
+
+
+class ResultWriter:
+    """結果を Parquet / CSV に追記していく (全件をメモリに溜めない)
+
+    列と型は最初に output_schema で決めておき、各チャンクをそれに合わせてから書く。
+    エラーの行だけのチャンクでも、結果列は空の値として同じ位置に入る。
+    """
+
+    def __init__(self, path, calculator, detail=False):
+        self.path = path
+        self.is_parquet = path.lower().endswith(".parquet")
+        self.schema = output_schema(calculator, detail)
+        # 入力列は読み込んだ値のまま書く。型をそろえるのは結果列と error だけ
+        self.dtypes = {c: PANDAS_DTYPES[t] for c, t in RESULT_COLUMNS[(calculator, detail)].items()}
+        self.dtypes["error"] = "string"
+        self.numeric_inputs = [c for c in CALCULATORS[calculator] if c not in STRING_INPUTS]
+        self.writer = None
+        self.rows = 0
+
+    def conform(self, df):
+        """列をスキーマの順にそろえ (無い列は空)、結果列と error を欠損を持てる型にする"""
+        return df.reindex(columns=self.schema.names).astype(self.dtypes)
+
+    def write(self, df):
+        df = self.conform(df)
+        if self.is_parquet:
+            # 数値にならない入力値 (その行は error に理由が入る) は Parquet では空にする
+            df[self.numeric_inputs] = df[self.numeric_inputs].apply(pd.to_numeric, errors="coerce")
+            table = pa.Table.from_pandas(df, preserve_index=False).cast(self.schema)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, self.schema)
+            self.writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode="w" if self.rows == 0 else "a", header=self.rows == 0, index=False)
+        self.rows += len(df)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def peak_rss_mb():
+    """ピークメモリ (MB)。(メインプロセス, ワーカーの最大値) を返す"""
+    try:
+        import resource
+    except ImportError:
+        # Windows: ワーカーの値は取れないのでメインプロセスのみ
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024, None
+
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return own, children
+
+
+# ==========================================
+# 4. メイン
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="計算機をまとめて実行し、結果を Parquet / CSV に書き出す")
+    parser.add_argument("calculator", choices=sorted(CALCULATORS), help="使う計算機")
+    parser.add_argument("input", help="入力ファイル (.csv / .parquet)")
+    parser.add_argument("-o", "--output", required=True, help="出力ファイル (.csv / .parquet)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="ワーカープロセス数")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="1チャンクあたりの行数")
+    parser.add_argument("--detail", action="store_true", help="NISAは全年、住宅ローンは全月の行を出力する")
+    args = parser.parse_args(argv)
+
+    print(f"🚀 Batch: {args.calculator} [{args.input}] -> [{args.output}] (workers={args.workers})")
+    start = time.perf_counter()
+    writer = ResultWriter(args.output, args.calculator, args.detail)
+    in_rows = 0
+    failed = 0
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            # 投入済みのチャンクを上限付きのキューで管理し、入力順に書き出す
+            pending = deque()
+            limit = max(1, args.workers * IN_FLIGHT_PER_WORKER)
+
+            def drain(until):
+                nonlocal failed
+                while len(pending) > until:
+                    df = pending.popleft().result()
+                    failed += int(df["error"].notna().sum())
+                    writer.write(df)
+
+            for chunk in read_chunks(args.input, args.chunk_rows):
+                records = prepare_records(chunk, args.calculator, in_rows)
+                in_rows += len(records)
+                pending.append(pool.submit(run_chunk, args.calculator, records, args.detail))
+                drain(limit)
+            drain(0)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    own_mb, worker_mb = peak_rss_mb()
+    print("-" * 40)
+    print(f"✅ 入力 {in_rows:,} 行 / 出力 {writer.rows:,} 行 (エラー {failed:,} 行)")
+    print(f"⏱️ {elapsed:.2f} 秒 ({in_rows / elapsed if elapsed else 0:,.0f} 行/秒)")
+    worker_text = f" / ワーカー最大 {worker_mb:.0f} MB" if worker_mb is not None else ""
+    print(f"🧠 ピークメモリ: メイン {own_mb:.0f} MB{worker_text}")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
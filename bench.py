@@ -0,0 +1,199 @@
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+# ==========================================
+# 1. 設定エリア
+# ==========================================
+HISTORY_FILE = "bench_history.json"
+
+# 前回より中央値 (またはピークメモリ) がこの倍率以上になったら回帰とみなす
+REGRESSION_RATIO = 1.25
+
+# ピークメモリはこれより小さい増加なら倍率が大きくても回帰にしない (数 KB のケースの揺れ)
+MEMORY_FLOOR_KB = 64
+
+# 1ケースあたりの最低計測時間 (秒) と最低回数
+MIN_SECONDS = 0.5
+MIN_REPEAT = 5
+
+
+# ==========================================
+# 2. ベンチマークケース
+# ==========================================
+def build_cases():
+    """(名前, 呼び出し) のリスト。キャッシュを通さないよう __wrapped__ を直接呼ぶ"""
+    import numpy as np
+
+    import bodymake_app
+    import mortgage_calc
+    import nisa_calc
+    import pfc_calc
+
+    growth = nisa_calc.calculate_asset_growth.__wrapped__
+    schedule = mortgage_calc.build_schedule.__wrapped__
+    pfc = pfc_calc.calculate_pfc.__wrapped__
+
+    grid = (
+        np.arange(1000, 300001, 1000),
+        np.arange(1, 51),
+        np.round(np.arange(1, 151) * 0.1, 1),
+    )
+    scenarios = {
+        "なし": (),
+        "期間短縮型": ((120, "期間短縮型", 300),),
+        "返済額軽減型": ((120, "返済額軽減型", 300),),
+        "金利上昇": ((60, "金利変更", 1.5), (120, "期間短縮型", 300)),
+    }
+
+    def compare():
+        # シナリオのキャッシュも毎回空にして、全区間を計算させる
+        mortgage_calc.scenario_prefix.cache_clear()
+        mortgage_calc.build_scenario_schedule.cache_clear()
+        mortgage_calc.compare_scenarios(3500, 0.525, 35, "元利均等返済", scenarios)
+
+    return [
+        # 積立NISA (初期値 / 最悪ケース: 50年・月30万円・15%)
+        # engine="live" は事前計算グリッドを使わない。.lookup はグリッド (nisa_grid.bin) があれば表を引く
+        ("nisa.growth.default", lambda: growth(30000, 20, 5.0, engine="live")),
+        ("nisa.growth.worst", lambda: growth(300000, 50, 15.0, engine="live")),
+        ("nisa.growth.worst.lookup", lambda: growth(300000, 50, 15.0)),
+        ("nisa.growth.worst.loop", lambda: growth(300000, 50, 15.0, engine="loop")),
+        ("nisa.batch.full_grid", lambda: nisa_calc.calculate_asset_growth_batch(*grid, output="array")),
+        ("nisa.montecarlo.10k", lambda: nisa_calc.simulate_asset_percentiles(300000, 50, 15.0, 20.0, n_paths=10000)),
+        # 住宅ローン (初期値 / 最悪ケース: 50年・ボーナス払いあり・元金均等)
+        ("mortgage.schedule.default", lambda: schedule(3500, 0.525, 35, "元利均等返済")),
+        ("mortgage.schedule.worst", lambda: schedule(50000, 20.0, 50, "元金均等返済", 25000)),
+        ("mortgage.run_calc.worst", lambda: mortgage_calc.run_calc(50000, 20.0, 50, "元金均等返済", 25000)),
+        ("mortgage.scenarios", compare),
+        # PFC (Katch-McArdle) / ボディメイク
+        ("pfc.default", lambda: pfc(65.0, 15.0, "1.375", "-500", 2.5, 20)),
+        ("bodymake.metrics", lambda: bodymake_app.calculate_body_metrics(170.0, 65.0, 15.0)),
+        # 円グラフ: 描き直し (Figure を使い回して扇形だけ更新) / 同じ区間の値 (キャッシュ済みの PNG)
+        ("bodymake.pie.render", lambda: bodymake_app.render_pie_png.__wrapped__(55.3, 9.7)),
+        ("bodymake.pie.cached", lambda: bodymake_app.render_pie_png(55.3, 9.7)),
+        # Vega-Lite 版 (既定): グラフの組み立て + 仕様 (JSON) の書き出し
+        ("bodymake.pie.altair", lambda: bodymake_app.body_pie_chart.__wrapped__(55.3, 9.7).to_dict()),
+    ]
+
+
+# ==========================================
+# 3. 計測
+# ==========================================
+def measure(func):
+    """中央値・最小値 (ms) と1回あたりのピークメモリ (KB) を測る"""
+    func()  # ウォームアップ
+
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples = []
+    start = time.perf_counter()
+    while len(samples) < MIN_REPEAT or time.perf_counter() - start < MIN_SECONDS:
+        t = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - t)
+
+    return {
+        "median_ms": statistics.median(samples) * 1000,
+        "min_ms": min(samples) * 1000,
+        "runs": len(samples),
+        "peak_kb": peak / 1024,
+    }
+
+
+def compare_result(r, old):
+    """前回の記録 old と比べた (表示, 回帰したか)。時間とピークメモリの両方を見る"""
+    ratio = r["median_ms"] / old["median_ms"]
+    regressed = ratio >= REGRESSION_RATIO
+    if regressed:
+        mark = f"🐢 x{ratio:.2f} (REGRESSION)"
+    elif ratio <= 1 / REGRESSION_RATIO:
+        mark = f"🚀 x{ratio:.2f}"
+    else:
+        mark = f"x{ratio:.2f}"
+
+    old_kb = old.get("peak_kb")
+    grown = r["peak_kb"] - old_kb if old_kb is not None else 0
+    if grown >= MEMORY_FLOOR_KB and r["peak_kb"] >= old_kb * REGRESSION_RATIO:
+        mark += f"  🐘 +{grown:.0f} KB (MEMORY REGRESSION)"
+        regressed = True
+    return mark, regressed
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_history(path, history):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+
+
+# ==========================================
+# 4. メイン
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="計算エンジンのベンチマーク")
+    parser.add_argument("-k", "--filter", default="", help="名前にこの文字列を含むケースだけ実行する")
+    parser.add_argument("--history", default=HISTORY_FILE, help="履歴ファイル (JSON)")
+    parser.add_argument("--no-save", action="store_true", help="履歴に記録しない")
+    parser.add_argument("--fail-on-regression", action="store_true", help="回帰があれば終了コード1で終わる")
+    args = parser.parse_args(argv)
+
+    history = load_history(args.history)
+    # ケースごとに直近の記録と比べる (-k で一部だけ実行した回があってもよい)
+    previous = {}
+    for run in history:
+        previous.update(run["results"])
+    results = {}
+    regressions = []
+
+    print(f"🏁 Benchmark ({platform.python_implementation()} {platform.python_version()})")
+    print("-" * 72)
+    for name, func in build_cases():
+        if args.filter not in name:
+            continue
+        r = measure(func)
+        results[name] = r
+
+        mark = ""
+        if name in previous:
+            mark, regressed = compare_result(r, previous[name])
+            if regressed:
+                regressions.append(name)
+        print(f"{name:<28} {r['median_ms']:>10.3f} ms  {r['peak_kb']:>10.1f} KB  {mark}")
+
+    print("-" * 72)
+    if not args.no_save:
+        history.append({
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results,
+        })
+        save_history(args.history, history)
+        print(f"📝 {args.history} に記録しました ({len(history)} 回目)")
+
+    if regressions:
+        print(f"⚠️ 回帰: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
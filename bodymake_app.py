@@ -3,12 +3,149 @@ import marimo
 __generated_with = "0.18.4"
 app = marimo.App()
 
+with app.setup:
+    import functools
+    import io
+    import math
+
+    import altair as alt
+
+    # 円グラフの描き方: "altair" (Vega-Lite。ブラウザ側で描く) / "matplotlib" (PNG。書き出し用)
+    # matplotlib は重い (日本語フォント込み) ので、使うときだけ読み込む
+    PIE_BACKEND = "altair"
+
+    # 円グラフのキャッシュ (LRU) の上限件数
+    PIE_CACHE_SIZE = 256
+
+    # 円グラフをキャッシュする単位 (kg)。除脂肪体重と体脂肪量をこの単位に丸める
+    PIE_BUCKET_KG = 0.1
+
+    PIE_LABELS = ('除脂肪体重 (LBM)', '体脂肪量')
+    PIE_COLORS = ('#4CAF50', '#FF5722')  # Green, Deep Orange
+
+
 @app.cell
 def _():
     import marimo as mo
-    import matplotlib.pyplot as plt
-    import japanize_matplotlib
-    return mo, plt, japanize_matplotlib
+    return (mo,)
+
+
+@app.function
+def calculate_body_metrics(h_cm: float, w: float, f_rate: float) -> dict:
+    # 基本計算
+    h_m = h_cm / 100.0
+    bmi = w / (h_m * h_m)
+    fat_mass = w * (f_rate / 100)       # 体脂肪量
+    lbm = w - fat_mass                  # 除脂肪体重 (Lean Body Mass)
+    ffmi = lbm / (h_m * h_m)            # 除脂肪体重指数
+
+    # BMI 判定
+    if bmi < 18.5:
+        bmi_comment = "低体重 (痩せ型)"
+    elif bmi < 25.0:
+        bmi_comment = "普通体重"
+    elif bmi < 30.0:
+        bmi_comment = "肥満 (1度)"
+    else:
+        bmi_comment = "肥満 (2度以上)"
+
+    # FFMI 判定
+    if ffmi < 18.5:
+        ffmi_comment = "標準 (痩せ型〜普通)"
+    elif ffmi < 20.0:
+        ffmi_comment = "標準 (ガッチリ)"
+    elif ffmi < 22.0:
+        ffmi_comment = "アスリート級"
+    else:
+        ffmi_comment = "ボディビルダー級"
+
+    return {
+        "bmi": bmi, "bmi_comment": bmi_comment,
+        "fat_mass": fat_mass, "lbm": lbm,
+        "ffmi": ffmi, "ffmi_comment": ffmi_comment,
+    }
+
+
+@app.function
+@functools.lru_cache(maxsize=1)
+def pie_canvas():
+    # 円グラフの Figure を1枚だけ作り、以後は扇形とラベルの位置だけ書き換えて使い回す
+    # pyplot を通さないので、スライダーを動かしても図の管理表 (plt.get_fignums) に溜まらない
+    import japanize_matplotlib  # noqa: F401  (日本語フォントの登録)
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(5, 5))
+    ax = fig.add_subplot()
+    wedges, labels, pcts = ax.pie(
+        [1, 1],
+        labels=PIE_LABELS,
+        colors=PIE_COLORS,
+        autopct='%1.1f%%',
+        startangle=90,
+        counterclock=False,
+        wedgeprops={'edgecolor': 'white'}
+    )
+    return fig, wedges, labels, pcts
+
+
+@app.function
+def update_pie(values):
+    # ax.pie と同じ配置 (90度から時計回り、ラベルは半径1.1、割合は0.6) で扇形を書き換える
+    fig, wedges, labels, pcts = pie_canvas()
+    total = sum(values)
+    theta = 90.0
+    for wedge, label, pct, value in zip(wedges, labels, pcts, values):
+        end = theta - 360.0 * value / total
+        wedge.set_theta1(end)
+        wedge.set_theta2(theta)
+        mid = math.radians((theta + end) / 2)
+        x, y = math.cos(mid), math.sin(mid)
+        label.set_position((1.1 * x, 1.1 * y))
+        label.set_horizontalalignment('left' if x > 0 else 'right')
+        pct.set_position((0.6 * x, 0.6 * y))
+        pct.set_text(f"{100.0 * value / total:.1f}%")
+        theta = end
+    return fig
+
+
+@app.function
+def pie_bucket(kg: float) -> float:
+    return round(round(kg / PIE_BUCKET_KG) * PIE_BUCKET_KG, 6)
+
+
+@app.function
+@functools.lru_cache(maxsize=PIE_CACHE_SIZE)
+def body_pie_chart(lbm_kg: float, fat_mass_kg: float):
+    # 円グラフ (Vega-Lite)。matplotlib 版と同じ色・並びで、12時の位置から時計回り
+    total = lbm_kg + fat_mass_kg
+    records = [
+        {"Part": label, "kg": kg, "Pct": f"{100.0 * kg / total:.1f}%", "Order": i}
+        for i, (label, kg) in enumerate(zip(PIE_LABELS, (lbm_kg, fat_mass_kg)))
+    ]
+    base = alt.Chart(alt.Data(values=records)).encode(
+        theta=alt.Theta("kg:Q", stack=True),
+        order=alt.Order("Order:Q"),
+    )
+    pie = base.mark_arc(outerRadius=120, stroke="white").encode(
+        color=alt.Color(
+            "Part:N",
+            scale=alt.Scale(domain=list(PIE_LABELS), range=list(PIE_COLORS)),
+            legend=alt.Legend(title=None, orient="bottom")
+        ),
+        tooltip=[alt.Tooltip("Part:N", title="内訳"), alt.Tooltip("kg:Q", format=".1f", title="kg"), alt.Tooltip("Pct:N", title="割合")]
+    )
+    text = base.mark_text(radius=72, fontSize=14, fontWeight="bold", color="white").encode(text="Pct:N")
+    return (pie + text).properties(width=280, height=280)
+
+
+@app.function
+@functools.lru_cache(maxsize=PIE_CACHE_SIZE)
+def render_pie_png(lbm_kg: float, fat_mass_kg: float) -> bytes:
+    # (除脂肪体重, 体脂肪量) の組ごとに1回だけ描いて PNG にする (呼び出し側で pie_bucket に丸める)
+    buf = io.BytesIO()
+    update_pie((lbm_kg, fat_mass_kg)).savefig(buf, format="png")
+    return buf.getvalue()
+
 
 @app.cell
 def _(mo):
@@ -41,58 +178,30 @@ def _(mo):
 
 
 @app.cell
-def _(fat_slider, height_slider, mo, plt, weight_slider):
+def _(fat_slider, height_slider, mo, weight_slider):
     # 値の取得
     h_cm = height_slider.value
     w = weight_slider.value
     f_rate = fat_slider.value
 
-    # 基本計算
-    h_m = h_cm / 100.0
-    bmi = w / (h_m * h_m)
-    fat_mass = w * (f_rate / 100)       # 体脂肪量
-    lbm = w - fat_mass                  # 除脂肪体重 (Lean Body Mass)
-    ffmi = lbm / (h_m * h_m)            # 除脂肪体重指数
-
-    # BMI 判定
-    if bmi < 18.5:
-        bmi_comment = "低体重 (痩せ型)"
-    elif bmi < 25.0:
-        bmi_comment = "普通体重"
-    elif bmi < 30.0:
-        bmi_comment = "肥満 (1度)"
-    else:
-        bmi_comment = "肥満 (2度以上)"
+    metrics = calculate_body_metrics(h_cm, w, f_rate)
+    bmi, bmi_comment = metrics["bmi"], metrics["bmi_comment"]
+    fat_mass, lbm = metrics["fat_mass"], metrics["lbm"]
+    ffmi, ffmi_comment = metrics["ffmi"], metrics["ffmi_comment"]
 
-    # FFMI 判定
-    if ffmi < 18.5:
-        ffmi_comment = "標準 (痩せ型〜普通)"
-    elif ffmi < 20.0:
-        ffmi_comment = "標準 (ガッチリ)"
-    elif ffmi < 22.0:
-        ffmi_comment = "アスリート級"
+    # 円グラフ (同じ区間の値なら作り直さず、キャッシュしたものを使う)
+    # 体重と BMI はグラフの中ではなく見出しに出す (キャッシュのキーを (LBM, 体脂肪量) だけにするため)
+    if PIE_BACKEND == "matplotlib":
+        pie_view = mo.image(
+            render_pie_png(pie_bucket(lbm), pie_bucket(fat_mass)), alt="除脂肪体重と体脂肪量の円グラフ"
+        )
     else:
-        ffmi_comment = "ボディビルダー級"
-
-    # 円グラフの作成
-    plt.figure(figsize=(5, 5))
-    colors = ['#4CAF50', '#FF5722'] # Green, Deep Orange
-    labels = ['除脂肪体重 (LBM)', '体脂肪量']
-
-    plt.pie(
-        [lbm, fat_mass], 
-        labels=labels, 
-        colors=colors, 
-        autopct='%1.1f%%', 
-        startangle=90,
-        counterclock=False,
-        wedgeprops={'edgecolor': 'white'}
-    )
-    plt.title(f"体重 {w}kg (BMI: {bmi:.1f})")
+        pie_view = mo.ui.altair_chart(body_pie_chart(pie_bucket(lbm), pie_bucket(fat_mass)), chart_selection=False)
 
     # 結果の表示
     mo.vstack([
-        plt.gca(),
+        mo.md(f"**体重 {w}kg (BMI: {bmi:.1f})**"),
+        pie_view,
         mo.md(
             f"""
             ### 📊 診断結果
@@ -1,46 +1,267 @@
+import argparse
+import hashlib
+import json
 import os
+import shutil
 import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-# 設定
-SOURCE_PY = "nisa_calc_v0.19.0.py"
-OUTPUT_HTML = "index.html"
+from asset_store import (
+    ASSETS_DIR,
+    build_asset_manifest,
+    load_asset_manifest,
+    missing_pages,
+    print_report,
+    prune_assets,
+    save_asset_manifest,
+    sync_assets,
+    unresolved_pages,
+)
+from postprocess import postprocess_page
+from precompress import precompress_site, print_wire_report
+from prerender import prerender_page
+from service_worker import generate_service_worker, inject_registration, print_sw_report
 
-print(f"🚀 Starting Build Factory for {SOURCE_PY}...")
+# ==========================================
+# 1. 設定エリア
+# ==========================================
+# ノートブック -> 出力ページの対応表
+MANIFEST_FILE = "build_manifest.json"
 
-# 1. クリーンアップ (古いファイルを削除)
-if os.path.exists(OUTPUT_HTML):
-    os.remove(OUTPUT_HTML)
-    print("🧹 Cleaned old HTML.")
+# 前回ビルド時のソースハッシュ (差分ビルド用、コミットしない)
+STATE_FILE = ".build_state.json"
 
-# 2. marimo export コマンドの実行
-print("🔨 Building raw HTML...")
-try:
-    subprocess.run(
-        ["marimo", "export", "html-wasm", SOURCE_PY, "-o", OUTPUT_HTML, "--mode", "run"],
-        check=True,
-        shell=True
+# ビルド手順 (後処理など) を変えたら上げる。全ページが再ビルドされる
+BUILD_VERSION = 6
+
+# エクスポート先から取り込まない marimo 同梱ファイル
+STATIC_SKIP = {"CLAUDE.md"}
+
+
+# ==========================================
+# 2. マニフェストと差分判定
+# ==========================================
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def marimo_version():
+    import marimo
+
+    return marimo.__version__
+
+
+def page_hash(page, version):
+    """ソース本体 + ページ設定 + marimo / ビルド手順のバージョンのハッシュ (どれかが変われば再ビルド)"""
+    h = hashlib.sha256()
+    with open(page["source"], "rb") as f:
+        h.update(f.read())
+    h.update(json.dumps(page, sort_keys=True).encode("utf-8"))
+    h.update(f"{version}/{BUILD_VERSION}".encode("utf-8"))
+    return h.hexdigest()
+
+
+# ==========================================
+# 3. ビルド (ワーカープロセス側)
+# ==========================================
+def export_page(page, version):
+    """1ページ分を一時ディレクトリにエクスポートし、(一時ディレクトリ, 計測結果) を返す
+
+    marimo は出力先に assets/ をコピーするので、並列実行時に同じディレクトリを取り合わないよう
+    ページごとに別の場所へ書き出し、取り込みはメインプロセスでまとめて行う。
+    """
+    workdir = tempfile.mkdtemp(prefix="build_")
+    out_html = os.path.join(workdir, os.path.basename(page["output"]))
+
+    t = time.perf_counter()
+    # shell を経由せず、今の Python 環境の marimo を呼ぶ (Windows / Linux 共通)
+    proc = subprocess.run(
+        [sys.executable, "-m", "marimo", "export", "html-wasm", page["source"], "-o", out_html, "--mode", "run"],
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
     )
-except subprocess.CalledProcessError:
-    print("❌ Error: Build failed.")
-    exit(1)
-
-# 3. 要件定義の注入 (Pythonによる精密外科手術)
-print("💉 Injecting requirements...")
-with open(OUTPUT_HTML, "r", encoding="utf-8") as f:
-    content = f.read()
-
-# 置換ターゲット（v0.19.0のデフォルト出力に基づく）
-target_str = '"filename": "notebook.py",'
-# 注入する文字列（JSON構文を絶対に壊さない形式）
-inject_str = '"requirements": ["marimo==0.19.0", "pandas", "altair"], "filename": "notebook.py",'
-
-if target_str in content:
-    new_content = content.replace(target_str, inject_str)
-    
-    with open(OUTPUT_HTML, "w", encoding="utf-8") as f:
-        f.write(new_content)
-    print("✅ SUCCESS: Requirements injected correctly!")
-else:
-    print("⚠️ WARNING: Target string not found. Check the raw HTML.")
-
-print("🎉 Process Complete.")
\ No newline at end of file
+    export_sec = time.perf_counter() - t
+    if proc.returncode != 0:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise RuntimeError(proc.stderr.strip() or proc.stdout.strip() or f"exit code {proc.returncode}")
+
+    # 要件定義の注入 (マウント設定を解析して書き換え、反映されなければビルド失敗)
+    # 続けて、既定の入力値での出力を最初の表示として埋め込む (スナップショットが古ければ実行し直す)
+    # 最後に Service Worker の登録スクリプトを入れる (2回目以降の訪問をオフラインで起動するため)
+    t = time.perf_counter()
+    try:
+        requirements = postprocess_page(out_html, page, version)
+        post_sec = time.perf_counter() - t
+        t = time.perf_counter()
+        first_paint = prerender_page(out_html, page, version)
+        inject_registration(out_html)
+    except Exception:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+    render_sec = time.perf_counter() - t
+
+    return workdir, {
+        "export_sec": export_sec,
+        "post_sec": post_sec,
+        "render_sec": render_sec,
+        "requirements": requirements,
+        **first_paint,
+    }
+
+
+# ==========================================
+# 4. 取り込み (メインプロセス側)
+# ==========================================
+def merge_export(workdir, page):
+    """一時ディレクトリの HTML を出力先へ置き換え、assets/ をアセットストアに取り込む
+
+    (コピーしたチャンク数, 内容が食い違ったチャンク) を返す。
+    """
+    html_name = os.path.basename(page["output"])
+    copied, conflicts = sync_assets(os.path.join(workdir, ASSETS_DIR))
+
+    # favicon などの公開ファイルは無いものだけコピーする
+    for name in os.listdir(workdir):
+        src = os.path.join(workdir, name)
+        if name == html_name or name in STATIC_SKIP or not os.path.isfile(src):
+            continue
+        if not os.path.exists(name):
+            shutil.copy2(src, name)
+
+    # 書きかけの HTML が見えないよう、最後に置き換える
+    tmp_output = page["output"] + ".tmp"
+    shutil.move(os.path.join(workdir, html_name), tmp_output)
+    os.replace(tmp_output, page["output"])
+    shutil.rmtree(workdir, ignore_errors=True)
+    return copied, conflicts
+
+
+# ==========================================
+# 5. メイン
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="マニフェストに載っている marimo ノートブックを html-wasm にビルドする")
+    parser.add_argument("pages", nargs="*", help="ビルドするページ (出力名かソース名。省略時は全ページ)")
+    parser.add_argument("--manifest", default=MANIFEST_FILE)
+    parser.add_argument("--force", action="store_true", help="変更が無くても再エクスポートする")
+    parser.add_argument("--no-prune", action="store_true", help="参照されていないチャンクを assets/ に残す")
+    parser.add_argument("--no-compress", action="store_true", help=".br / .gz の事前圧縮をしない")
+    parser.add_argument("--startup", action="store_true", help="ヘッドレス Chrome で各ページの起動時間 (と Service Worker での再訪問) を測る")
+    parser.add_argument("--no-sw", action="store_true", help="Service Worker (sw.js) を生成しない")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="同時に走らせるエクスポート数")
+    args = parser.parse_args(argv)
+
+    pages = load_json(args.manifest, {"pages": []})["pages"]
+    if args.pages:
+        pages = [p for p in pages if p["output"] in args.pages or p["source"] in args.pages]
+        if not pages:
+            print(f"❌ Error: {', '.join(args.pages)} はマニフェストにありません。")
+            return 1
+
+    print(f"🚀 Starting Build Factory for {len(pages)} page(s)...")
+    start = time.perf_counter()
+    version = marimo_version()
+    state = load_json(STATE_FILE, {})
+    summary = {}
+
+    # 1. 差分判定 (ソースが変わったページ / 出力が無いページだけビルド)
+    todo = []
+    for page in pages:
+        digest = page_hash(page, version)
+        if not args.force and state.get(page["output"]) == digest and os.path.exists(page["output"]):
+            summary[page["output"]] = {"status": "skip"}
+        else:
+            todo.append((page, digest))
+    print(f"🔍 {len(todo)} to build, {len(pages) - len(todo)} up to date.")
+
+    # 2. エクスポートを並列実行し、終わったものから取り込む
+    if todo:
+        with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(todo)))) as pool:
+            futures = {pool.submit(export_page, page, version): (page, digest) for page, digest in todo}
+            for future in as_completed(futures):
+                page, digest = futures[future]
+                try:
+                    workdir, timing = future.result()
+                except Exception as e:
+                    summary[page["output"]] = {"status": "fail", "error": str(e)}
+                    print(f"❌ {page['output']}: build failed.\n{e}")
+                    continue
+
+                copied, conflicts = merge_export(workdir, page)
+                for name in conflicts:
+                    print(f"⚠️ WARNING: {name} has the same name but different content. Overwritten.")
+                state[page["output"]] = digest
+                summary[page["output"]] = {"status": "built", "copied": copied, **timing}
+                print(
+                    f"✅ {page['output']} ({timing['export_sec']:.1f}s) requirements={timing['requirements']} "
+                    f"first paint={timing['first_paint']}"
+                )
+
+        with open(STATE_FILE, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+
+    # 3. ページごとの所要時間
+    elapsed = time.perf_counter() - start
+    print("-" * 72)
+    print(f"{'page':<16} {'source':<24} {'status':<6} {'export':>8} {'post':>8} {'render':>8} {'size':>10}")
+    for page in pages:
+        s = summary[page["output"]]
+        size = f"{os.path.getsize(page['output']) / 1024:,.0f} KB" if os.path.exists(page["output"]) else "-"
+        export_sec, post_sec, render_sec = (f"{s[k]:.2f}s" if k in s else "-" for k in ("export_sec", "post_sec", "render_sec"))
+        print(
+            f"{page['output']:<16} {page['source']:<24} {s['status']:<6} {export_sec:>8} {post_sec:>8} {render_sec:>8} {size:>10}"
+        )
+    print("-" * 72)
+    busy = sum(s.get("export_sec", 0) + s.get("post_sec", 0) + s.get("render_sec", 0) for s in summary.values())
+    print(f"⏱️ {elapsed:.2f}s wall / {busy:.2f}s total build time")
+
+    # 4. アセットストアのマニフェスト (ページごとの参照チャンクと転送量)
+    previous = load_asset_manifest()
+    all_pages = load_json(args.manifest, {"pages": []})["pages"]
+    asset_manifest = build_asset_manifest(all_pages, previous)
+    pruned = None if args.no_prune else prune_assets(asset_manifest)
+    print_report(asset_manifest, previous, pruned)
+    save_asset_manifest(asset_manifest)
+    # ノートブックに書かれた画像パスなど、チャンク以外の参照先が無いのは警告だけ (ビルドは失敗させない)
+    for output, names in unresolved_pages(asset_manifest).items():
+        print(f"⚠️ WARNING: {output} mentions {len(names)} assets/ path(s) that do not exist (e.g. {names[0]}).")
+
+    # 5. Service Worker (事前キャッシュの一覧とキャッシュのバージョンはアセットマニフェストから決める)
+    if not args.no_sw:
+        print_sw_report(generate_service_worker(all_pages, asset_manifest, version))
+
+    # 6. 事前圧縮 (.br / .gz) と転送量の比較
+    if not args.no_compress:
+        done, skipped, compress_sec = precompress_site(asset_manifest, args.workers)
+        print(f"🗜️ Compressed {done} files, {skipped} unchanged ({compress_sec:.1f}s)")
+        print_wire_report(asset_manifest)
+
+    # 7. 起動時間 (最初の出力まで) の計測
+    if args.startup:
+        from startup_bench import run_startup_bench
+
+        run_startup_bench([p for p in all_pages if os.path.exists(p["output"])], offline=not args.no_sw)
+
+    failed = [name for name, s in summary.items() if s["status"] == "fail"]
+    if failed:
+        print(f"❌ Error: Build failed: {', '.join(failed)}")
+        return 1
+    broken = missing_pages(asset_manifest)
+    if broken:
+        for output, names in broken.items():
+            print(f"❌ Error: {output} references {len(names)} missing chunks (e.g. {names[0]}).")
+        return 1
+    print("🎉 Process Complete.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+import argparse
+import ast
+import difflib
+import re
+import sys
+
+# ==========================================
+# 1. 設定エリア
+# ==========================================
+# セル単位の置き換えの書式 (モデルへの指示と解析で共通)
+CELL_BEGIN = "### CELL {index}"
+CELL_END = "### END"
+CELL_DELETE = "### DELETE {index}"
+CELL_HEADER = re.compile(r"^### CELL (\d+|new)\s*$")
+DELETE_HEADER = re.compile(r"^### DELETE (\d+)\s*$")
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+# ブロックとして扱う @app.xxx デコレーター
+BLOCK_DECORATORS = {"cell": "cell", "function": "function", "class_definition": "class"}
+
+# 新しいセルを入れる位置の目印 (この行の前に追加する)
+MAIN_GUARD = 'if __name__ == "__main__":'
+
+# プレビューで表示する差分の最大行数
+PREVIEW_LINES = 60
+
+
+# ==========================================
+# 2. ノートブックのブロック分割
+# ==========================================
+def block_kind(node):
+    """トップレベルの文が @app.cell / @app.function / with app.setup なら種類を返す"""
+    if isinstance(node, ast.With):
+        for item in node.items:
+            expr = item.context_expr
+            target = expr.func if isinstance(expr, ast.Call) else expr
+            if isinstance(target, ast.Attribute) and target.attr == "setup":
+                return "setup"
+        return None
+    if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return None
+    for deco in node.decorator_list:
+        target = deco.func if isinstance(deco, ast.Call) else deco
+        if isinstance(target, ast.Attribute) and target.attr in BLOCK_DECORATORS:
+            return BLOCK_DECORATORS[target.attr]
+    return None
+
+
+def returned_names(node):
+    """セル末尾の return で公開している名前"""
+    if not node.body or not isinstance(node.body[-1], ast.Return) or node.body[-1].value is None:
+        return []
+    value = node.body[-1].value
+    items = value.elts if isinstance(value, ast.Tuple) else [value]
+    return [item.id for item in items if isinstance(item, ast.Name)]
+
+
+def bound_names(statements):
+    """代入・import・def で束縛されるトップレベルの名前 (setup ブロック用)"""
+    names = []
+    for stmt in statements:
+        if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+            names += [(a.asname or a.name).split(".")[0] for a in stmt.names]
+        elif isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.append(stmt.name)
+        elif isinstance(stmt, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+            targets = stmt.targets if isinstance(stmt, ast.Assign) else [stmt.target]
+            for target in targets:
+                names += [n.id for n in ast.walk(target) if isinstance(n, ast.Name)]
+    return names
+
+
+def notebook_blocks(code):
+    """ノートブックを上から順にブロック (セル・関数・setup) に分ける。構文エラーは SyntaxError
+
+    各ブロック: {"index", "kind", "name", "start", "end" (1始まりの行番号, 両端を含む),
+                 "args" (参照する名前), "defines" (公開する名前)}
+    """
+    tree = ast.parse(code)
+    blocks = []
+    for node in tree.body:
+        kind = block_kind(node)
+        if kind is None:
+            continue
+        start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        block = {"index": len(blocks), "kind": kind, "start": start, "end": node.end_lineno}
+        if kind == "setup":
+            block.update(name="setup", args=[], defines=bound_names(node.body))
+        elif kind == "cell":
+            args = [a.arg for a in node.args.posonlyargs + node.args.args + node.args.kwonlyargs]
+            block.update(name=node.name, args=args, defines=returned_names(node))
+        else:
+            block.update(name=node.name, args=[], defines=[node.name])
+        blocks.append(block)
+    return blocks
+
+
+def block_source(lines, block):
+    return "\n".join(lines[block["start"] - 1:block["end"]])
+
+
+def cell_outline(blocks):
+    """全ブロックの一覧 (番号・種類・参照と公開する名前だけ。コードは含めない)"""
+    out = []
+    for b in blocks:
+        detail = f"({', '.join(b['args'])}) -> {', '.join(b['defines']) or '-'}" if b["kind"] == "cell" else b["name"]
+        out.append(f"{b['index']}: {b['kind']} {detail}")
+    return "\n".join(out)
+
+
+def render_cells(code, indices=None):
+    """指定したブロック (省略時は全部) を CELL の書式で並べる"""
+    lines = code.split("\n")
+    out = []
+    for b in notebook_blocks(code):
+        if indices is None or b["index"] in indices:
+            out += [CELL_BEGIN.format(index=b["index"]), block_source(lines, b), CELL_END]
+    return "\n".join(out)
+
+
+# ==========================================
+# 3. パッチの解析と適用
+# ==========================================
+def strip_fences(text):
+    """```python / ```diff などのコードブロックの行を取り除く"""
+    return "\n".join(line for line in text.strip("\n").split("\n") if not line.startswith("```"))
+
+
+def parse_cell_patch(text):
+    """CELL 書式の応答を {"replace": {番号: コード}, "new": [コード], "delete": {番号}} にする"""
+    patch = {"replace": {}, "new": [], "delete": set()}
+    current, body = None, []
+    for line in text.split("\n"):
+        if current is None:
+            header = CELL_HEADER.match(line)
+            delete = DELETE_HEADER.match(line)
+            if header:
+                current, body = header.group(1), []
+            elif delete:
+                patch["delete"].add(int(delete.group(1)))
+            elif line.strip():
+                raise ValueError(f"CELL ブロックの外に余分な行があります: {line[:60]!r}")
+            continue
+        if line.strip() == CELL_END:
+            cell = "\n".join(body).strip("\n")
+            if current == "new":
+                patch["new"].append(cell)
+            else:
+                patch["replace"][int(current)] = cell
+            current = None
+        else:
+            body.append(line)
+    if current is not None:
+        raise ValueError(f"CELL {current} が {CELL_END} で閉じていません")
+    if not (patch["replace"] or patch["new"] or patch["delete"]):
+        raise ValueError("変更するセルがありません")
+    return patch
+
+
+def apply_cell_patch(code, patch):
+    """セル単位の置き換え・追加・削除を適用した新しいコードを返す"""
+    blocks = notebook_blocks(code)
+    lines = code.split("\n")
+    for index in set(patch["replace"]) | patch["delete"]:
+        if not 0 <= index < len(blocks):
+            raise ValueError(f"CELL {index} はありません (0〜{len(blocks) - 1})")
+    for index, cell in patch["replace"].items():
+        try:
+            kinds = [block_kind(node) for node in ast.parse(cell).body]
+        except SyntaxError as e:
+            raise ValueError(f"CELL {index}: SyntaxError: {e.msg} (line {e.lineno})") from None
+        if kinds.count(None) or len(kinds) != 1:
+            raise ValueError(f"CELL {index}: 1つの @app.cell / @app.function だけを書いてください")
+
+    # 後ろのブロックから置き換えれば、前のブロックの行番号はずれない
+    for b in reversed(blocks):
+        if b["index"] in patch["delete"]:
+            end = b["end"]
+            while end < len(lines) and not lines[end].strip():
+                end += 1
+            lines[b["start"] - 1:end] = []
+        elif b["index"] in patch["replace"]:
+            lines[b["start"] - 1:b["end"]] = patch["replace"][b["index"]].split("\n")
+
+    if patch["new"]:
+        guard = next((i for i, line in enumerate(lines) if line.startswith(MAIN_GUARD)), len(lines))
+        added = []
+        for cell in patch["new"]:
+            added += cell.split("\n") + ["", ""]
+        lines[guard:guard] = added
+    return "\n".join(lines)
+
+
+def apply_unified_diff(code, diff):
+    """unified diff を適用する。行番号がずれていても、前後の行が一致する場所を探して当てる"""
+    lines = code.split("\n")
+    hunks = []
+    for line in diff.split("\n"):
+        if line.startswith("--- ") or line.startswith("+++ ") or line.startswith("\\"):
+            continue
+        header = HUNK_HEADER.match(line)
+        if header:
+            hunks.append({"start": int(header.group(1)), "old": [], "new": []})
+        elif hunks and line[:1] in (" ", "-", "+", ""):
+            tag, text = (line[:1] or " "), line[1:]
+            if tag != "+":
+                hunks[-1]["old"].append(text)
+            if tag != "-":
+                hunks[-1]["new"].append(text)
+    if not hunks:
+        raise ValueError("diff に @@ の行がありません")
+
+    offset = 0
+    for n, hunk in enumerate(hunks, start=1):
+        old = hunk["old"]
+        # 末尾の空のコンテキスト行 (応答の改行) は一致の判定に使わない
+        while old and old[-1] == "" and hunk["new"] and hunk["new"][-1] == "":
+            old, hunk["new"] = old[:-1], hunk["new"][:-1]
+        hint = max(0, hunk["start"] - 1 + offset)
+        candidates = [i for i in range(len(lines) - len(old) + 1) if lines[i:i + len(old)] == old]
+        if not candidates:
+            raise ValueError(f"diff の {n} 番目の hunk が現在のコードと一致しません")
+        pos = min(candidates, key=lambda i: abs(i - hint))
+        lines[pos:pos + len(old)] = hunk["new"]
+        offset += len(hunk["new"]) - len(old)
+    return "\n".join(lines)
+
+
+def apply_patch_text(code, text):
+    """モデルの応答 (unified diff か CELL 書式) を適用した新しいコードを返す。失敗は ValueError"""
+    text = strip_fences(text)
+    if any(HUNK_HEADER.match(line) for line in text.split("\n")):
+        return apply_unified_diff(code, text)
+    return apply_cell_patch(code, parse_cell_patch(text))
+
+
+# ==========================================
+# 4. 検証
+# ==========================================
+def check_notebook(code):
+    """パッチ適用後のノートブックの問題点のリスト (空なら OK)
+
+    構文エラーのほか、セルの引数 (他のセルから受け取る名前) がどこからも公開されていないもの、
+    同じ名前を2つ以上のセルが公開しているもの (marimo では実行できない) を調べる。
+    """
+    try:
+        blocks = notebook_blocks(code)
+    except SyntaxError as e:
+        return [f"SyntaxError: {e.msg} (line {e.lineno})"]
+
+    providers = {}
+    for b in blocks:
+        for name in b["defines"]:
+            providers.setdefault(name, []).append(b["index"])
+
+    problems = []
+    for name, where in providers.items():
+        if len(where) > 1:
+            problems.append(f"{name} が複数のセルで定義されています (CELL {', '.join(map(str, where))})")
+    for b in blocks:
+        for name in b["args"]:
+            if name not in providers:
+                problems.append(f"CELL {b['index']} が参照する {name} を返すセルがありません")
+    return problems
+
+
+def changed_cells(old_code, new_code):
+    """新しいコードのブロックのうち、前のコードに同じ中身のものが無いものの番号"""
+    old_lines = old_code.split("\n")
+    before = {block_source(old_lines, b) for b in notebook_blocks(old_code)}
+    new_lines = new_code.split("\n")
+    return [b["index"] for b in notebook_blocks(new_code) if block_source(new_lines, b) not in before]
+
+
+def diff_preview(old_code, new_code, path, limit=PREVIEW_LINES):
+    """変更点の unified diff (長ければ先頭だけ)"""
+    diff = list(difflib.unified_diff(
+        old_code.split("\n"), new_code.split("\n"), f"a/{path}", f"b/{path}", lineterm=""
+    ))
+    if len(diff) > limit:
+        diff = diff[:limit] + [f"... ({len(diff) - limit} more lines)"]
+    return "\n".join(diff)
+
+
+# ==========================================
+# 5. メイン
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ノートブックにパッチ (unified diff か CELL 書式) を当てて検証する")
+    parser.add_argument("notebook")
+    parser.add_argument("patch", nargs="?", help="パッチのファイル (省略時はセル一覧と検証結果だけ表示)")
+    parser.add_argument("--write", action="store_true", help="検証を通ったら上書きする")
+    args = parser.parse_args(argv)
+
+    with open(args.notebook, "r", encoding="utf-8") as f:
+        code = f.read()
+    if args.patch is None:
+        print(cell_outline(notebook_blocks(code)))
+        problems = check_notebook(code)
+    else:
+        with open(args.patch, "r", encoding="utf-8") as f:
+            text = f.read()
+        try:
+            new_code = apply_patch_text(code, text)
+        except (SyntaxError, ValueError) as e:
+            print(f"❌ Error: {e}")
+            return 1
+        print(diff_preview(code, new_code, args.notebook))
+        problems = check_notebook(new_code)
+        if not problems and args.write:
+            with open(args.notebook, "w", encoding="utf-8") as f:
+                f.write(new_code)
+            print(f"✅ {args.notebook} を更新しました (CELL {', '.join(map(str, changed_cells(code, new_code)))})")
+
+    for problem in problems:
+        print(f"❌ {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+# ==========================================
+# 1. 設定エリア
+# ==========================================
+# キャッシュの置き場所 (コミットしない)
+CACHE_DIR = ".llm_cache"
+
+# 応答の有効期限 (秒)。同じファイル・同じ指示なら、この間は API を呼ばない
+RESPONSE_TTL_SEC = 7 * 24 * 3600
+
+# モデル一覧の有効期限 (秒)
+MODEL_LIST_TTL_SEC = 24 * 3600
+
+# キャッシュ全体の上限 (MB)。超えたら使われていない順に消す
+CACHE_MAX_MB = 64
+
+
+# ==========================================
+# 2. キー
+# ==========================================
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def response_key(model, content, instruction, mode="full"):
+    """モデル名 + ファイルの中身のハッシュ + 指示 (+ プロンプトの種類) のキー"""
+    payload = json.dumps([model, content_hash(content), instruction, mode], ensure_ascii=False)
+    return "response-" + content_hash(payload)
+
+
+def model_list_key(api_key, base_url=""):
+    """モデル一覧のキー (API キーごと。キーそのものは残さない)"""
+    return "models-" + content_hash(f"{api_key}\0{base_url}")[:32]
+
+
+# ==========================================
+# 3. ディスクキャッシュ
+# ==========================================
+class DiskCache:
+    """1エントリ1ファイルの JSON キャッシュ。期限切れと容量超過は書き込み時にまとめて消す
+
+    読み込んだエントリは更新時刻を新しくするので、容量超過のときは使われていない順に消える。
+    """
+
+    def __init__(self, folder=CACHE_DIR, max_mb=CACHE_MAX_MB, enabled=True):
+        self.folder = folder
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.folder, f"{key}.json")
+
+    def get(self, key, ttl_sec=RESPONSE_TTL_SEC):
+        """有効なエントリの値。無いか期限切れなら None"""
+        if not self.enabled:
+            return None
+        path = self.path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if time.time() - entry["created"] > ttl_sec:
+            os.remove(path)
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return entry["value"]
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "value": value}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self.evict()
+
+    def entries(self):
+        """(パス, サイズ, 最終利用時刻, 作成時刻) のリスト"""
+        if not os.path.isdir(self.folder):
+            return []
+        out = []
+        for name in os.listdir(self.folder):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    created = json.load(f)["created"]
+                stat = os.stat(path)
+            except (OSError, ValueError, KeyError):
+                continue
+            out.append((path, stat.st_size, stat.st_mtime, created))
+        return out
+
+    def evict(self, ttl_sec=RESPONSE_TTL_SEC):
+        """期限切れ (一番長い応答の期限で判定) のエントリと、上限を超えた分の古いエントリを消す。消した数を返す"""
+        now = time.time()
+        removed = 0
+        alive = []
+        for path, size, used, created in self.entries():
+            if now - created > ttl_sec:
+                os.remove(path)
+                removed += 1
+            else:
+                alive.append((used, size, path))
+        total = sum(size for _, size, _ in alive)
+        for used, size, path in sorted(alive):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        entries = self.entries()
+        for path, *_ in entries:
+            os.remove(path)
+        return len(entries)
+
+    def report(self, label="cache"):
+        """ヒット率の1行 (問い合わせが無ければ None)"""
+        total = self.hits + self.misses
+        if not total:
+            return None
+        return f"💾 {label}: {self.hits}/{total} hits ({self.hits / total:.0%})"
+
+
+# ==========================================
+# 4. メイン
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="mini_opal / check_models の応答キャッシュを確認・整理する")
+    parser.add_argument("--clear", action="store_true", help="すべて消す")
+    parser.add_argument("--evict", action="store_true", help="期限切れと容量超過の分を消す")
+    args = parser.parse_args(argv)
+
+    cache = DiskCache()
+    if args.clear:
+        print(f"🧹 Removed {cache.clear()} entries")
+    elif args.evict:
+        print(f"🧹 Removed {cache.evict()} entries")
+    entries = cache.entries()
+    size = sum(size for _, size, _, _ in entries)
+    print(f"💾 {CACHE_DIR}: {len(entries)} entries, {size / 1024 / 1024:.2f} MB / {CACHE_MAX_MB} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
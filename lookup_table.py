@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from nisa_calc import (
+    GROWTH_TABLE_FILE,
+    GROWTH_TABLE_MAGIC,
+    asset_growth_rows_closed,
+    growth_engine_fingerprint,
+    load_growth_table,
+)
+
+# ==========================================
+# 1. 設定エリア
+# ==========================================
+# nisa_calc.py のスライダーと同じグリッド
+MONTHLY_GRID = {"start": 1000, "step": 1000, "count": 300}  # 1,000〜300,000円
+RATE_TENTHS_GRID = {"start": 1, "step": 1, "count": 150}    # 0.1〜15.0% (0.1%単位の整数)
+MAX_YEARS = 50
+
+# ファイルサイズの上限 (MB)。超えたら書き出さずに失敗する
+TABLE_BUDGET_MB = 24
+
+# データ部の開始位置の揃え (memmap でそのまま int64 として読めるように)
+DATA_ALIGN = 64
+
+# 生成後に突き合わせる点の数 (その場で計算した結果と一致するか)
+VERIFY_SAMPLES = 200
+
+
+# ==========================================
+# 2. 計算 (ワーカープロセス側)
+# ==========================================
+def rate_slab(rate_tenths):
+    """1つの利回りについて、全積立額 × 経過年数 0..MAX_YEARS の総資産 (int64)"""
+    slab = np.zeros((MONTHLY_GRID["count"], MAX_YEARS + 1), dtype=np.int64)
+    for i in range(MONTHLY_GRID["count"]):
+        monthly = MONTHLY_GRID["start"] + MONTHLY_GRID["step"] * i
+        rows = asset_growth_rows_closed(monthly, MAX_YEARS, rate_tenths / 10)
+        slab[i] = [row["Total"] for row in rows]
+    return rate_tenths, slab
+
+
+# ==========================================
+# 3. 生成と検証 (メインプロセス側)
+# ==========================================
+def table_header(data_offset):
+    return {
+        "column": "Total",
+        "dtype": "<i8",
+        "shape": [RATE_TENTHS_GRID["count"], MONTHLY_GRID["count"], MAX_YEARS + 1],
+        "offset": data_offset,
+        "monthly": MONTHLY_GRID,
+        "rate_tenths": RATE_TENTHS_GRID,
+        "years": MAX_YEARS,
+        "engine": growth_engine_fingerprint(),
+    }
+
+
+def header_bytes():
+    """マジック + ヘッダー長 (4バイト) + JSON ヘッダー + 揃え用の空白。データ部の開始位置を自分で含む"""
+    offset = 0
+    while True:
+        body = json.dumps(table_header(offset), separators=(",", ":")).encode("utf-8")
+        size = len(GROWTH_TABLE_MAGIC) + 4 + len(body)
+        aligned = -(-size // DATA_ALIGN) * DATA_ALIGN
+        if aligned == offset:
+            body += b" " * (aligned - size)
+            return GROWTH_TABLE_MAGIC + len(body).to_bytes(4, "little") + body
+        offset = aligned
+
+
+def expected_size():
+    count = RATE_TENTHS_GRID["count"] * MONTHLY_GRID["count"] * (MAX_YEARS + 1)
+    return len(header_bytes()) + count * np.dtype(np.int64).itemsize
+
+
+def build_table(path, workers):
+    """全グリッドを計算してファイルに書き出す (書きかけが見えないよう最後に置き換える)"""
+    head = header_bytes()
+    header = json.loads(head[len(GROWTH_TABLE_MAGIC) + 4:])
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(head)
+    table = np.memmap(tmp, dtype=np.int64, mode="r+", offset=header["offset"], shape=tuple(header["shape"]))
+
+    rates = [RATE_TENTHS_GRID["start"] + RATE_TENTHS_GRID["step"] * i for i in range(RATE_TENTHS_GRID["count"])]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for rate_tenths, slab in pool.map(rate_slab, rates, chunksize=8):
+            table[(rate_tenths - RATE_TENTHS_GRID["start"]) // RATE_TENTHS_GRID["step"]] = slab
+    table.flush()
+    del table
+    os.replace(tmp, path)
+
+
+def is_current(path):
+    """ファイルがあり、今のグリッドと計算ロジックで作られたものか"""
+    loaded = load_growth_table(path)
+    if loaded is None:
+        return False
+    header, _ = loaded
+    return (
+        header["monthly"] == MONTHLY_GRID and header["rate_tenths"] == RATE_TENTHS_GRID
+        and header["years"] == MAX_YEARS and os.path.getsize(path) == expected_size()
+    )
+
+
+def verify_table(path, samples, seed=0):
+    """ランダムな点をその場で計算した結果と突き合わせ、食い違った点のリストを返す"""
+    header, table = load_growth_table(path)
+    rng = random.Random(seed)
+    mismatches = []
+    for _ in range(samples):
+        r_idx = rng.randrange(RATE_TENTHS_GRID["count"])
+        m_idx = rng.randrange(MONTHLY_GRID["count"])
+        years = rng.randint(1, MAX_YEARS)
+        monthly = MONTHLY_GRID["start"] + MONTHLY_GRID["step"] * m_idx
+        rate = (RATE_TENTHS_GRID["start"] + RATE_TENTHS_GRID["step"] * r_idx) / 10
+        live = [row["Total"] for row in asset_growth_rows_closed(monthly, years, rate)]
+        if table[r_idx, m_idx, :years + 1].tolist() != live:
+            mismatches.append((monthly, years, rate))
+    return mismatches
+
+
+def mb(n):
+    return n / 1024 / 1024
+
+
+def ensure_lookup_table(path=GROWTH_TABLE_FILE, budget_mb=TABLE_BUDGET_MB, workers=None, force=False, verify=VERIFY_SAMPLES):
+    """表が古ければ作り直し、(状態, サイズ) を返す。上限超過や検証の失敗は ValueError"""
+    size = expected_size()
+    if mb(size) > budget_mb:
+        raise ValueError(f"{path}: {mb(size):.2f} MB exceeds the budget of {budget_mb:.2f} MB")
+    if not force and is_current(path):
+        return "up to date", size
+
+    build_table(path, max(1, workers or os.cpu_count()))
+    if verify:
+        mismatches = verify_table(path, verify)
+        if mismatches:
+            os.remove(path)
+            raise ValueError(f"{path}: {len(mismatches)} of {verify} samples differ from the live engine (e.g. {mismatches[0]})")
+    return "built", os.path.getsize(path)
+
+
+# ==========================================
+# 4. メイン
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="積立NISAの全グリッドの総資産を事前計算し、memmap できるバイナリに書き出す")
+    parser.add_argument("--output", default=GROWTH_TABLE_FILE)
+    parser.add_argument("--budget-mb", type=float, default=TABLE_BUDGET_MB, help="ファイルサイズの上限 (MB)")
+    parser.add_argument("--force", action="store_true", help="最新でも作り直す")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--verify", type=int, default=VERIFY_SAMPLES, help="生成後に突き合わせる点の数 (0で省略)")
+    args = parser.parse_args(argv)
+
+    points = RATE_TENTHS_GRID["count"] * MONTHLY_GRID["count"] * MAX_YEARS
+    print(f"📐 Grid: {MONTHLY_GRID['count']} x {MAX_YEARS} x {RATE_TENTHS_GRID['count']} = {points:,} points")
+    t = time.perf_counter()
+    try:
+        status, size = ensure_lookup_table(args.output, args.budget_mb, args.workers, args.force, args.verify)
+    except ValueError as e:
+        print(f"❌ Error: {e}")
+        return 1
+    print(f"✅ {args.output}: {status}, {mb(size):.2f} MB / budget {args.budget_mb:.2f} MB ({time.perf_counter() - t:.1f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,26 @@
+import argparse
+import asyncio
 import os
+import re
+import sys
+import time
+
 from google import genai # 新しいライブラリのインポート方法
+from google.genai import types
 from dotenv import load_dotenv  # 追加
 
+from cell_patch import (
+    apply_patch_text,
+    cell_outline,
+    changed_cells,
+    check_notebook,
+    diff_preview,
+    notebook_blocks,
+    render_cells,
+)
+from llm_cache import DiskCache, response_key
+from notebook_gate import gate_notebook, print_gate_report
+
 # .envファイルを読み込む
 load_dotenv()
 
@@ -11,14 +30,37 @@ load_dotenv()
 # コードからキーを消し、環境変数から取得する
 API_KEY = os.getenv("GEMINI_API_KEY")
 
-if not API_KEY:
-    raise ValueError("APIキーが見つかりません。.envファイルを確認してください。")
-
-# 操作対象のファイル名
+# 操作対象のファイル名 (ファイルを指定しなかったときの対話モード)
 TARGET_FILE = "bodymake_app.py"
 
-# Geminiの設定（クライアント初期化）
-client = genai.Client(api_key=API_KEY)
+# 使うモデル
+MODEL = "gemini-3-flash-preview"
+
+# 一括編集で同時に投げるリクエスト数の上限 (全ノートブックが一度に収まる数)
+CONCURRENCY = 8
+
+# marimo ノートブックの目印 (app = marimo.App(...) の行)
+NOTEBOOK_PATTERN = re.compile(r"^app\s*=\s*marimo\.App\(", re.M)
+
+# 応答のディスクキャッシュ (同じファイル・同じ指示なら API を呼ばない。--no-cache で無効)
+cache = DiskCache()
+
+# 上書きする前に新しいコードを別プロセスで実行して確かめるか
+# "warn": エラーなら書き込まない・遅くなったら警告 / "strict": 遅くなっても書き込まない / "off": 確かめない
+GATE = "warn"
+
+# API の代わりにつなぐ先 (例: stub_model_server.py の URL)。空なら本物の Gemini API
+BASE_URL = os.getenv("MINI_OPAL_BASE_URL", "")
+
+
+def make_client(base_url=None):
+    """Geminiの設定（クライアント初期化）。base_url を指定すればローカルのスタブにつなぐ"""
+    base_url = base_url or BASE_URL
+    if base_url:
+        return genai.Client(api_key=API_KEY or "stub", http_options=types.HttpOptions(base_url=base_url))
+    if not API_KEY:
+        raise ValueError("APIキーが見つかりません。.envファイルを確認してください。")
+    return genai.Client(api_key=API_KEY)
 
 # ==========================================
 # 2. Mini-Opal のロジック (New SDK Version)
@@ -35,25 +77,17 @@ def write_file(filepath, content):
     with open(filepath, "w", encoding="utf-8") as f:
         f.write(content)
 
-def main():
-    print(f"💎 Mini-Opal (v2.0) 起動: 対象ファイル [{TARGET_FILE}]")
-    
-    # 1. 現在のコードを読み取る
-    current_code = read_file(TARGET_FILE)
-    if not current_code:
-        print(f"エラー: {TARGET_FILE} が見つかりません。")
-        return
+def find_notebooks(folder="."):
+    """フォルダ直下の marimo ノートブック (app = marimo.App(...) がある .py)"""
+    notebooks = []
+    for name in sorted(os.listdir(folder)):
+        if name.endswith(".py") and NOTEBOOK_PATTERN.search(read_file(os.path.join(folder, name))):
+            notebooks.append(os.path.join(folder, name) if folder != "." else name)
+    return notebooks
 
-    # 2. ユーザー指示
-    print("-" * 40)
-    user_instruction = input("指示を入力してください (例: BMIの計算機能も追加して): \n>> ")
-    if not user_instruction:
-        return
-
-    print("\n🤔 Geminiが思考中...")
-
-    # 3. プロンプト作成
-    prompt = f"""
+def build_prompt(current_code, user_instruction):
+    """3. プロンプト作成"""
+    return f"""
     あなたは優秀なPythonエンジニアです。marimoというライブラリを使っています。
     以下のPythonコードを、ユーザーの指示に従って修正し、
     **修正後の完全なPythonコードのみ**を出力してください。
@@ -67,32 +101,210 @@ def main():
     {user_instruction}
     """
 
-    # 4. APIを実行（ここが最新の書き方です）
-    try:
-        # モデル名を "gemini-3-flash-preview" に変更！
-        response = client.models.generate_content(
-            model="gemini-3-flash-preview", 
-            contents=prompt
+def build_patch_prompt(current_code, user_instruction, focus=None):
+    """パッチモードのプロンプト。変更するセルだけを返させる
+
+    focus (前回変更したセルの番号) を渡すと、全セルの一覧と focus のセルのコードだけを送る。
+    """
+    if focus is None:
+        context = f"【現在のセル】\n{render_cells(current_code)}"
+    else:
+        context = (
+            f"【セル一覧 (番号: 種類 (受け取る名前) -> 返す名前)】\n{cell_outline(notebook_blocks(current_code))}\n\n"
+            f"【前回変更したセル】\n{render_cells(current_code, focus)}"
         )
-        new_code = response.text
-        
-        # 簡易クリーニング
-        new_code = new_code.replace("```python", "").replace("```", "").strip()
-
-    except Exception as e:
-        print(f"APIエラーが発生しました: {e}")
-        # もしモデル名エラーが出る場合は、利用可能なモデル一覧を表示するヒント
-        if "404" in str(e):
-            print("ヒント: 'gemini-1.5-flash' が使えない可能性があります。")
+    return f"""あなたは優秀なPythonエンジニアです。marimoというライブラリを使っています。
+以下の marimo ノートブックを、ユーザーの指示に従って修正してください。
+**変更するセルだけ**を次の形式で出力してください。説明は不要です。
+
+### CELL 番号
+(既存のセルを置き換える。デコレーターの行から return まで)
+### END
+### CELL new
+(新しいセルを末尾に追加する)
+### END
+### DELETE 番号
+
+セルにまたがる細かい修正は unified diff (@@ -行,行数 +行,行数 @@) で返しても構いません。
+他のセルが受け取っている名前は、return から消さないでください。
+
+{context}
+
+【ユーザーの指示】
+{user_instruction}
+"""
+
+def apply_patch_response(current_code, text):
+    """パッチモードの応答を適用して検証し、新しいコードを返す。適用できないか、壊れていれば ValueError"""
+    new_code = apply_patch_text(current_code, text)
+    before = set(check_notebook(current_code))
+    problems = [p for p in check_notebook(new_code) if p not in before]
+    if problems:
+        raise ValueError(" / ".join(problems))
+    return new_code
+
+def clean_code(text):
+    """簡易クリーニング"""
+    return text.replace("```python", "").replace("```", "").strip()
+
+def check_before_write(path, new_code, gate=GATE, verbose=True):
+    """新しいコードを実行して今のファイルと比べ、書き込んでよければ True"""
+    if gate == "off":
+        return True
+    result = gate_notebook(path, new_code)
+    if verbose:
+        print_gate_report(result, path)
+    else:
+        for line in [f"❌ {e}" for e in result["errors"]] + [f"🐢 {w}" for w in result["warnings"]]:
+            print(f"    {line}")
+    if result["errors"]:
+        print(f"⛔ {path}: 実行できないため上書きしません。")
+        return False
+    if result["warnings"] and gate == "strict":
+        print(f"⛔ {path}: 遅くなったため上書きしません (--gate warn なら警告のみ)。")
+        return False
+    return True
+
+def explain_api_error(e):
+    print(f"APIエラーが発生しました: {e}")
+    # もしモデル名エラーが出る場合は、利用可能なモデル一覧を表示するヒント
+    if "404" in str(e):
+        print("ヒント: モデル名が使えない可能性があります。check_models.py で確認してください。")
+
+# ==========================================
+# 3. 一括編集 (asyncio で並列にリクエスト)
+# ==========================================
+async def edit_one(client, semaphore, path, user_instruction, model, patch=False):
+    """1ファイル分のリクエスト。{"path", "code" (新しいコード or None), "sec", "chars" (応答の文字数), "error"} を返す"""
+    current_code = read_file(path)
+    result = {"path": path, "code": None, "sec": 0.0, "chars": 0, "error": None}
+    if not current_code:
+        return {**result, "error": "ファイルが見つかりません"}
+    prompt = build_patch_prompt(current_code, user_instruction) if patch else build_prompt(current_code, user_instruction)
+    key = response_key(model, current_code, user_instruction, "patch" if patch else "full")
+    text = cache.get(key)
+    result["cached"] = text is not None
+    if text is None:
+        async with semaphore:
+            t = time.perf_counter()
+            try:
+                response = await client.aio.models.generate_content(model=model, contents=prompt)
+                text = response.text or ""
+            except Exception as e:
+                return {**result, "sec": time.perf_counter() - t, "error": str(e)}
+        result["sec"] = time.perf_counter() - t
+    result["chars"] = len(text)
+    try:
+        if patch:
+            new_code = apply_patch_response(current_code, text)
+            result["cells"] = changed_cells(current_code, new_code)
+        else:
+            new_code = clean_code(text)
+    except (SyntaxError, ValueError) as e:
+        return {**result, "error": f"パッチを適用できません: {e}"}
+    if not new_code:
+        return {**result, "error": "空の応答"}
+    # 適用できた応答だけ残す (壊れた応答は、やり直したときに取り直す)
+    if not result["cached"]:
+        cache.put(key, text)
+    return {**result, "code": new_code}
+
+async def edit_files(
+    client, paths, user_instruction, model=MODEL, concurrency=CONCURRENCY, apply=True, patch=False, gate=GATE
+):
+    """全ファイルのリクエストを同時に (最大 concurrency 件まで) 投げ、返ってきた順に確かめて書き込む
+
+    実行の確認は時間を測るので1つずつ行う (その間も他のリクエストは待ち続ける)。
+    戻り値: edit_one の結果のリスト (返ってきた順)
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    gate_lock = asyncio.Lock()
+    tasks = [
+        asyncio.create_task(edit_one(client, semaphore, path, user_instruction, model, patch)) for path in paths
+    ]
+    results = []
+    for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+        r = await task
+        if r["error"] is None and apply:
+            async with gate_lock:
+                ok = await asyncio.to_thread(check_before_write, r["path"], r["code"], gate, False)
+            if not ok:
+                r["error"] = "実行の確認で止めました"
+        if r["error"] is None and apply:
+            write_file(r["path"], r["code"] if patch else r["code"] + "\n")
+        mark = f"❌ {r['error']}" if r["error"] else ("✅ updated" if apply else "✅ generated")
+        if "cells" in r:
+            mark += f" (CELL {', '.join(map(str, r['cells'])) or '-'})"
+        if r.get("cached"):
+            mark += " 💾 cached"
+        print(f"[{done}/{len(paths)}] {r['path']:<24} {r['sec']:>6.1f}s {r['chars']:>7,} chars  {mark}")
+        results.append(r)
+    return results
+
+def run_batch(paths, user_instruction, model, concurrency, base_url=None, apply=True, patch=False, gate=GATE):
+    """一括編集を実行して所要時間をまとめて表示する。失敗したファイル数を返す"""
+    client = make_client(base_url)
+    mode = "パッチ" if patch else "全文"
+    print(f"💎 Mini-Opal 一括編集: {len(paths)} ファイル ({mode}, 同時 {concurrency} 件, モデル {model})")
+    t = time.perf_counter()
+    results = asyncio.run(edit_files(client, paths, user_instruction, model, concurrency, apply, patch, gate))
+    wall = time.perf_counter() - t
+    secs = [r["sec"] for r in results]
+    print("-" * 40)
+    print(f"⏱️ {wall:.1f}s wall / {sum(secs):.1f}s total request time (slowest {max(secs, default=0):.1f}s)")
+    print(f"📝 {sum(r['chars'] for r in results):,} response chars")
+    return sum(1 for r in results if r["error"])
+
+# ==========================================
+# 4. 対話モード (1ファイル)
+# ==========================================
+def interactive(model, base_url=None, gate=GATE):
+    print(f"💎 Mini-Opal (v2.0) 起動: 対象ファイル [{TARGET_FILE}]")
+
+    # 1. 現在のコードを読み取る
+    current_code = read_file(TARGET_FILE)
+    if not current_code:
+        print(f"エラー: {TARGET_FILE} が見つかりません。")
         return
 
+    # 2. ユーザー指示
+    print("-" * 40)
+    user_instruction = input("指示を入力してください (例: BMIの計算機能も追加して): \n>> ")
+    if not user_instruction:
+        return
+
+    print("\n🤔 Geminiが思考中...")
+
+    # 3-4. APIを実行（ここが最新の書き方です）。同じファイル・同じ指示ならキャッシュから
+    key = response_key(model, current_code, user_instruction)
+    text = cache.get(key)
+    if text is None:
+        try:
+            response = make_client(base_url).models.generate_content(
+                model=model,
+                contents=build_prompt(current_code, user_instruction)
+            )
+            text = response.text
+
+        except Exception as e:
+            explain_api_error(e)
+            return
+        cache.put(key, text)
+    else:
+        print("💾 キャッシュ済みの応答を使います。")
+    new_code = clean_code(text)
+
     # 5. 安全弁：確認
     print("-" * 40)
     print("✨ 生成されたコードのプレビュー（先頭5行）:")
     print("\n".join(new_code.split("\n")[:5]))
     print("...")
     print("-" * 40)
-    
+
+    # 5.5 実行して確かめる (エラーがあれば、確認するまでもなく書き込まない)
+    if not check_before_write(TARGET_FILE, new_code, gate):
+        return
+
     confirm = input(">> このコードで上書きしてよろしいですか？ (y/n): ")
 
     # 6. 実装
@@ -102,5 +314,129 @@ def main():
     else:
         print("❌ 更新をキャンセルしました。")
 
+def interactive_patch(model, base_url=None, gate=GATE):
+    """パッチモードの対話。2回目以降の指示では、前回変更したセルだけをコードごと送る"""
+    print(f"💎 Mini-Opal (v2.0) 起動: 対象ファイル [{TARGET_FILE}] (パッチモード)")
+    current_code = read_file(TARGET_FILE)
+    if not current_code:
+        print(f"エラー: {TARGET_FILE} が見つかりません。")
+        return
+    client = make_client(base_url)
+
+    focus = None
+    while True:
+        print("-" * 40)
+        user_instruction = input("指示を入力してください (空で終了): \n>> ")
+        if not user_instruction:
+            return
+
+        print("\n🤔 Geminiが思考中...")
+        key = response_key(model, current_code, user_instruction, f"patch:{focus}")
+        text = cache.get(key)
+        if text is None:
+            try:
+                response = client.models.generate_content(
+                    model=model,
+                    contents=build_patch_prompt(current_code, user_instruction, focus)
+                )
+                text = response.text or ""
+            except Exception as e:
+                explain_api_error(e)
+                return
+        else:
+            print("💾 キャッシュ済みの応答を使います。")
+        try:
+            new_code = apply_patch_response(current_code, text)
+        except (SyntaxError, ValueError) as e:
+            print(f"❌ パッチを適用できませんでした: {e}")
+            continue
+        cache.put(key, text)
+
+        # 安全弁：変更点を確認
+        cells = changed_cells(current_code, new_code)
+        print("-" * 40)
+        print(f"✨ 変更されたセル: {', '.join(map(str, cells)) or '-'} ({len(text):,} 文字の応答)")
+        print(diff_preview(current_code, new_code, TARGET_FILE))
+        print("-" * 40)
+        if not check_before_write(TARGET_FILE, new_code, gate):
+            continue
+        if input(">> この変更を適用してよろしいですか？ (y/n): ").lower() != "y":
+            print("❌ 更新をキャンセルしました。")
+            continue
+
+        write_file(TARGET_FILE, new_code)
+        print(f"✅ {TARGET_FILE} を更新しました！ブラウザを確認してください。")
+        current_code, focus = new_code, cells
+
+# ==========================================
+# 5. メイン
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gemini に指示を出して marimo ノートブックを書き換える")
+    parser.add_argument("files", nargs="*", help="書き換えるノートブック (省略時は対話モードで bodymake_app.py)")
+    parser.add_argument("--all", action="store_true", help="フォルダ内の marimo ノートブックをすべて対象にする")
+    parser.add_argument("-i", "--instruction", help="指示 (一括編集では省略時に入力を求める)")
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="同時に投げるリクエスト数の上限")
+    parser.add_argument("--base-url", default=None, help="Gemini API の代わりにつなぐ先 (スタブサーバーなど)")
+    parser.add_argument("--stub", action="store_true", help="ローカルのスタブサーバーを起動してつなぐ (ネットワーク不要)")
+    parser.add_argument("--stub-delay", type=float, default=None, help="スタブの応答にかける秒数")
+    parser.add_argument("--patch", action="store_true", help="変更するセルだけを返させて、ローカルで適用・検証する")
+    parser.add_argument("--gate", choices=("warn", "strict", "off"), default=GATE,
+                        help="上書き前の実行確認 (warn: エラーなら中止 / strict: 遅くなっても中止 / off: しない)")
+    parser.add_argument("--no-cache", action="store_true", help="応答のキャッシュを使わない")
+    parser.add_argument("--dry-run", action="store_true", help="生成だけして書き込まない")
+    parser.add_argument("-y", "--yes", action="store_true", help="上書きの確認をしない")
+    args = parser.parse_args(argv)
+
+    cache.enabled = not args.no_cache
+    server = None
+    if args.stub:
+        from stub_model_server import DEFAULT_DELAY_SEC, start_stub_server
+
+        delay = DEFAULT_DELAY_SEC if args.stub_delay is None else args.stub_delay
+        server, args.base_url, stats = start_stub_server(delay)
+        print(f"🧪 Stub model server: {args.base_url} (delay {delay:.1f}s)")
+
+    try:
+        paths = find_notebooks() if args.all else args.files
+        if not paths:
+            try:
+                (interactive_patch if args.patch else interactive)(args.model, args.base_url, args.gate)
+            except ValueError as e:
+                print(f"❌ Error: {e}")
+                return 1
+            return 0
+
+        missing = [p for p in paths if not os.path.exists(p)]
+        if missing:
+            print(f"❌ Error: {', '.join(missing)} が見つかりません。")
+            return 1
+        user_instruction = args.instruction or input("指示を入力してください: \n>> ")
+        if not user_instruction:
+            return 0
+        if not args.dry_run and not args.yes:
+            print("\n".join(f"  - {p}" for p in paths))
+            if input(f">> 返ってきた順に {len(paths)} ファイルを上書きします。よろしいですか？ (y/n): ").lower() != "y":
+                print("❌ 更新をキャンセルしました。")
+                return 0
+
+        try:
+            failed = run_batch(
+                paths, user_instruction, args.model, args.concurrency, args.base_url, not args.dry_run, args.patch,
+                args.gate,
+            )
+        except ValueError as e:
+            print(f"❌ Error: {e}")
+            return 1
+        if server is not None:
+            print(f"🧪 Stub: {stats['requests']} requests, max {stats['max_in_flight']} in flight")
+        return 1 if failed else 0
+    finally:
+        if server is not None:
+            server.shutdown()
+        if cache.report():
+            print(cache.report())
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
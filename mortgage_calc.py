@@ -4,17 +4,30 @@ __generated_with = "0.10.9"
 app = marimo.App(width="full")
 
 
+with app.setup:
+    from decimal import Decimal, ROUND_HALF_UP, ROUND_FLOOR, localcontext
+    import functools
+    import math
+    import numpy as np
+
+    # 計算結果キャッシュ (LRU) の上限件数 (1件 = 最大600ヶ月分の返済予定表)
+    SIM_CACHE_SIZE = 128
+
+    # 入力欄の初期値 (キャッシュの事前計算にも使う)
+    DEFAULT_LOAN_MAN = 3500
+    DEFAULT_RATE = 0.525
+    DEFAULT_YEARS = 35
+    DEFAULT_METHOD = "元利均等返済"
+
+    # 返済方式の選択肢。API / バッチの入力チェックでも使う (これ以外は計算しない)
+    REPAYMENT_METHODS = ("元利均等返済", "元金均等返済")
+
+
 @app.cell
 def _():
     import marimo as mo
-    import pandas as pd
     import altair as alt
-    from decimal import Decimal, ROUND_HALF_UP, ROUND_FLOOR
-    import decimal
-
-    # 金融計算の精度設定
-    decimal.getcontext().prec = 60
-    return Decimal, ROUND_FLOOR, ROUND_HALF_UP, alt, decimal, mo, pd
+    return alt, mo
 
 
 @app.cell
@@ -72,13 +85,13 @@ def _(mo):
 @app.cell
 def _(mo):
     # UIコンポーネントの定義 (最も標準的な作り)
-    loan_amount_ui = mo.ui.number(label="借入金額 (万円)", start=100, stop=50000, value=3500, full_width=True)
-    interest_rate_ui = mo.ui.number(label="年利 (%)", start=0.0, stop=20.0, step=0.001, value=0.525, full_width=True)
-    years_ui = mo.ui.slider(label="返済期間 (年)", start=1, stop=50, value=35, full_width=True)
+    loan_amount_ui = mo.ui.number(label="借入金額 (万円)", start=100, stop=50000, value=DEFAULT_LOAN_MAN, full_width=True)
+    interest_rate_ui = mo.ui.number(label="年利 (%)", start=0.0, stop=20.0, step=0.001, value=DEFAULT_RATE, full_width=True)
+    years_ui = mo.ui.slider(label="返済期間 (年)", start=1, stop=50, value=DEFAULT_YEARS, full_width=True)
     method_ui = mo.ui.dropdown(
         label="返済方式",
-        options={"元利均等返済": "元利均等返済", "元金均等返済": "元金均等返済"},
-        value="元利均等返済",
+        options={m: m for m in REPAYMENT_METHODS},
+        value=DEFAULT_METHOD,
         full_width=True
     )
     bonus_toggle_ui = mo.ui.switch(label="ボーナス払いを利用する", value=False)
@@ -124,45 +137,65 @@ def _(
     return
 
 
-@app.cell
-def _(
-    Decimal,
-    ROUND_FLOOR,
-    ROUND_HALF_UP,
-    bonus_amount_ui,
-    bonus_toggle_ui,
-    interest_rate_ui,
-    loan_amount_ui,
-    method_ui,
-    years_ui,
-):
-    # 計算エンジン
-    def run_calc():
-        P_all = Decimal(str(loan_amount_ui.value)) * Decimal("10000")
-        r_y = Decimal(str(interest_rate_ui.value)) / Decimal("100")
+@app.function
+def schedule_table(columns: dict, output: str):
+    # 列ごとの配列の dict を、output に応じて DataFrame ("frame") かそのまま ("columns") で返す
+    # pandas は "frame" のときだけ読み込む (WASM ページでは読み込まない)
+    if output == "columns":
+        return columns
+    if output != "frame":
+        raise ValueError(f"unknown output: {output}")
+    import pandas as pd
+    return pd.DataFrame(columns)
+
+
+@app.function
+def columns_to_records(columns: dict) -> list:
+    # 列の dict を Vega-Lite のインラインデータ (行の dict のリスト) にする
+    # ndarray の列は Python の数値に直す (JSON にそのまま書けるように)
+    keys = list(columns)
+    values = [c.tolist() if hasattr(c, "tolist") else c for c in columns.values()]
+    return [dict(zip(keys, row)) for row in zip(*values)]
+
+
+@app.function
+def get_pmt(p, r, n):
+    # 元利均等の1回あたり返済額 (呼び出し側の Decimal 精度で計算)
+    if r == 0: return p / n
+    return p * (r * (1 + r)**n) / ((1 + r)**n - 1)
+
+
+@app.function
+def run_calc(loan_man: float, rate_pct: float, years: int, method: str, bonus_man: float = 0):
+    # 計算エンジン (参照実装: 1ヶ月ずつ dict を積み上げる)
+    # bonus_man はボーナス払い分の借入額 (万円)。ボーナス払いなしは 0
+    use_bonus = bool(bonus_man)
+
+    with localcontext() as ctx:
+        # 金融計算の精度設定
+        ctx.prec = 60
+
+        P_all = Decimal(str(loan_man)) * Decimal("10000")
+        r_y = Decimal(str(rate_pct)) / Decimal("100")
         r_m = r_y / Decimal("12")
-        total_m = int(years_ui.value) * 12
+        total_m = int(years) * 12
         
-        P_b = Decimal(str(bonus_amount_ui.value)) * Decimal("10000") if bonus_toggle_ui.value else Decimal("0")
+        P_b = Decimal(str(bonus_man)) * Decimal("10000") if use_bonus else Decimal("0")
         P_n = P_all - P_b
-        
-        def get_pmt(p, r, n):
-            if r == 0: return p / n
-            return p * (r * (1 + r)**n) / ((1 + r)**n - 1)
 
         m_fixed = get_pmt(P_n, r_m, total_m).quantize(Decimal("1"), ROUND_HALF_UP)
-        b_fixed = get_pmt(P_b, r_y / 2, int(years_ui.value) * 2).quantize(Decimal("1"), ROUND_HALF_UP) if bonus_toggle_ui.value else 0
+        b_fixed = get_pmt(P_b, r_y / 2, int(years) * 2).quantize(Decimal("1"), ROUND_HALF_UP) if use_bonus else 0
 
         schedule = []
         rem_n, rem_b = P_n, P_b
         total_int = Decimal("0")
 
         for i in range(1, total_m + 1):
-            is_b_month = (i % 6 == 0) and bonus_toggle_ui.value
+            is_b_month = (i % 6 == 0) and use_bonus
             
             # 通常分
             i_n = (rem_n * r_m).quantize(Decimal("1"), ROUND_FLOOR)
-            if method_ui.value == "元利均等返済":
+            if method == "元利均等返済":
                 p_n = (m_fixed - i_n) if i < total_m else rem_n
             else:
                 p_n = (P_n / total_m).quantize(Decimal("1"), ROUND_FLOOR) if i < total_m else rem_n
@@ -173,10 +206,10 @@ def _(
             p_b, i_b = Decimal("0"), Decimal("0")
             if is_b_month:
                 i_b = (rem_b * (r_y / 2)).quantize(Decimal("1"), ROUND_FLOOR)
-                if method_ui.value == "元利均等返済":
+                if method == "元利均等返済":
                     p_b = (b_fixed - i_b) if i < total_m else rem_b
                 else:
-                    p_b = (P_b / (int(years_ui.value) * 2)).quantize(Decimal("1"), ROUND_FLOOR) if i < total_m else rem_b
+                    p_b = (P_b / (int(years) * 2)).quantize(Decimal("1"), ROUND_FLOOR) if i < total_m else rem_b
                 p_b = min(p_b, rem_b)
                 rem_b -= p_b
             
@@ -190,15 +223,375 @@ def _(
             })
         return schedule, int(P_all + total_int), int(total_int)
 
-    sim_data, total_pay, total_int_val = run_calc()
-    return run_calc, sim_data, total_int_val, total_pay
+
+@app.function
+def floor_interest(balance: int, rate: Decimal) -> int:
+    # 残高 × 利率 の円未満切り捨て (run_calc と同じ60桁の Decimal 計算)
+    with localcontext() as ctx:
+        ctx.prec = 60
+        return int((Decimal(balance) * rate).quantize(Decimal("1"), ROUND_FLOOR))
+
+
+@app.function
+def amortize_tranche(principal: int, rate: Decimal, periods: int, method: str, payment: int, count: int = None):
+    # 1つの借入 (通常分 or ボーナス分) の返済予定を、列ごとの int64 配列で返す
+    # payment は元利均等なら毎回の返済額、元金均等なら毎回の元金
+    # count を指定すると先頭 count 回分だけ計算する (残額の精算は periods 回目)
+    # 戻り値: (利息, 元金返済額, 返済後残高)
+    # 利息は float で計算し、整数に近すぎて切り捨て結果が怪しいものだけ Decimal で計算し直す
+    eps = 1e-6
+    rate_f = float(rate)
+    count = periods if count is None else count
+
+    if method == "元利均等返済":
+        # 利息の切り捨てが次回の残高に効くため、この方式は1回ずつ順に計算する
+        interest, paid = [], []
+        rem = principal
+        for k in range(count):
+            if rate_f == 0:
+                i = 0
+            else:
+                x = rem * rate_f
+                i = math.floor(x)
+                if not eps < x - i < 1 - eps:
+                    i = floor_interest(rem, rate)
+            p = (payment - i) if k < periods - 1 else rem
+            p = min(p, rem)
+            rem -= p
+            interest.append(i)
+            paid.append(p)
+        interest = np.array(interest, dtype=np.int64)
+        paid = np.array(paid, dtype=np.int64)
+        remaining = principal - np.cumsum(paid)
+    else:
+        # 元金均等は毎回の元金が一定なので、残高も利息もまとめて計算できる
+        before = np.maximum(principal - payment * np.arange(count, dtype=np.int64), 0)
+        paid = np.minimum(payment, before)
+        if count == periods:
+            paid[-1] = before[-1]
+
+        x = before * rate_f
+        interest = np.floor(x)
+        frac = x - interest
+        interest = interest.astype(np.int64)
+        if rate_f != 0:
+            for k in np.flatnonzero((frac < eps) | (frac > 1 - eps)):
+                interest[k] = floor_interest(int(before[k]), rate)
+        remaining = before - paid
+
+    return interest, paid, remaining
+
+
+@app.function
+@functools.lru_cache(maxsize=SIM_CACHE_SIZE)
+def build_schedule(
+    loan_man: float, rate_pct: float, years: int, method: str, bonus_man: float = 0, output: str = "frame"
+):
+    # 計算エンジン (列指向版)
+    # run_calc と同じ返済予定表を、月ごとの dict ではなく列ごとの配列から組み立てる
+    # output="frame" は DataFrame、"columns" は int64 配列の dict (schedule_table を参照)
+    # 戻り値: (返済予定表, 総支払額, 利息合計)
+    # 同じ引数なら同じオブジェクトを返す (キャッシュ共有のため書き換えないこと)
+    # ヒット/ミス数は build_schedule.cache_info() で確認できる
+    use_bonus = bool(bonus_man)
+    total_m = int(years) * 12
+
+    with localcontext() as ctx:
+        ctx.prec = 60
+
+        P_all = Decimal(str(loan_man)) * Decimal("10000")
+        r_y = Decimal(str(rate_pct)) / Decimal("100")
+        r_m = r_y / Decimal("12")
+        r_b = r_y / 2
+
+        P_b = Decimal(str(bonus_man)) * Decimal("10000") if use_bonus else Decimal("0")
+        P_n = P_all - P_b
+
+        if P_n < 0 or P_n != P_n.to_integral_value() or P_b != P_b.to_integral_value():
+            # 円未満の端数がある借入額や、ボーナス分が借入額を超える入力は参照実装に任せる
+            schedule, total_pay, total_int = run_calc(loan_man, rate_pct, years, method, bonus_man)
+            columns = {k: np.array([row[k] for row in schedule], dtype=np.int64) for k in ("月", "年", "支払額", "残高", "利息")}
+            return schedule_table(columns, output), total_pay, total_int
+
+        if method == "元利均等返済":
+            m_fixed = int(get_pmt(P_n, r_m, total_m).quantize(Decimal("1"), ROUND_HALF_UP))
+            b_fixed = int(get_pmt(P_b, r_b, int(years) * 2).quantize(Decimal("1"), ROUND_HALF_UP)) if use_bonus else 0
+        else:
+            m_fixed = int(P_n) // total_m
+            b_fixed = int(P_b) // (int(years) * 2)
+
+    month = np.arange(1, total_m + 1, dtype=np.int64)
+    interest, paid, remaining = amortize_tranche(int(P_n), r_m, total_m, method, m_fixed)
+    payment = paid + interest
+
+    if use_bonus:
+        # ボーナス分は6ヶ月ごと。残高は次のボーナス月まで据え置き
+        i_b, p_b, rem_b = amortize_tranche(int(P_b), r_b, int(years) * 2, method, b_fixed)
+        bonus_idx = np.arange(5, total_m, 6)
+        interest[bonus_idx] += i_b
+        payment[bonus_idx] += p_b + i_b
+        remaining = remaining + np.concatenate(([int(P_b)], rem_b))[month // 6]
+
+    total_int = int(interest.sum())
+    schedule = schedule_table({
+        "月": month,
+        "年": (month - 1) // 12 + 1,
+        "支払額": payment,
+        "残高": remaining,
+        "利息": interest,
+    }, output)
+    return schedule, int(P_all) + total_int, total_int
+
+
+@app.function
+def scenario_start(loan_man: float, rate_pct: float, years: int, method: str):
+    # シナリオ計算の初期状態 (経過月, 残高, 年利%, 返済額 or 元金, 最終月)
+    # ボーナス払いなしの借入を対象にする
+    principal = int(Decimal(str(loan_man)) * Decimal("10000"))
+    total_m = int(years) * 12
+    return (0, principal, rate_pct, reset_payment(principal, rate_pct, total_m, method), total_m)
+
+
+@app.function
+def reset_payment(balance: int, rate_pct: float, periods: int, method: str) -> int:
+    # 残高・残り回数から毎回の返済額 (元利均等) または元金 (元金均等) を決め直す
+    if periods <= 0:
+        return 0
+    if method != "元利均等返済":
+        return balance // periods
+    with localcontext() as ctx:
+        ctx.prec = 60
+        r_m = Decimal(str(rate_pct)) / Decimal("100") / Decimal("12")
+        return int(get_pmt(Decimal(balance), r_m, periods).quantize(Decimal("1"), ROUND_HALF_UP))
+
+
+@app.function
+def monthly_rate(rate_pct: float) -> Decimal:
+    # 年利% から月利 (run_calc と同じ60桁)
+    with localcontext() as ctx:
+        ctx.prec = 60
+        return Decimal(str(rate_pct)) / Decimal("100") / Decimal("12")
+
+
+@app.function
+def advance_scenario(state: tuple, until: int, method: str):
+    # 状態を until 月の返済まで進める。戻り値: (区間の配列, 新しい状態)
+    month, balance, rate_pct, payment, end = state
+    count = min(until, end) - month
+    if count <= 0 or balance <= 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return (month, empty, empty, empty), state
+
+    interest, paid, remaining = amortize_tranche(
+        balance, monthly_rate(rate_pct), end - month, method, payment, count=count
+    )
+    segment = (month, interest, paid, remaining)
+    return segment, (month + count, int(remaining[-1]), rate_pct, payment, end)
+
+
+@app.function
+def apply_scenario_event(state: tuple, kind: str, value: float, method: str) -> tuple:
+    # イベント (金利変更 / 期間短縮型 / 返済額軽減型) を適用した状態を返す
+    # 金利変更は残り期間で返済額を計算し直す (5年ルール・125%ルールは考慮しない)
+    month, balance, rate_pct, payment, end = state
+
+    if kind == "金利変更":
+        rate_pct = value
+        if method == "元利均等返済":
+            payment = reset_payment(balance, rate_pct, end - month, method)
+        return (month, balance, rate_pct, payment, end)
+
+    balance -= min(int(Decimal(str(value)) * Decimal("10000")), balance)
+    if balance == 0:
+        return (month, 0, rate_pct, 0, month)
+
+    if kind == "期間短縮型":
+        # 返済額 (元金) はそのままで、完済までの回数を数え直す
+        if method == "元利均等返済":
+            r = float(monthly_rate(rate_pct))
+            if r == 0:
+                periods = -(-balance // payment)
+            elif payment > balance * r:
+                periods = math.ceil(-math.log1p(-balance * r / payment) / math.log1p(r) - 1e-9)
+            else:
+                periods = end - month
+        else:
+            periods = -(-balance // payment)
+        end = month + min(periods, end - month)
+    elif kind == "返済額軽減型":
+        payment = reset_payment(balance, rate_pct, end - month, method)
+    else:
+        raise ValueError(f"unknown event: {kind}")
+
+    return (month, balance, rate_pct, payment, end)
+
+
+@app.function
+@functools.lru_cache(maxsize=SIM_CACHE_SIZE)
+def scenario_prefix(loan_man: float, rate_pct: float, years: int, method: str, events: tuple):
+    # イベント列を先頭から順に適用した途中結果 (events は月順のタプル)
+    # 先頭のイベントが同じシナリオ同士はここがキャッシュで共有されるので、
+    # 異なるイベント以降の月だけが計算し直される
+    # 戻り値: (区間の配列のタプル, 最後のイベント適用後の状態, 繰上げ返済額の dict)
+    if not events:
+        return (), scenario_start(loan_man, rate_pct, years, method), {}
+
+    segments, state, prepaid = scenario_prefix(loan_man, rate_pct, years, method, events[:-1])
+    event_month, kind, value = events[-1]
+    segment, state = advance_scenario(state, event_month, method)
+    before = state[1]
+    state = apply_scenario_event(state, kind, value, method)
+    if before != state[1]:
+        prepaid = {**prepaid, state[0]: prepaid.get(state[0], 0) + before - state[1]}
+    return segments + (segment,), state, prepaid
+
+
+@app.function
+@functools.lru_cache(maxsize=SIM_CACHE_SIZE)
+def build_scenario_schedule(
+    loan_man: float, rate_pct: float, years: int, method: str, events: tuple = (), output: str = "frame"
+):
+    # 繰上げ返済・金利変動シナリオの返済予定表 (ボーナス払いなし)
+    # output は build_schedule と同じ ("frame" / "columns")
+    # events: ((月, "金利変更", 新しい年利%), (月, "期間短縮型" or "返済額軽減型", 金額(万円)), ...)
+    # イベントはその月の返済の後に適用する
+    # 戻り値: (返済予定表, 総支払額, 利息合計)
+    events = tuple(sorted(events, key=lambda e: e[0]))
+    segments, state, prepaid = scenario_prefix(loan_man, rate_pct, years, method, events)
+    tail, state = advance_scenario(state, state[4], method)
+
+    month = np.concatenate([np.arange(m + 1, m + 1 + len(i), dtype=np.int64) for m, i, _, _ in segments + (tail,)])
+    interest = np.concatenate([i for _, i, _, _ in segments + (tail,)])
+    paid = np.concatenate([p for _, _, p, _ in segments + (tail,)])
+    remaining = np.concatenate([r for _, _, _, r in segments + (tail,)])
+
+    extra = np.zeros(len(month), dtype=np.int64)
+    for m, amount in prepaid.items():
+        hit = np.flatnonzero(month == m)
+        if hit.size:
+            extra[hit] = amount
+    # イベント月の残高は繰上げ返済後の値にする (以降の月は計算済み)
+    remaining = remaining - extra
+
+    total_int = int(interest.sum())
+    schedule = schedule_table({
+        "月": month,
+        "年": (month - 1) // 12 + 1,
+        "支払額": paid + interest,
+        "残高": remaining,
+        "利息": interest,
+        "繰上げ返済": extra,
+    }, output)
+    principal = int(Decimal(str(loan_man)) * Decimal("10000"))
+    return schedule, principal + total_int, total_int
+
+
+@app.function
+def compare_scenarios(loan_man: float, rate_pct: float, years: int, method: str, scenarios: dict, output: str = "frame"):
+    # 複数シナリオの比較表。scenarios: {シナリオ名: events}
+    # 利息軽減額は先頭のシナリオとの差
+    # output="columns" のときは列ごとのリストの dict (mo.ui.table にそのまま渡せる)
+    rows = []
+    for name, events in scenarios.items():
+        schedule, total_pay, total_int = build_scenario_schedule(
+            loan_man, rate_pct, years, method, tuple(events), output="columns"
+        )
+        periods = len(schedule["月"])
+        rows.append({
+            "シナリオ": name,
+            "返済期間": f"{periods // 12}年{periods % 12}ヶ月",
+            "初回返済額": int(schedule["支払額"][0]) if periods else 0,
+            "最終返済額": int(schedule["支払額"][-1]) if periods else 0,
+            "繰上げ返済額": int(schedule["繰上げ返済"].sum()),
+            "総支払額": total_pay,
+            "利息合計": total_int,
+        })
+    for row in rows:
+        row["利息軽減額"] = rows[0]["利息合計"] - row["利息合計"]
+
+    keys = list(rows[0]) if rows else []
+    return schedule_table({k: [row[k] for row in rows] for k in keys}, output)
+
+
+@app.function
+def schedule_with_year_totals(schedule: dict) -> dict:
+    # 返済予定表 (列ごとの配列の dict) の各年の後ろに「年計」行を差し込む (表の1ページ = 12ヶ月 + 年計)
+    # 残高は年末の値、それ以外の金額列は年間の合計。戻り値は列ごとのリストの dict
+    amount_cols = [c for c in schedule if c not in ("月", "年", "残高")]
+    year = np.asarray(schedule["年"])
+    n = len(year)
+    # 各年の最後の月・最初の月の位置 (年は1から昇順に並んでいる)
+    ends = np.flatnonzero(np.diff(year, append=year[-1] + 1)) if n else np.zeros(0, dtype=np.int64)
+    starts = np.concatenate(([0], ends[:-1] + 1)) if n else ends
+
+    # 年計行を差し込んだ後の、月次行と年計行の位置
+    month_pos = np.arange(n) + np.searchsorted(ends, np.arange(n))
+    total_pos = ends + np.arange(len(ends)) + 1
+
+    def interleave(monthly, totals):
+        out = np.empty(n + len(ends), dtype=np.int64)
+        out[month_pos] = monthly
+        out[total_pos] = totals
+        return out.tolist()
+
+    kind = np.full(n + len(ends), "月次", dtype=object)
+    kind[total_pos] = "年計"
+    table = {
+        "年": interleave(year, year[ends]),
+        "月": interleave(schedule["月"], np.asarray(schedule["月"])[ends]),
+        "区分": kind.tolist(),
+    }
+    for c in amount_cols:
+        col = np.asarray(schedule[c])
+        table[c] = interleave(col, np.add.reduceat(col, starts) if n else col)
+    table["残高"] = interleave(schedule["残高"], np.asarray(schedule["残高"])[ends])
+    return table
+
+
+@app.function
+def warm_simulation_cache(outputs=("columns", "frame")) -> None:
+    # 起動時に入力欄の初期値で計算しておき、最初の表示をキャッシュから返す
+    # ページの計算セルと同じ引数の形で呼ぶ (lru_cache は省略した引数を別のキーとして扱う)
+    # ページからは outputs=("columns",) で呼ぶ (pandas を読み込まない)
+    for output in outputs:
+        build_schedule(DEFAULT_LOAN_MAN, DEFAULT_RATE, DEFAULT_YEARS, DEFAULT_METHOD, 0, output=output)
 
 
 @app.cell
-def _(bonus_toggle_ui, mo, sim_data, total_int_val, total_pay):
+def _():
+    # 起動時に入力欄の初期値を計算しておく (最初の表示はキャッシュから返る)
+    # 計算セルより前に置くこと (依存の無いセル同士はファイルの順に実行される)
+    warm_simulation_cache(outputs=("columns",))
+    return
+
+
+@app.cell
+def _(
+    bonus_amount_ui,
+    bonus_toggle_ui,
+    interest_rate_ui,
+    loan_amount_ui,
+    method_ui,
+    years_ui,
+):
+    # ページでは pandas を読み込まないよう、列ごとの配列の dict で受け取る
+    sim_schedule, total_pay, total_int_val = build_schedule(
+        loan_amount_ui.value,
+        interest_rate_ui.value,
+        years_ui.value,
+        method_ui.value,
+        bonus_amount_ui.value if bonus_toggle_ui.value else 0,
+        output="columns"
+    )
+    return sim_schedule, total_int_val, total_pay
+
+
+@app.cell
+def _(bonus_toggle_ui, mo, sim_schedule, total_int_val, total_pay):
     # KPI表示 (画像で成功が確認できている手法を採用)
-    m_pay = sim_data[0]["支払額"]
-    b_add = (sim_data[5]["支払額"] - sim_data[4]["支払額"]) if (len(sim_data) >= 6 and bonus_toggle_ui.value) else 0
+    _pay = sim_schedule["支払額"]
+    m_pay = int(_pay[0])
+    b_add = int(_pay[5] - _pay[4]) if (len(_pay) >= 6 and bonus_toggle_ui.value) else 0
 
     def make_card(title, val, info, color):
         return f'''
@@ -221,13 +614,13 @@ def _(bonus_toggle_ui, mo, sim_data, total_int_val, total_pay):
 
 
 @app.cell
-def _(alt, mo, pd, sim_data):
+def _(alt, mo, sim_schedule):
     # グラフとテーブル (エラーの元になる .append() を排除)
-    _df = pd.DataFrame(sim_data)
-    _df_y = _df[_df['月'] % 12 == 0].copy()
+    # グラフは年末 (12ヶ月ごと) の行だけ。月は1から連番なので位置のスライスで取り出す
+    _year_end = {k: sim_schedule[k][11::12] for k in ("年", "残高")}
     
-    # Altairチャート
-    _chart = alt.Chart(_df_y).mark_area(
+    # Altairチャート (データは Vega-Lite のインライン values で渡す)
+    _chart = alt.Chart(alt.Data(values=columns_to_records(_year_end))).mark_area(
         line={'color':'#3b82f6'},
         color=alt.Gradient(
             gradient='linear',
@@ -237,16 +630,113 @@ def _(alt, mo, pd, sim_data):
     ).encode(
         x=alt.X("年:Q", title="経過年数"),
         y=alt.Y("残高:Q", title="残高 (円)"),
-        tooltip=["年", "残高"]
+        tooltip=["年:Q", "残高:Q"]
     ).properties(height=300, width="container")
 
     # 全ての要素を単一のリストとして vstack に渡す（最も安全な方法）
     mo.vstack([
         mo.md("### 📉 返済推移グラフ"),
         _chart,
-        mo.md("### 📅 返済予定表 (抜粋)"),
-        mo.ui.table(_df.head(24))
+        mo.md("### 📅 返済予定表 (1ページ = 1年分 + 年計)"),
+        # ページ送りのたびに表示中のページだけがカーネルから送られる
+        mo.ui.table(
+            schedule_with_year_totals(sim_schedule),
+            page_size=13,
+            selection=None,
+            show_column_summaries=False
+        )
+    ])
+    return
+
+
+@app.cell
+def _(mo):
+    # 繰上げ返済・金利変動シナリオの入力
+    prepay_amount_ui = mo.ui.number(label="繰上げ返済額 (万円)", start=0, stop=50000, step=10, value=300, full_width=True)
+    prepay_year_ui = mo.ui.slider(label="繰上げ返済の時期 (年後)", start=1, stop=49, value=10, full_width=True)
+    rate_step_toggle_ui = mo.ui.switch(label="途中で金利が変わる (変動金利)", value=False)
+    rate_step_year_ui = mo.ui.slider(label="金利が変わる時期 (年後)", start=1, stop=49, value=5, full_width=True)
+    rate_step_ui = mo.ui.number(label="変更後の年利 (%)", start=0.0, stop=20.0, step=0.001, value=1.5, full_width=True)
+
+    mo.vstack([
+        mo.md("### 🔁 繰上げ返済・金利変動シナリオ"),
+        mo.vstack([
+            prepay_amount_ui,
+            prepay_year_ui,
+            rate_step_toggle_ui,
+            rate_step_year_ui,
+            rate_step_ui
+        ], gap=1)
     ])
+    return (
+        prepay_amount_ui,
+        prepay_year_ui,
+        rate_step_toggle_ui,
+        rate_step_ui,
+        rate_step_year_ui,
+    )
+
+
+@app.cell
+def _(
+    alt,
+    bonus_toggle_ui,
+    interest_rate_ui,
+    loan_amount_ui,
+    method_ui,
+    mo,
+    prepay_amount_ui,
+    prepay_year_ui,
+    rate_step_toggle_ui,
+    rate_step_ui,
+    rate_step_year_ui,
+    years_ui,
+):
+    # シナリオ比較 (ボーナス払いなしの借入が対象)
+    if bonus_toggle_ui.value:
+        _view = mo.md("※ ボーナス払い利用時はシナリオ比較の対象外です")
+    else:
+        _base = ((rate_step_year_ui.value * 12, "金利変更", rate_step_ui.value),) if rate_step_toggle_ui.value else ()
+        _prepay_month = prepay_year_ui.value * 12
+        _scenarios = {
+            "繰上げ返済なし": _base,
+            "期間短縮型": _base + ((_prepay_month, "期間短縮型", prepay_amount_ui.value),),
+            "返済額軽減型": _base + ((_prepay_month, "返済額軽減型", prepay_amount_ui.value),),
+        }
+        _args = (loan_amount_ui.value, interest_rate_ui.value, years_ui.value, method_ui.value)
+        _scenario_table = compare_scenarios(*_args, _scenarios, output="columns")
+
+        # 年末残高の推移をシナリオごとに重ねる
+        _lines = []
+        for _name, _events in _scenarios.items():
+            _s = build_scenario_schedule(*_args, _events, output="columns")[0]
+            _year_end = _s["月"] % 12 == 0
+            _lines += columns_to_records({"シナリオ": [_name] * int(_year_end.sum()), "年": _s["年"][_year_end], "残高": _s["残高"][_year_end]})
+        _chart = alt.Chart(alt.Data(values=_lines)).mark_line().encode(
+            x=alt.X("年:Q", title="経過年数"),
+            y=alt.Y("残高:Q", title="残高 (円)"),
+            color=alt.Color("シナリオ:N", legend=alt.Legend(orient="bottom")),
+            tooltip=["シナリオ:N", "年:Q", alt.Tooltip("残高:Q", format=",")]
+        ).properties(height=300, width="container")
+
+        _view = mo.vstack([
+            mo.ui.table(_scenario_table, selection=None),
+            _chart
+        ])
+    _view
+    return
+
+
+@app.cell
+def _(mo, sim_schedule):
+    # 計算キャッシュのヒット/ミス数 (sim_schedule を参照して、計算のたびに表示を更新する)
+    _info = build_schedule.cache_info()
+    mo.accordion({
+        "🔧 計算キャッシュ": mo.md(
+            f"ヒット {_info.hits} 回 / ミス {_info.misses} 回"
+            f" (保持 {_info.currsize} / {_info.maxsize} 件、起動時の計算を含む。表示中の返済予定 {len(sim_schedule['月'])} ヶ月)"
+        )
+    })
     return
 
 
@@ -4,12 +4,32 @@ __generated_with = "0.10.9"
 app = marimo.App(width="medium")
 
 
+with app.setup:
+    from decimal import Decimal, ROUND_HALF_UP, localcontext
+    import functools
+    import json
+    import os
+    import numpy as np
+
+    # 計算結果キャッシュ (LRU) の上限件数
+    SIM_CACHE_SIZE = 256
+
+    # スライダーの初期値 (キャッシュの事前計算にも使う)
+    DEFAULT_MONTHLY = 30000
+    DEFAULT_YEARS = 20
+    DEFAULT_RATE = 5.0
+
+    # 事前計算したグリッド (python lookup_table.py で生成、ノートブックと同じフォルダに置く)
+    # sim_api / batch_cli などローカルで動かすとき用。サイトには載せない
+    # (18 MB を取りに行くより、ブラウザでもその場で計算する方が速い。無ければその場で計算する)
+    GROWTH_TABLE_FILE = "nisa_grid.bin"
+    GROWTH_TABLE_MAGIC = b"NISAGRD1"
+
+
 @app.cell
 def _():
     import marimo as mo
     import altair as alt
-    import pandas as pd
-    from decimal import Decimal, ROUND_HALF_UP
 
     # --- 設定・定数 ---
     APP_TITLE = "積立NISAシミュレーター"
@@ -21,60 +41,338 @@ def _():
     # カラーパレット
     COLOR_PRINCIPAL = "#0056b3"
     COLOR_PROFIT = "#28a745"
+    COLOR_BAND = "#fd7e14"
+
+    # モンテカルロ設定 (試行回数・乱数シード)
+    MC_PATHS = 10000
+    MC_SEED = 42
     
     return (
         APP_TITLE,
+        COLOR_BAND,
         COLOR_PRINCIPAL,
         COLOR_PROFIT,
-        Decimal,
         HEADER_IMAGE,
-        ROUND_HALF_UP,
+        MC_PATHS,
+        MC_SEED,
         alt,
         mo,
-        pd,
     )
 
 
-@app.cell
-def _(Decimal, ROUND_HALF_UP, pd):
-    # --- 計算ロジック ---
-    def calculate_asset_growth(monthly_yen: int, years: int, rate_pct: float) -> pd.DataFrame:
-        if years <= 0:
-            return pd.DataFrame()
-
-        # 高精度計算
-        d_monthly = Decimal(str(monthly_yen))
-        d_rate_annual = Decimal(str(rate_pct)) / Decimal("100")
-        d_rate_monthly = d_rate_annual / Decimal("12")
-        
-        months = int(years * 12)
+@app.function
+def asset_growth_rows_loop(monthly_yen: int, years: int, rate_pct: float) -> list:
+    # --- 計算ロジック (参照実装: 1ヶ月ずつ積み上げ) ---
+    # 高精度計算
+    d_monthly = Decimal(str(monthly_yen))
+    d_rate_annual = Decimal(str(rate_pct)) / Decimal("100")
+    d_rate_monthly = d_rate_annual / Decimal("12")
+    
+    months = int(years * 12)
+    data = []
+    
+    current_principal = Decimal("0")
+    current_total = Decimal("0")
+
+    # 0年目
+    data.append({"Year": 0, "Principal": 0, "Profit": 0, "Total": 0})
+
+    for m in range(1, months + 1):
+        current_principal += d_monthly
+        current_total = (current_total + d_monthly) * (Decimal("1") + d_rate_monthly)
+
+        if m % 12 == 0:
+            year = m // 12
+            principal_int = int(current_principal.quantize(Decimal("1."), rounding=ROUND_HALF_UP))
+            total_int = int(current_total.quantize(Decimal("1."), rounding=ROUND_HALF_UP))
+            profit_int = total_int - principal_int
+            
+            data.append({
+                "Year": year,
+                "Principal": principal_int,
+                "Profit": profit_int,
+                "Total": total_int
+            })
+            
+    return data
+
+
+@app.function
+def asset_growth_rows_closed(monthly_yen: int, years: int, rate_pct: float) -> list:
+    # --- 計算ロジック (高速版: 期首払い年金終価の公式で1年ずつ) ---
+    # 月利は参照実装と同じ精度(28桁)で作り、以降は桁を増やして丸め誤差を吸収する
+    d_monthly = Decimal(str(monthly_yen))
+    d_rate_annual = Decimal(str(rate_pct)) / Decimal("100")
+    d_rate_monthly = d_rate_annual / Decimal("12")
+
+    data = [{"Year": 0, "Principal": 0, "Profit": 0, "Total": 0}]
+
+    with localcontext() as ctx:
+        ctx.prec = 50
+        growth = Decimal("1") + d_rate_monthly
+        growth_year = growth ** 12
+        # FV = 積立額 × (1+r) × ((1+r)^n - 1) / r
+        factor = d_monthly * growth / d_rate_monthly if d_rate_monthly else None
+        compound = Decimal("1")
+
+        for year in range(1, int(years) + 1):
+            compound *= growth_year
+            if factor is None:
+                current_total = d_monthly * 12 * year
+            else:
+                current_total = factor * (compound - Decimal("1"))
+
+            principal_int = int((d_monthly * 12 * year).quantize(Decimal("1."), rounding=ROUND_HALF_UP))
+            total_int = int(current_total.quantize(Decimal("1."), rounding=ROUND_HALF_UP))
+
+            data.append({
+                "Year": year,
+                "Principal": principal_int,
+                "Profit": total_int - principal_int,
+                "Total": total_int
+            })
+
+    return data
+
+
+@app.function
+def growth_engine_fingerprint() -> str:
+    # 事前計算の元になった計算ロジックの版 (ソースが変わったら古い表は使わない)
+    import hashlib
+    import inspect
+
+    return hashlib.sha256(inspect.getsource(asset_growth_rows_closed).encode("utf-8")).hexdigest()
+
+
+@app.function
+def load_growth_table(path: str):
+    # 事前計算グリッドを memmap で開き、(ヘッダー, 総資産の int64 配列) を返す
+    # 配列の形は (利回り, 積立額, 経過年数 0..最大年数)。1つの (利回り, 積立額) の推移は連続した領域
+    # ファイルが無い・形式が違う・計算ロジックが変わった場合は None (その場で計算する)
+    # キャッシュはファイルの (パス, 更新時刻, サイズ) ごと。起動後に作り直した表もそのまま読まれる
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return open_growth_table(path, stat.st_mtime_ns, stat.st_size)
+
+
+@app.function
+@functools.lru_cache(maxsize=2)
+def open_growth_table(path: str, mtime_ns: int, size: int):
+    # load_growth_table の本体 (mtime_ns と size はキャッシュのキーにだけ使う)
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(GROWTH_TABLE_MAGIC)) != GROWTH_TABLE_MAGIC:
+                return None
+            header_len = int.from_bytes(f.read(4), "little")
+            header = json.loads(f.read(header_len))
+        if header["engine"] != growth_engine_fingerprint():
+            return None
+        table = np.memmap(path, dtype=header["dtype"], mode="r", offset=header["offset"], shape=tuple(header["shape"]))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return header, table
+
+
+@app.function
+def default_growth_table():
+    # ノートブックと同じフォルダの事前計算グリッド (__file__ が無い環境では None)
+    try:
+        folder = os.path.dirname(os.path.abspath(__file__))
+    except NameError:
+        return None
+    return load_growth_table(os.path.join(folder, GROWTH_TABLE_FILE))
+
+
+@app.function
+def lookup_growth_rows(monthly_yen: int, years: int, rate_pct: float):
+    # 事前計算グリッドから asset_growth_rows_closed と同じ行を返す。グリッド外なら None
+    # 利回りは 0.1 刻みの値と float として一致するものだけ (端数のある値はその場で計算する)
+    loaded = default_growth_table()
+    if loaded is None:
+        return None
+    header, table = loaded
+    monthly, rate_tenths = header["monthly"], header["rate_tenths"]
+
+    m_idx, m_rem = divmod(int(monthly_yen) - monthly["start"], monthly["step"])
+    tenths = round(float(rate_pct) * 10)
+    r_idx = tenths - rate_tenths["start"]
+    if (
+        m_rem or monthly_yen != int(monthly_yen) or not 0 <= m_idx < monthly["count"]
+        or tenths / 10 != rate_pct or not 0 <= r_idx < rate_tenths["count"]
+        or years != int(years) or not 1 <= years <= header["years"]
+    ):
+        return None
+
+    monthly_yen = int(monthly_yen)
+    totals = table[r_idx, m_idx, :int(years) + 1].tolist()
+    return [
+        {"Year": year, "Principal": monthly_yen * 12 * year, "Profit": total - monthly_yen * 12 * year, "Total": total}
+        for year, total in enumerate(totals)
+    ]
+
+
+@app.function
+def rows_to_columns(rows: list, keys: tuple) -> dict:
+    # 行の dict のリストを、列ごとのタプルの dict にする
+    return {k: tuple(r[k] for r in rows) for k in keys}
+
+
+@app.function
+def columns_to_records(columns: dict) -> list:
+    # 列の dict を Vega-Lite のインラインデータ (行の dict のリスト) にする
+    # ndarray の列は Python の数値に直す (JSON にそのまま書けるように)
+    keys = list(columns)
+    values = [c.tolist() if hasattr(c, "tolist") else c for c in columns.values()]
+    return [dict(zip(keys, row)) for row in zip(*values)]
+
+
+@app.function
+@functools.lru_cache(maxsize=SIM_CACHE_SIZE)
+def calculate_asset_growth(
+    monthly_yen: int, years: int, rate_pct: float, engine: str = "closed", output: str = "frame"
+):
+    # engine="loop" は従来の月次ループ。高速版との突き合わせ用に残している
+    # engine="live" は事前計算の表を使わず、常にその場で計算する
+    # output="frame": DataFrame (pandas はこのときだけ読み込む)
+    # output="columns": 列ごとのタプルの dict (WASM ページ用。pandas を使わない)
+    # 同じ引数なら同じオブジェクトを返す (キャッシュ共有のため書き換えないこと)
+    # ヒット/ミス数は calculate_asset_growth.cache_info() で確認できる
+    if output not in ("frame", "columns"):
+        raise ValueError(f"unknown output: {output}")
+
+    if years <= 0:
         data = []
-        
-        current_principal = Decimal("0")
-        current_total = Decimal("0")
-
-        # 0年目
-        data.append({"Year": 0, "Principal": 0, "Profit": 0, "Total": 0})
-
-        for m in range(1, months + 1):
-            current_principal += d_monthly
-            current_total = (current_total + d_monthly) * (Decimal("1") + d_rate_monthly)
-
-            if m % 12 == 0:
-                year = m // 12
-                principal_int = int(current_principal.quantize(Decimal("1."), rounding=ROUND_HALF_UP))
-                total_int = int(current_total.quantize(Decimal("1."), rounding=ROUND_HALF_UP))
-                profit_int = total_int - principal_int
-                
-                data.append({
-                    "Year": year,
-                    "Principal": principal_int,
-                    "Profit": profit_int,
-                    "Total": total_int
-                })
-                
-        return pd.DataFrame(data)
-    return calculate_asset_growth,
+    elif engine == "closed":
+        # グリッド上の入力は事前計算の表を引くだけ。それ以外はその場で計算する
+        data = lookup_growth_rows(monthly_yen, years, rate_pct) or asset_growth_rows_closed(monthly_yen, years, rate_pct)
+    elif engine == "live":
+        data = asset_growth_rows_closed(monthly_yen, years, rate_pct)
+    elif engine == "loop":
+        data = asset_growth_rows_loop(monthly_yen, years, rate_pct)
+    else:
+        raise ValueError(f"unknown engine: {engine}")
+
+    if output == "columns":
+        return rows_to_columns(data, ("Year", "Principal", "Profit", "Total"))
+
+    import pandas as pd
+    return pd.DataFrame(data)
+
+
+@app.function
+def warm_simulation_cache(outputs=("columns", "frame")) -> None:
+    # 起動時にスライダーの初期値で計算しておき、最初の表示をキャッシュから返す
+    # ページからは outputs=("columns",) で呼ぶ (pandas を読み込まない)
+    for output in outputs:
+        calculate_asset_growth(DEFAULT_MONTHLY, DEFAULT_YEARS, DEFAULT_RATE, output=output)
+
+
+@app.function
+def growth_factor_grid(rate_pct, max_years: int) -> np.ndarray:
+    # 積立額1円あたりの各年末の評価額 (利回り × 経過年数 0..max_years)
+    # float64 で計算するため、Decimal版とは円の端数が0.5付近のときに1円ずれることがある
+    rate_monthly = np.asarray(rate_pct, dtype=np.float64).reshape(-1, 1) / 100.0 / 12.0
+    months = np.arange(int(max_years) + 1, dtype=np.float64) * 12.0
+
+    growth = 1.0 + rate_monthly
+    safe_rate = np.where(rate_monthly == 0.0, 1.0, rate_monthly)
+    factor = growth * np.expm1(months * np.log1p(rate_monthly)) / safe_rate
+    return np.where(rate_monthly == 0.0, months, factor)
+
+
+@app.function
+def calculate_asset_growth_batch(monthly_yen, years, rate_pct, output: str = "frame"):
+    # --- 一括計算 (積立額 × 期間 × 利回り のグリッド) ---
+    # output="array": 総資産の ndarray (積立額, 利回り, 経過年数 0..max(years))
+    #   各年末の値は積立期間によらないので、期間 y の推移は [..., :y + 1] で取り出せる
+    # output="frame": calculate_asset_growth と同じ列を持つ縦持ちの DataFrame
+    # output="columns": "frame" と同じ列を ndarray の dict で返す (pandas を使わない)
+    if output not in ("array", "frame", "columns"):
+        raise ValueError(f"unknown output: {output}")
+
+    monthly = np.asarray(monthly_yen, dtype=np.int64).ravel()
+    horizons = np.asarray(years, dtype=np.int64).ravel()
+    rates = np.asarray(rate_pct, dtype=np.float64).ravel()
+
+    max_years = int(horizons.max()) if horizons.size else 0
+    factors = growth_factor_grid(rates, max_years)
+    totals = np.floor(monthly[:, None, None] * factors[None, :, :] + 0.5).astype(np.int64)
+
+    if output == "array":
+        return totals
+
+    # (積立額, 期間, 利回り) の組ごとに 0..期間 の行を展開する
+    horizons = horizons[horizons > 0]
+    m_idx, y_idx, r_idx = (
+        a.ravel() for a in np.meshgrid(
+            np.arange(monthly.size), np.arange(horizons.size), np.arange(rates.size), indexing="ij"
+        )
+    )
+    counts = horizons[y_idx] + 1
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    row_year = np.arange(int(counts.sum())) - starts
+    row_m = np.repeat(m_idx, counts)
+    row_r = np.repeat(r_idx, counts)
+
+    total = totals[row_m, row_r, row_year]
+    principal = monthly[row_m] * 12 * row_year
+    columns = {
+        "Monthly": monthly[row_m],
+        "Years": np.repeat(horizons[y_idx], counts),
+        "Rate": rates[row_r],
+        "Year": row_year,
+        "Principal": principal,
+        "Profit": total - principal,
+        "Total": total,
+    }
+    if output == "columns":
+        return columns
+
+    import pandas as pd
+    return pd.DataFrame(columns)
+
+
+@app.function
+def simulate_asset_percentiles(
+    monthly_yen: int,
+    years: int,
+    rate_pct: float,
+    volatility_pct: float,
+    n_paths: int = 10000,
+    seed: int = 42,
+    percentiles=(5, 50, 95),
+    output: str = "frame",
+):
+    # --- モンテカルロ (月次リターンが対数正規分布に従う場合) ---
+    # output は calculate_asset_growth と同じ ("frame" / "columns")
+    # 期待値が想定利回りと一致するよう、対数リターンの平均から σ²/2 を引く
+    # 全経路を保持せず、1年 (経路数 × 12ヶ月) ずつ進めて年末のパーセンタイルだけ残す
+    rng = np.random.default_rng(seed)
+    sigma = volatility_pct / 100.0 / np.sqrt(12.0)
+    drift = np.log1p(rate_pct / 100.0 / 12.0) - sigma ** 2 / 2.0
+
+    columns = [f"P{p:g}" for p in percentiles]
+    totals = np.zeros(int(n_paths))
+    data = [{"Year": 0, **{c: 0 for c in columns}}]
+
+    for year in range(1, int(years) + 1):
+        log_growth = drift + sigma * rng.standard_normal((totals.size, 12))
+        # 各月の積立額がその年末までに何倍になるか (後ろからの累積積)
+        tail_growth = np.exp(np.cumsum(log_growth[:, ::-1], axis=1))[:, ::-1]
+        totals = totals * tail_growth[:, 0] + monthly_yen * tail_growth.sum(axis=1)
+
+        bands = np.floor(np.percentile(totals, percentiles) + 0.5)
+        data.append({"Year": year, **{c: int(v) for c, v in zip(columns, bands)}})
+
+    if output == "columns":
+        return rows_to_columns(data, ("Year", *columns))
+    if output != "frame":
+        raise ValueError(f"unknown output: {output}")
+
+    import pandas as pd
+    return pd.DataFrame(data)
 
 
 @app.cell
@@ -115,53 +413,102 @@ def _(APP_TITLE, HEADER_IMAGE, mo):
 def _(mo):
     # --- UI: 入力フォーム ---
     input_monthly = mo.ui.slider(
-        start=1000, stop=300000, step=1000, value=30000, 
+        start=1000, stop=300000, step=1000, value=DEFAULT_MONTHLY, 
         label="毎月の積立額 (円)", 
         full_width=True
     )
     input_years = mo.ui.slider(
-        start=1, stop=50, step=1, value=20, 
+        start=1, stop=50, step=1, value=DEFAULT_YEARS, 
         label="積立期間 (年)", 
         full_width=True
     )
     input_rate = mo.ui.slider(
-        start=0.1, stop=15.0, step=0.1, value=5.0, 
+        start=0.1, stop=15.0, step=0.1, value=DEFAULT_RATE, 
         label="想定利回り (%)", 
         full_width=True
     )
+    input_montecarlo = mo.ui.switch(
+        label="値動きのブレを考慮する (モンテカルロ)",
+        value=False
+    )
+    input_volatility = mo.ui.slider(
+        start=1, stop=40, step=1, value=15, 
+        label="想定リスク (年率ボラティリティ %)", 
+        full_width=True
+    )
 
     input_section = mo.md("### 🛠 パラメーター設定")
-    return input_monthly, input_rate, input_section, input_years
+    return (
+        input_montecarlo,
+        input_monthly,
+        input_rate,
+        input_section,
+        input_volatility,
+        input_years,
+    )
 
 
 @app.cell
-def _(calculate_asset_growth, input_monthly, input_rate, input_years):
+def _():
+    # 起動時にスライダーの初期値を計算しておく (最初の表示はキャッシュから返る)
+    # 計算セルより前に置くこと (依存の無いセル同士はファイルの順に実行される)
+    warm_simulation_cache(outputs=("columns",))
+    return
+
+
+@app.cell
+def _(
+    MC_PATHS,
+    MC_SEED,
+    input_montecarlo,
+    input_monthly,
+    input_rate,
+    input_volatility,
+    input_years,
+):
     # --- データ処理 ---
-    df_result = calculate_asset_growth(
+    # ページでは pandas を読み込まないよう、列ごとの dict で受け取る
+    growth = calculate_asset_growth(
         input_monthly.value,
         input_years.value,
-        input_rate.value
+        input_rate.value,
+        output="columns"
     )
+
+    # モンテカルロ (OFFのときは空)
+    if input_montecarlo.value:
+        bands = simulate_asset_percentiles(
+            input_monthly.value,
+            input_years.value,
+            input_rate.value,
+            input_volatility.value,
+            n_paths=MC_PATHS,
+            seed=MC_SEED,
+            output="columns"
+        )
+    else:
+        bands = {}
     
-    if not df_result.empty:
-        last_rec = df_result.iloc[-1]
-        final_total = last_rec["Total"]
-        final_principal = last_rec["Principal"]
-        final_profit = last_rec["Profit"]
+    if growth["Year"]:
+        final_total = growth["Total"][-1]
+        final_principal = growth["Principal"][-1]
+        final_profit = growth["Profit"][-1]
     else:
         final_total = final_principal = final_profit = 0
-    return df_result, final_principal, final_profit, final_total, last_rec
+    return bands, final_principal, final_profit, final_total, growth
 
 
 @app.cell
 def _(
+    COLOR_BAND,
     COLOR_PRINCIPAL,
     COLOR_PROFIT,
     alt,
-    df_result,
+    bands,
     final_principal,
     final_profit,
     final_total,
+    growth,
     mo,
 ):
     # --- ビジュアライゼーション ---
@@ -198,32 +545,55 @@ def _(
         </div>
     </div>
     """
+    if bands:
+        stats_html += f"""
+    <div style="{sub_style} text-align: left; margin-top: 6px;">
+        変動ありの総資産 (90%区間): ¥{bands["P5"][-1]:,.0f} 〜 ¥{bands["P95"][-1]:,.0f} / 中央値 ¥{bands["P50"][-1]:,.0f}
+    </div>
+    """
     stats_section = mo.md(stats_html)
 
     # 2. グラフ描画（横スクロール対応）
-    if df_result.empty:
+    if not growth["Year"]:
         chart = mo.md("データがありません")
     else:
-        df_melt = df_result.melt(
-            id_vars=["Year"], value_vars=["Principal", "Profit"],
-            var_name="Type", value_name="Amount"
-        )
-        label_map = {"Principal": "元本", "Profit": "運用益"}
-        df_melt["Label"] = df_melt["Type"].map(label_map)
-
-        # ベースとなるグラフ
-        base_chart = alt.Chart(df_melt).mark_area(opacity=0.85).encode(
-            x=alt.X("Year", axis=alt.Axis(title="経過年数")),
-            y=alt.Y("Amount", axis=alt.Axis(format="~s", title="金額"), stack=True),
-            color=alt.Color("Type", scale=alt.Scale(domain=["Principal", "Profit"], range=[COLOR_PRINCIPAL, COLOR_PROFIT]), legend=None),
-            tooltip=["Year", "Label", alt.Tooltip("Amount", format=",")]
+        # ベースとなるグラフ (縦持ちへの変換と表示名は Vega-Lite の transform で行う)
+        base_chart = alt.Chart(alt.Data(values=columns_to_records(growth))).transform_fold(
+            ["Principal", "Profit"], as_=["Type", "Amount"]
+        ).transform_calculate(
+            Label="datum.Type === 'Principal' ? '元本' : '運用益'"
+        ).mark_area(opacity=0.85).encode(
+            x=alt.X("Year:Q", axis=alt.Axis(title="経過年数")),
+            y=alt.Y("Amount:Q", axis=alt.Axis(format="~s", title="金額"), stack=True),
+            color=alt.Color("Type:N", scale=alt.Scale(domain=["Principal", "Profit"], range=[COLOR_PRINCIPAL, COLOR_PROFIT]), legend=None),
+            tooltip=["Year:Q", "Label:N", alt.Tooltip("Amount:Q", format=",")]
         ).properties(
             width=350,  # 固定幅
             height=300
         )
 
         # コンポーネント化（スクロールラッパー）
-        chart_obj = mo.ui.altair_chart(base_chart)
+        if not bands:
+            chart_obj = mo.ui.altair_chart(base_chart)
+        else:
+            # モンテカルロの 5〜95% 帯と中央値を重ねる
+            band_data = alt.Data(values=columns_to_records(bands))
+            band_chart = alt.Chart(band_data).mark_area(opacity=0.25, color=COLOR_BAND).encode(
+                x="Year:Q",
+                y="P5:Q",
+                y2="P95:Q",
+                tooltip=[
+                    "Year:Q",
+                    alt.Tooltip("P5:Q", format=",", title="下位5%"),
+                    alt.Tooltip("P50:Q", format=",", title="中央値"),
+                    alt.Tooltip("P95:Q", format=",", title="上位5%")
+                ]
+            )
+            median_chart = alt.Chart(band_data).mark_line(color=COLOR_BAND, strokeDash=[4, 2]).encode(
+                x="Year:Q",
+                y="P50:Q"
+            )
+            chart_obj = mo.ui.altair_chart(base_chart + band_chart + median_chart, chart_selection=False)
         
         # 【重要】変数名を chart に統一して返す
         chart = mo.vstack([
@@ -237,16 +607,18 @@ def _(
             mo.md("</div>")
         ], gap=0)
 
-    return chart, df_melt, label_map, stats_section
+    return chart, stats_section
 
 
 @app.cell
 def _(
     chart,
     header_section,
+    input_montecarlo,
     input_monthly,
     input_rate,
     input_section,
+    input_volatility,
     input_years,
     mo,
     stats_section,
@@ -259,7 +631,9 @@ def _(
         mo.vstack([
             input_monthly,
             input_years,
-            input_rate
+            input_rate,
+            input_montecarlo,
+            input_volatility
         ], gap=1),
         mo.md("### 📊 シミュレーション結果"),
         stats_section,
@@ -270,6 +644,19 @@ def _(
     return app_layout,
 
 
+@app.cell
+def _(growth, mo):
+    # 計算キャッシュのヒット/ミス数 (growth を参照して、計算のたびに表示を更新する)
+    _info = calculate_asset_growth.cache_info()
+    mo.accordion({
+        "🔧 計算キャッシュ": mo.md(
+            f"ヒット {_info.hits} 回 / ミス {_info.misses} 回"
+            f" (保持 {_info.currsize} / {_info.maxsize} 件、起動時の計算を含む。表示中の推移 {len(growth['Year'])} 行)"
+        )
+    })
+    return
+
+
 @app.cell
 def _(mo):
     # 【CSS注入】スマホ完全対応版
@@ -4,18 +4,152 @@ __generated_with = "0.19.0"
 app = marimo.App(width="full")
 
 
+with app.setup:
+    from decimal import Decimal, ROUND_HALF_UP, localcontext
+    import functools
+
+    # 計算結果キャッシュ (LRU) の上限件数
+    SIM_CACHE_SIZE = 256
+
+    # スライダーの初期値 (キャッシュの事前計算にも使う)
+    DEFAULT_MONTHLY = 30000
+    DEFAULT_YEARS = 20
+    DEFAULT_RATE = 5.0
+
+
 @app.cell
 def _():
     import marimo as mo
     import altair as alt
-    import pandas as pd
-    from decimal import Decimal, ROUND_HALF_UP
 
     # 設定・定数
     COLOR_PRINCIPAL = "#0056b3"
     COLOR_PROFIT = "#28a745"
 
-    return COLOR_PRINCIPAL, COLOR_PROFIT, Decimal, ROUND_HALF_UP, alt, mo, pd
+    return COLOR_PRINCIPAL, COLOR_PROFIT, alt, mo
+
+
+@app.function
+def asset_growth_rows_loop(monthly_yen: int, years: int, rate_pct: float) -> list:
+    # --- 計算ロジック (参照実装: 1ヶ月ずつ積み上げ) ---
+    # 高精度計算
+    d_monthly = Decimal(str(monthly_yen))
+    d_rate_annual = Decimal(str(rate_pct)) / Decimal("100")
+    d_rate_monthly = d_rate_annual / Decimal("12")
+    
+    months = int(years * 12)
+    data = []
+    
+    current_principal = Decimal("0")
+    current_total = Decimal("0")
+
+    # 0年目
+    data.append({"Year": 0, "Principal": 0, "Profit": 0, "Total": 0})
+
+    for m in range(1, months + 1):
+        current_principal += d_monthly
+        current_total = (current_total + d_monthly) * (Decimal("1") + d_rate_monthly)
+
+        if m % 12 == 0:
+            year = m // 12
+            principal_int = int(current_principal.quantize(Decimal("1."), rounding=ROUND_HALF_UP))
+            total_int = int(current_total.quantize(Decimal("1."), rounding=ROUND_HALF_UP))
+            profit_int = total_int - principal_int
+            
+            data.append({
+                "Year": year,
+                "Principal": principal_int,
+                "Profit": profit_int,
+                "Total": total_int
+            })
+            
+    return data
+
+
+@app.function
+def asset_growth_rows_closed(monthly_yen: int, years: int, rate_pct: float) -> list:
+    # --- 計算ロジック (高速版: 期首払い年金終価の公式で1年ずつ) ---
+    # 月利は参照実装と同じ精度(28桁)で作り、以降は桁を増やして丸め誤差を吸収する
+    d_monthly = Decimal(str(monthly_yen))
+    d_rate_annual = Decimal(str(rate_pct)) / Decimal("100")
+    d_rate_monthly = d_rate_annual / Decimal("12")
+
+    data = [{"Year": 0, "Principal": 0, "Profit": 0, "Total": 0}]
+
+    with localcontext() as ctx:
+        ctx.prec = 50
+        growth = Decimal("1") + d_rate_monthly
+        growth_year = growth ** 12
+        # FV = 積立額 × (1+r) × ((1+r)^n - 1) / r
+        factor = d_monthly * growth / d_rate_monthly if d_rate_monthly else None
+        compound = Decimal("1")
+
+        for year in range(1, int(years) + 1):
+            compound *= growth_year
+            if factor is None:
+                current_total = d_monthly * 12 * year
+            else:
+                current_total = factor * (compound - Decimal("1"))
+
+            principal_int = int((d_monthly * 12 * year).quantize(Decimal("1."), rounding=ROUND_HALF_UP))
+            total_int = int(current_total.quantize(Decimal("1."), rounding=ROUND_HALF_UP))
+
+            data.append({
+                "Year": year,
+                "Principal": principal_int,
+                "Profit": total_int - principal_int,
+                "Total": total_int
+            })
+
+    return data
+
+
+@app.function
+def rows_to_columns(rows: list, keys: tuple) -> dict:
+    # 行の dict のリストを、列ごとのタプルの dict にする
+    return {k: tuple(r[k] for r in rows) for k in keys}
+
+
+@app.function
+def columns_to_records(columns: dict) -> list:
+    # 列の dict を Vega-Lite のインラインデータ (行の dict のリスト) にする
+    keys = list(columns)
+    return [dict(zip(keys, row)) for row in zip(*columns.values())]
+
+
+@app.function
+@functools.lru_cache(maxsize=SIM_CACHE_SIZE)
+def calculate_asset_growth(
+    monthly_yen: int, years: int, rate_pct: float, engine: str = "closed", output: str = "frame"
+):
+    # engine="loop" は従来の月次ループ。高速版との突き合わせ用に残している
+    # output="frame": DataFrame (pandas はこのときだけ読み込む)
+    # output="columns": 列ごとのタプルの dict (WASM ページ用。pandas を使わない)
+    # 同じ引数なら同じオブジェクトを返す (キャッシュ共有のため書き換えないこと)
+    # ヒット/ミス数は calculate_asset_growth.cache_info() で確認できる
+    if output not in ("frame", "columns"):
+        raise ValueError(f"unknown output: {output}")
+
+    if years <= 0:
+        data = []
+    elif engine == "closed":
+        data = asset_growth_rows_closed(monthly_yen, years, rate_pct)
+    elif engine == "loop":
+        data = asset_growth_rows_loop(monthly_yen, years, rate_pct)
+    else:
+        raise ValueError(f"unknown engine: {engine}")
+
+    if output == "columns":
+        return rows_to_columns(data, ("Year", "Principal", "Profit", "Total"))
+
+    import pandas as pd
+    return pd.DataFrame(data)
+
+
+@app.function
+def warm_simulation_cache() -> None:
+    # 起動時にスライダーの初期値で計算しておき、最初の表示をキャッシュから返す
+    calculate_asset_growth(DEFAULT_MONTHLY, DEFAULT_YEARS, DEFAULT_RATE, output="columns")
 
 
 @app.cell
@@ -33,15 +167,15 @@ def _(mo):
     # 入力フォーム
     # mo.flex を廃止し、堅牢な vstack に変更
     input_monthly = mo.ui.slider(
-        start=1000, stop=300000, step=100, value=30000, 
+        start=1000, stop=300000, step=100, value=DEFAULT_MONTHLY, 
         label="毎月の積立額 (円)", full_width=True
     )
     input_years = mo.ui.slider(
-        start=1, stop=50, step=1, value=20, 
+        start=1, stop=50, step=1, value=DEFAULT_YEARS, 
         label="積立期間 (年)", full_width=True
     )
     input_rate = mo.ui.slider(
-        start=0.1, stop=15.0, step=0.1, value=5.0, 
+        start=0.1, stop=15.0, step=0.1, value=DEFAULT_RATE, 
         label="想定利回り (%)", full_width=True
     )
 
@@ -53,50 +187,33 @@ def _(mo):
 
 
 @app.cell
-def _(Decimal, ROUND_HALF_UP, input_monthly, input_rate, input_years, mo, pd):
+def _():
+    # 起動時にスライダーの初期値を計算しておく (最初の表示はキャッシュから返る)
+    # 計算セルより前に置くこと (依存の無いセル同士はファイルの順に実行される)
+    warm_simulation_cache()
+    return
+
+
+@app.cell
+def _(input_monthly, input_rate, input_years, mo):
     # --- 計算ロジック ---
     # mo.status は維持 (v0.19.0準拠)
     with mo.status.spinner("資産推移をシミュレーション中..."):
-        monthly_yen = input_monthly.value
-        years = input_years.value
-        rate_pct = input_rate.value
+        # ページでは pandas を読み込まないよう、列ごとの dict で受け取る
+        growth = calculate_asset_growth(
+            input_monthly.value,
+            input_years.value,
+            input_rate.value,
+            output="columns"
+        )
 
-        if years <= 0:
-            df_result = pd.DataFrame()
+        if not growth["Year"]:
             final_total = final_principal = final_profit = 0
         else:
-            d_monthly = Decimal(str(monthly_yen))
-            d_rate_annual = Decimal(str(rate_pct)) / Decimal("100")
-            d_rate_monthly = d_rate_annual / Decimal("12")
-
-            months = int(years * 12)
-            data = []
-            current_principal = Decimal("0")
-            current_total = Decimal("0")
-
-            data.append({"Year": 0, "Principal": 0, "Profit": 0, "Total": 0})
-
-            for m in range(1, months + 1):
-                current_principal += d_monthly
-                current_total = (current_total + d_monthly) * (Decimal("1") + d_rate_monthly)
-
-                if m % 12 == 0:
-                    year = m // 12
-                    principal_int = int(current_principal.quantize(Decimal("1."), rounding=ROUND_HALF_UP))
-                    total_int = int(current_total.quantize(Decimal("1."), rounding=ROUND_HALF_UP))
-                    data.append({
-                        "Year": year,
-                        "Principal": principal_int,
-                        "Profit": total_int - principal_int,
-                        "Total": total_int
-                    })
-
-            df_result = pd.DataFrame(data)
-            last_rec = df_result.iloc[-1]
-            final_total = last_rec["Total"]
-            final_principal = last_rec["Principal"]
-            final_profit = last_rec["Profit"]
-    return df_result, final_principal, final_profit, final_total
+            final_total = growth["Total"][-1]
+            final_principal = growth["Principal"][-1]
+            final_profit = growth["Profit"][-1]
+    return final_principal, final_profit, final_total, growth
 
 
 @app.cell
@@ -131,22 +248,20 @@ def _(final_principal, final_profit, final_total, mo):
 
 
 @app.cell
-def _(COLOR_PRINCIPAL, COLOR_PROFIT, alt, df_result, mo):
+def _(COLOR_PRINCIPAL, COLOR_PROFIT, alt, growth, mo):
     # --- グラフ描画 (Responsive) ---
-    if df_result.empty:
+    if not growth["Year"]:
         chart_ui = mo.md("データがありません")
     else:
-        df_melt = df_result.melt(
-            id_vars=["Year"], value_vars=["Principal", "Profit"],
-            var_name="Type", value_name="Amount"
-        )
-
+        # 縦持ちへの変換は Vega-Lite の fold に任せる (pandas の melt を使わない)
         # width="container" は Altair の機能なので維持 (marimo依存ではないため安全)
-        base_chart = alt.Chart(df_melt).mark_area(opacity=0.85).encode(
-            x=alt.X("Year", title="経過年数"),
-            y=alt.Y("Amount", title="金額", stack=True),
-            color=alt.Color("Type", scale=alt.Scale(domain=["Principal", "Profit"], range=[COLOR_PRINCIPAL, COLOR_PROFIT]), legend=alt.Legend(title="内訳")),
-            tooltip=["Year", "Type", alt.Tooltip("Amount", format=",", title="金額")]
+        base_chart = alt.Chart(alt.Data(values=columns_to_records(growth))).transform_fold(
+            ["Principal", "Profit"], as_=["Type", "Amount"]
+        ).mark_area(opacity=0.85).encode(
+            x=alt.X("Year:Q", title="経過年数"),
+            y=alt.Y("Amount:Q", title="金額", stack=True),
+            color=alt.Color("Type:N", scale=alt.Scale(domain=["Principal", "Profit"], range=[COLOR_PRINCIPAL, COLOR_PROFIT]), legend=alt.Legend(title="内訳")),
+            tooltip=["Year:Q", "Type:N", alt.Tooltip("Amount:Q", format=",", title="金額")]
         ).properties(
             width="container",
             height=300
@@ -167,5 +282,18 @@ def _(chart_ui, input_section, kpi_section, mo):
     return
 
 
+@app.cell
+def _(growth, mo):
+    # 計算キャッシュのヒット/ミス数 (growth を参照して、計算のたびに表示を更新する)
+    _info = calculate_asset_growth.cache_info()
+    mo.accordion({
+        "🔧 計算キャッシュ": mo.md(
+            f"ヒット {_info.hits} 回 / ミス {_info.misses} 回"
+            f" (保持 {_info.currsize} / {_info.maxsize} 件、起動時の計算を含む。表示中の推移 {len(growth['Year'])} 行)"
+        )
+    })
+    return
+
+
 if __name__ == "__main__":
     app.run()
@@ -0,0 +1,287 @@
+import argparse
+import ast
+import contextlib
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench import REGRESSION_RATIO
+from cell_patch import block_kind
+
+# ==========================================
+# 1. 設定エリア
+# ==========================================
+# 1回目 (import を含むコールドスタート) の後に、全セルを実行し直す回数。セルごとの最小値を使う
+REPEAT = 5
+
+# これより短い差は誤差として扱う (秒)
+MIN_DIFF_SEC = 0.005
+
+# 1つのノートブックの実行にかける時間の上限 (秒)
+GATE_TIMEOUT_SEC = 120
+
+# ワーカーが結果を書き出す行の目印 (セルの print と混ざらないように)
+RESULT_MARKER = "@@NOTEBOOK_GATE@@"
+
+
+# ==========================================
+# 2. セルの実行 (サブプロセス側)
+# ==========================================
+def is_main_guard(node):
+    return isinstance(node, ast.If) and "__main__" in ast.unparse(node.test)
+
+
+def strip_app_decorators(node):
+    """@app.cell / @app.function だけを外す (functools.cache などは残す)"""
+    node.decorator_list = [
+        d for d in node.decorator_list
+        if not isinstance(d.func if isinstance(d, ast.Call) else d, ast.Attribute)
+        or (d.func if isinstance(d, ast.Call) else d).attr not in ("cell", "function", "class_definition")
+    ]
+    return node
+
+
+def load_program(code, filename):
+    """(モジュールとして先に実行する文, セルのリスト) に分ける。セル: {"index", "node", "args", "defines"}"""
+    tree = ast.parse(code, filename)
+    module, cells = [], []
+    index = 0
+    for node in tree.body:
+        kind = block_kind(node)
+        if kind is None:
+            if not is_main_guard(node):
+                module.append(node)
+            continue
+        if kind == "setup":
+            module.extend(node.body)
+        elif kind == "cell":
+            args = [a.arg for a in node.args.posonlyargs + node.args.args + node.args.kwonlyargs]
+            last = node.body[-1] if node.body else None
+            defines = []
+            if isinstance(last, ast.Return) and last.value is not None:
+                items = last.value.elts if isinstance(last.value, ast.Tuple) else [last.value]
+                defines = [item.id for item in items if isinstance(item, ast.Name)]
+            node = strip_app_decorators(node)
+            # コメントや空行だけの違いは同じセルとみなす
+            digest = hashlib.sha256(ast.dump(node).encode("utf-8")).hexdigest()[:16]
+            cells.append({"index": index, "node": node, "args": args, "defines": defines, "hash": digest})
+        else:
+            module.append(strip_app_decorators(node))
+        index += 1
+    return module, cells
+
+
+def execution_order(cells):
+    """セルの引数と return から決まる実行順 (同じ段ならファイルの順)"""
+    providers = {name: c["index"] for c in cells for name in c["defines"]}
+    done, order = set(), []
+    pending = list(cells)
+    while pending:
+        ready = [c for c in pending if all(providers.get(a) in done for a in c["args"])]
+        if not ready:
+            # 依存が解決できないセル (存在しない名前を受け取るもの) も順番に並べ、実行時にエラーにする
+            ready = pending[:1]
+        for c in ready:
+            done.add(c["index"])
+            order.append(c)
+            pending.remove(c)
+    return order
+
+
+def run_cell(cell, namespace, values):
+    """セルを1回実行し、(秒数, 状態, エラー) を返す。戻り値は values に入れる"""
+    missing = [a for a in cell["args"] if a not in values]
+    if missing:
+        return 0.0, "skipped", f"{', '.join(missing)} がありません"
+    local = {}
+    exec(compile(ast.Module([cell["node"]], []), namespace["__file__"], "exec"), namespace, local)
+    func = local[cell["node"].name]
+    t = time.perf_counter()
+    try:
+        result = func(*[values[a] for a in cell["args"]])
+    except Exception as e:
+        sec = time.perf_counter() - t
+        if type(e).__name__ == "MarimoStopError":
+            return sec, "stopped", None
+        return sec, "error", f"{type(e).__name__}: {e}"
+    sec = time.perf_counter() - t
+    if cell["defines"]:
+        result = result if isinstance(result, tuple) else (result,)
+        values.update(zip(cell["defines"], result))
+    return sec, "ok", None
+
+
+def run_notebook(path, repeat=REPEAT):
+    """ノートブックを既定のウィジェットの値で実行し、セルごとの時間と状態を返す
+
+    marimo のカーネルは使わず、setup と @app.function をモジュールとして実行してから、
+    セル関数を依存順に呼ぶ (スクリプトとして実行したときと同じく、ウィジェットは初期値)。
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        code = f.read()
+    namespace = {"__name__": "__notebook_gate__", "__file__": os.path.abspath(path)}
+    module, cells = load_program(code, path)
+    order = execution_order(cells)
+
+    report = {"setup_sec": 0.0, "setup_error": None, "cells": {}, "figures": None}
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink):
+        t = time.perf_counter()
+        try:
+            exec(compile(ast.Module(module, []), path, "exec"), namespace)
+        except Exception as e:
+            report["setup_error"] = f"{type(e).__name__}: {e}"
+        report["setup_sec"] = time.perf_counter() - t
+
+        for run in range(1 + (repeat if report["setup_error"] is None else 0)):
+            values = {}
+            for cell in order:
+                if report["setup_error"] is not None:
+                    break
+                sec, status, error = run_cell(cell, namespace, values)
+                entry = report["cells"].setdefault(
+                    cell["index"],
+                    {"hash": cell["hash"], "first_sec": sec, "sec": None, "status": status, "error": error},
+                )
+                if run > 0 and status == "ok":
+                    entry["sec"] = sec if entry["sec"] is None else min(entry["sec"], sec)
+
+    # matplotlib の閉じられていない図 (更新のたびに増えていればリーク)
+    pyplot = sys.modules.get("matplotlib.pyplot")
+    if pyplot is not None:
+        report["figures"] = len(pyplot.get_fignums())
+    report["cells"] = [{"index": i, **c} for i, c in sorted(report["cells"].items())]
+    return report
+
+
+# ==========================================
+# 3. 比較と判定 (呼び出し側)
+# ==========================================
+def measure_notebook(path, repeat=REPEAT, timeout=GATE_TIMEOUT_SEC):
+    """別プロセスでノートブックを実行した結果 (run_notebook の戻り値)。落ちたら setup_error に入れる"""
+    env = {**os.environ, "MPLBACKEND": "Agg"}
+    folder = os.path.dirname(os.path.abspath(path))
+    try:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", os.path.abspath(path), "--repeat", str(repeat)],
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            cwd=folder,
+            env=env,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        return {"setup_sec": 0.0, "setup_error": f"{timeout}秒以内に終わりませんでした", "cells": [], "figures": None}
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    detail = proc.stderr.strip().splitlines()[-1:] or [f"exit code {proc.returncode}"]
+    return {"setup_sec": 0.0, "setup_error": detail[0], "cells": [], "figures": None}
+
+
+def total_sec(report, key):
+    """全セルの合計。コールドスタート (first_sec) には setup と @app.function の実行 (import) も含める"""
+    return sum(c[key] or 0.0 for c in report["cells"]) + (report["setup_sec"] if key == "first_sec" else 0.0)
+
+
+def compare_reports(old, new, ratio=REGRESSION_RATIO):
+    """(エラー, 警告) のリスト。エラーがあれば書き込まない、警告は確認してから"""
+    errors, warnings = [], []
+    if new["setup_error"]:
+        errors.append(f"setup: {new['setup_error']}")
+    old_status = {c["index"]: c["status"] for c in old["cells"]}
+    for c in new["cells"]:
+        # 元から失敗していたセルはエラーにしない
+        if c["status"] in ("error", "skipped") and old_status.get(c["index"]) != c["status"]:
+            errors.append(f"CELL {c['index']}: {c['error']}")
+
+    for label, key in (("cold", "first_sec"), ("warm", "sec")):
+        before, after = total_sec(old, key), total_sec(new, key)
+        if before and after - before > MIN_DIFF_SEC and after / before >= ratio:
+            warnings.append(f"{label} run {before * 1000:.1f} ms -> {after * 1000:.1f} ms (x{after / before:.2f})")
+    if len(old["cells"]) == len(new["cells"]):
+        # セルごとの比較は中身が変わったセルだけ (変わっていないセルの差は測定の揺れ)
+        for o, n in zip(old["cells"], new["cells"]):
+            if o["hash"] != n["hash"] and o["sec"] and n["sec"] and n["sec"] - o["sec"] > MIN_DIFF_SEC and n["sec"] / o["sec"] >= ratio:
+                warnings.append(f"CELL {n['index']}: {o['sec'] * 1000:.1f} ms -> {n['sec'] * 1000:.1f} ms (x{n['sec'] / o['sec']:.2f})")
+    if (new["figures"] or 0) > (old["figures"] or 0):
+        warnings.append(f"matplotlib の図が閉じられずに残っています ({old['figures'] or 0} -> {new['figures']})")
+    return errors, warnings
+
+
+def gate_notebook(path, new_code, repeat=REPEAT, ratio=REGRESSION_RATIO):
+    """新しいコードを一時ファイルとして同じフォルダで実行し、今のファイルと比べる
+
+    戻り値: {"errors", "warnings", "old", "new"}。errors が空でなければ上書きしない。
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, candidate = tempfile.mkstemp(prefix=".gate_", suffix=".py", dir=folder)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(new_code)
+        old = measure_notebook(path, repeat) if os.path.exists(path) else {"setup_sec": 0.0, "setup_error": None, "cells": [], "figures": None}
+        new = measure_notebook(candidate, repeat)
+    finally:
+        os.remove(candidate)
+    errors, warnings = compare_reports(old, new, ratio)
+    return {"errors": errors, "warnings": warnings, "old": old, "new": new}
+
+
+def print_gate_report(gate, path):
+    old, new = gate["old"], gate["new"]
+    old_cells = {c["index"]: c for c in old["cells"]} if len(old["cells"]) == len(new["cells"]) else {}
+    print(f"🧪 {path}: {len(new['cells'])} cells (cold / warm, ms)")
+    for c in new["cells"]:
+        o = old_cells.get(c["index"])
+        before = f"{o['sec'] * 1000:>8.1f}" if o and o["sec"] is not None else f"{'-':>8}"
+        after = f"{c['sec'] * 1000:>8.1f}" if c["sec"] is not None else f"{'-':>8}"
+        print(f"  CELL {c['index']:>3} {c['first_sec'] * 1000:>8.1f} {before} -> {after}  {c['status']}")
+    print(
+        f"  total: cold {total_sec(old, 'first_sec') * 1000:.1f} -> {total_sec(new, 'first_sec') * 1000:.1f} ms, "
+        f"warm {total_sec(old, 'sec') * 1000:.1f} -> {total_sec(new, 'sec') * 1000:.1f} ms"
+        + (f", open figures {old['figures'] or 0} -> {new['figures']}" if new["figures"] is not None else "")
+    )
+    for error in gate["errors"]:
+        print(f"❌ {error}")
+    for warning in gate["warnings"]:
+        print(f"🐢 {warning}")
+
+
+# ==========================================
+# 4. メイン
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ノートブックを別プロセスで実行し、エラーとセルごとの時間を今の版と比べる")
+    parser.add_argument("notebook")
+    parser.add_argument("candidate", nargs="?", help="比べる新しい版 (省略時は notebook を測るだけ)")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--ratio", type=float, default=REGRESSION_RATIO, help="この倍率以上遅くなったら警告")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(RESULT_MARKER + json.dumps(run_notebook(args.notebook, args.repeat)))
+        return 0
+
+    if args.candidate:
+        with open(args.candidate, "r", encoding="utf-8") as f:
+            gate = gate_notebook(args.notebook, f.read(), args.repeat, args.ratio)
+    else:
+        report = measure_notebook(args.notebook, args.repeat)
+        gate = {"old": report, "new": report, "errors": [], "warnings": []}
+        if report["setup_error"]:
+            gate["errors"].append(f"setup: {report['setup_error']}")
+        gate["errors"] += [f"CELL {c['index']}: {c['error']}" for c in report["cells"] if c["status"] == "error"]
+    print_gate_report(gate, args.notebook)
+    return 1 if gate["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
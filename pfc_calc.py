@@ -4,14 +4,86 @@ __generated_with = "0.10.9"
 app = marimo.App(width="full")
 
 
+with app.setup:
+    from decimal import Decimal
+    import functools
+
+    # 計算結果キャッシュ (LRU) の上限件数
+    SIM_CACHE_SIZE = 256
+
+    # 入力欄の初期値 (キャッシュの事前計算にも使う)
+    DEFAULT_WEIGHT = 65.0
+    DEFAULT_BODY_FAT = 15.0
+    DEFAULT_ACTIVITY = "1.375"
+    DEFAULT_GOAL = "-500"
+    DEFAULT_PROTEIN_RATIO = 2.5
+    DEFAULT_FAT_PCT = 20
+
+    # 活動レベルと目的の選択肢 (表示名 -> 計算に使う値)。API / バッチの入力チェックでも使う
+    ACTIVITY_OPTIONS = {
+        "ほぼ運動しない (x1.2)": "1.2",
+        "週1-3回の運動 (x1.375)": "1.375",
+        "週3-5回の運動 (x1.55)": "1.55",
+        "週6-7回の運動 (x1.725)": "1.725",
+        "激しい運動/肉体労働 (x1.9)": "1.9"
+    }
+    GOAL_OPTIONS = {
+        "減量 (-500kcal)": "-500",
+        "維持 (±0kcal)": "0",
+        "増量 (+500kcal)": "500"
+    }
+
+
 @app.cell
 def _():
     import marimo as mo
     import altair as alt
-    import pandas as pd
-    from decimal import Decimal, ROUND_HALF_UP
-    import math
-    return Decimal, ROUND_HALF_UP, alt, math, mo, os, pd
+    return alt, mo
+
+
+@app.function
+@functools.lru_cache(maxsize=SIM_CACHE_SIZE)
+def calculate_pfc(weight: float, body_fat: float, activity: str, goal: str, protein_ratio: float, fat_pct: float) -> dict:
+    # 同じ入力なら同じ dict を返す (キャッシュ共有のため書き換えないこと)
+    # ヒット/ミス数は calculate_pfc.cache_info() で確認できる
+    # Decimal変換
+    w_d = Decimal(str(weight))
+    bf_d = Decimal(str(body_fat))
+    act_d = Decimal(str(activity))
+    goal_d = Decimal(str(goal))
+    p_ratio_d = Decimal(str(protein_ratio))
+    f_pct_d = Decimal(str(fat_pct))
+
+    # 基礎計算 (Katch-McArdle Formula)
+    lbm = w_d * (Decimal("1") - (bf_d / Decimal("100")))
+    bmr = Decimal("370") + (Decimal("21.6") * lbm)
+    tdee = bmr * act_d
+    target_cal = tdee + goal_d
+
+    # PFC計算
+    p_g = w_d * p_ratio_d
+    p_cal = p_g * Decimal("4")
+    
+    f_cal = target_cal * (f_pct_d / Decimal("100"))
+    f_g = f_cal / Decimal("9")
+    
+    c_cal = target_cal - p_cal - f_cal
+    if c_cal < 0: c_cal = Decimal("0")
+    c_g = c_cal / Decimal("4")
+
+    return {
+        "LBM": lbm, "BMR": bmr, "TDEE": tdee, "Target": target_cal,
+        "P_g": p_g, "P_cal": p_cal, "F_g": f_g, "F_cal": f_cal, "C_g": c_g, "C_cal": c_cal
+    }
+
+
+@app.function
+def warm_simulation_cache() -> None:
+    # 起動時に入力欄の初期値で計算しておき、最初の表示をキャッシュから返す
+    calculate_pfc(
+        DEFAULT_WEIGHT, DEFAULT_BODY_FAT, DEFAULT_ACTIVITY, DEFAULT_GOAL,
+        DEFAULT_PROTEIN_RATIO, DEFAULT_FAT_PCT
+    )
 
 
 @app.cell
@@ -91,27 +163,15 @@ def _(mo):
     # --- 入力フォーム ---
     
     # UI定義
-    weight = mo.ui.number(label="体重 (kg)", start=30, stop=150, step=0.1, value=65.0, full_width=True)
-    body_fat = mo.ui.number(label="体脂肪率 (%)", start=3, stop=50, step=0.1, value=15.0, full_width=True)
+    weight = mo.ui.number(label="体重 (kg)", start=30, stop=150, step=0.1, value=DEFAULT_WEIGHT, full_width=True)
+    body_fat = mo.ui.number(label="体脂肪率 (%)", start=3, stop=50, step=0.1, value=DEFAULT_BODY_FAT, full_width=True)
 
-    activity_options = {
-        "ほぼ運動しない (x1.2)": "1.2",
-        "週1-3回の運動 (x1.375)": "1.375",
-        "週3-5回の運動 (x1.55)": "1.55",
-        "週6-7回の運動 (x1.725)": "1.725",
-        "激しい運動/肉体労働 (x1.9)": "1.9"
-    }
-    activity = mo.ui.dropdown(options=activity_options, value="週1-3回の運動 (x1.375)", label="活動レベル", full_width=True)
+    activity = mo.ui.dropdown(options=ACTIVITY_OPTIONS, value="週1-3回の運動 (x1.375)", label="活動レベル", full_width=True)
 
-    goal_options = {
-        "減量 (-500kcal)": "-500",
-        "維持 (±0kcal)": "0",
-        "増量 (+500kcal)": "500"
-    }
-    goal = mo.ui.dropdown(options=goal_options, value="減量 (-500kcal)", label="目的", full_width=True)
+    goal = mo.ui.dropdown(options=GOAL_OPTIONS, value="減量 (-500kcal)", label="目的", full_width=True)
 
-    protein_ratio = mo.ui.slider(start=1.0, stop=4.0, step=0.1, value=2.5, label="タンパク質 (g/体重kg)", full_width=True)
-    fat_pct = mo.ui.slider(start=10, stop=40, step=1, value=20, label="脂質摂取率 (%)", full_width=True)
+    protein_ratio = mo.ui.slider(start=1.0, stop=4.0, step=0.1, value=DEFAULT_PROTEIN_RATIO, label="タンパク質 (g/体重kg)", full_width=True)
+    fat_pct = mo.ui.slider(start=10, stop=40, step=1, value=DEFAULT_FAT_PCT, label="脂質摂取率 (%)", full_width=True)
 
     # フォームレイアウト
     input_form = mo.accordion({
@@ -125,7 +185,7 @@ def _(mo):
     })
     
     return (
-        activity, activity_options, body_fat, fat_pct, goal, goal_options, 
+        activity, body_fat, fat_pct, goal, 
         input_form, protein_ratio, weight
     )
 
@@ -137,10 +197,18 @@ def _(input_form):
     return
 
 
+@app.cell
+def _():
+    # 起動時に入力欄の初期値を計算しておく (最初の表示はキャッシュから返る)
+    # 計算セルより前に置くこと (依存の無いセル同士はファイルの順に実行される)
+    warm_simulation_cache()
+    return
+
+
 @app.cell
 def _(
-    Decimal, ROUND_HALF_UP, activity, activity_options, body_fat, 
-    fat_pct, goal, goal_options, math, mo, protein_ratio, weight
+    activity, body_fat, 
+    fat_pct, goal, mo, protein_ratio, weight
 ):
     # --- 計算 & バリデーションロジック ---
 
@@ -161,40 +229,12 @@ def _(
     mo.stop(is_negative, mo.md('<div class="error-box">⚠️ 体重や体脂肪率は正の値を入力してください</div>'))
 
     # セキュリティ: 選択肢改ざんチェック
-    if act_val not in activity_options.values() or goal_val not in goal_options.values():
+    if act_val not in ACTIVITY_OPTIONS.values() or goal_val not in GOAL_OPTIONS.values():
         mo.stop(True, mo.md('<div class="error-box">⚠️ 不正なパラメータが検出されました</div>'))
 
     # 3. 計算実行
     try:
-        # Decimal変換
-        w_d = Decimal(str(w_val))
-        bf_d = Decimal(str(bf_val))
-        act_d = Decimal(str(act_val))
-        goal_d = Decimal(str(goal_val))
-        p_ratio_d = Decimal(str(p_ratio_val))
-        f_pct_d = Decimal(str(f_pct_val))
-
-        # 基礎計算 (Katch-McArdle Formula)
-        lbm = w_d * (Decimal("1") - (bf_d / Decimal("100")))
-        bmr = Decimal("370") + (Decimal("21.6") * lbm)
-        tdee = bmr * act_d
-        target_cal = tdee + goal_d
-
-        # PFC計算
-        p_g = w_d * p_ratio_d
-        p_cal = p_g * Decimal("4")
-        
-        f_cal = target_cal * (f_pct_d / Decimal("100"))
-        f_g = f_cal / Decimal("9")
-        
-        c_cal = target_cal - p_cal - f_cal
-        if c_cal < 0: c_cal = Decimal("0")
-        c_g = c_cal / Decimal("4")
-
-        results = {
-            "LBM": lbm, "BMR": bmr, "TDEE": tdee, "Target": target_cal,
-            "P_g": p_g, "P_cal": p_cal, "F_g": f_g, "F_cal": f_cal, "C_g": c_g, "C_cal": c_cal
-        }
+        results = calculate_pfc(w_val, bf_val, act_val, goal_val, p_ratio_val, f_pct_val)
         
     except Exception as e:
         # 計算エラー時は停止
@@ -205,7 +245,7 @@ def _(
 
 
 @app.cell
-def _(alt, mo, pd, results):
+def _(alt, mo, results):
     # --- 結果表示 & グラフ描画 ---
     
     # mo.stopを使っているので、ここに来る時点で results は正常値であることが保証されます
@@ -224,25 +264,29 @@ def _(alt, mo, pd, results):
         mo.md("---")
     ])
 
-    # 2. グラフデータ作成
-    df = pd.DataFrame([
+    # 2. グラフデータ作成 (Vega-Lite のインライン values。pandas は使わない)
+    pfc_records = [
         {"Nutrient": "タンパク質 (P)", "Calories": float(results['P_cal']), "Grams": float(results['P_g']), "Color": "#4c78a8"},
         {"Nutrient": "脂質 (F)", "Calories": float(results['F_cal']), "Grams": float(results['F_g']), "Color": "#e45756"},
         {"Nutrient": "炭水化物 (C)", "Calories": float(results['C_cal']), "Grams": float(results['C_g']), "Color": "#f58518"}
-    ])
+    ]
 
     # 3. ドーナツチャート作成
-    base = alt.Chart(df).encode(theta=alt.Theta("Calories", stack=True))
+    base = alt.Chart(alt.Data(values=pfc_records)).encode(theta=alt.Theta("Calories:Q", stack=True))
     
     pie = base.mark_arc(outerRadius=120, innerRadius=80).encode(
-        color=alt.Color("Nutrient", scale=alt.Scale(domain=df["Nutrient"], range=df["Color"]), legend=alt.Legend(title="栄養素", orient="bottom")),
-        order=alt.Order("Calories", sort="descending"),
-        tooltip=[alt.Tooltip("Nutrient", title="栄養素"), alt.Tooltip("Calories", format=".0f", title="kcal"), alt.Tooltip("Grams", format=".1f", title="g")]
+        color=alt.Color(
+            "Nutrient:N",
+            scale=alt.Scale(domain=[r["Nutrient"] for r in pfc_records], range=[r["Color"] for r in pfc_records]),
+            legend=alt.Legend(title="栄養素", orient="bottom")
+        ),
+        order=alt.Order("Calories:Q", sort="descending"),
+        tooltip=[alt.Tooltip("Nutrient:N", title="栄養素"), alt.Tooltip("Calories:Q", format=".0f", title="kcal"), alt.Tooltip("Grams:Q", format=".1f", title="g")]
     )
     
     text = base.mark_text(radius=140).encode(
-        text=alt.Text("Calories", format=".0f"),
-        order=alt.Order("Calories", sort="descending"),
+        text=alt.Text("Calories:Q", format=".0f"),
+        order=alt.Order("Calories:Q", sort="descending"),
         color=alt.value("black")
     )
     
@@ -274,5 +318,18 @@ def _(result_view):
     return
 
 
+@app.cell
+def _(mo, results):
+    # 計算キャッシュのヒット/ミス数 (results を参照して、計算のたびに表示を更新する)
+    _info = calculate_pfc.cache_info()
+    mo.accordion({
+        "🔧 計算キャッシュ": mo.md(
+            f"ヒット {_info.hits} 回 / ミス {_info.misses} 回"
+            f" (保持 {_info.currsize} / {_info.maxsize} 件、起動時の計算を含む。表示中の目標 {results['Target']:.0f} kcal)"
+        )
+    })
+    return
+
+
 if __name__ == "__main__":
     app.run()
\ No newline at end of file
@@ -0,0 +1,351 @@
+import argparse
+import ast
+import importlib.metadata
+import json
+import os
+import re
+import sys
+
+from packaging.requirements import Requirement
+
+# ==========================================
+# 1. 設定エリア
+# ==========================================
+# エクスポートした HTML の中で marimo の起動設定を代入している箇所
+MOUNT_MARKER = "window.__MARIMO_MOUNT_CONFIG__"
+
+# import 名と pip のパッケージ名が違うもの (インストールされていない環境用の控え)
+IMPORT_TO_PACKAGE = {
+    "PIL": "pillow",
+    "cv2": "opencv-python",
+    "sklearn": "scikit-learn",
+    "yaml": "pyyaml",
+}
+
+# Pyodide に最初から入っているモジュール (requirements に書かない)
+PYODIDE_BUILTINS = {"js", "pyodide", "micropip"}
+
+# 名前を使っていなくても、import すること自体に意味があるモジュール (フォント登録など)
+SIDE_EFFECT_IMPORTS = {"japanize_matplotlib"}
+
+# 依存関係の環境マーカーを評価するときの Pyodide の環境
+PYODIDE_MARKERS = {"extra": "", "sys_platform": "emscripten", "platform_system": "Emscripten"}
+
+
+# ==========================================
+# 2. requirements の導出
+# ==========================================
+def is_cell(node):
+    """@app.cell / @app.cell(...) で定義されたセルか"""
+    for deco in node.decorator_list:
+        target = deco.func if isinstance(deco, ast.Call) else deco
+        if isinstance(target, ast.Attribute) and target.attr == "cell":
+            return True
+    return False
+
+
+def used_names(tree):
+    """ノートブック内で参照されている名前
+
+    セルの引数は他のセルが定義した名前の参照になる。セル末尾の return は定義した名前を
+    公開しているだけなので参照に数えない。
+    """
+    exported = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.FunctionDef) and is_cell(node):
+            for stmt in node.body:
+                if isinstance(stmt, ast.Return) and stmt.value is not None:
+                    exported |= {id(n) for n in ast.walk(stmt.value) if isinstance(n, ast.Name)}
+
+    used = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.arg):
+            used.add(node.arg)
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and id(node) not in exported:
+            used.add(node.id)
+    return used
+
+
+def lazy_imports(tree):
+    """セル以外の関数 (@app.function など) の中にある import のノード
+
+    呼ばれたときに初めて実行されるので、ページの起動に必要なパッケージには数えない
+    (例: output="frame" のときだけ読み込む pandas)。
+    """
+    lazy = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and not is_cell(node):
+            lazy |= {id(n) for n in ast.walk(node) if isinstance(n, (ast.Import, ast.ImportFrom))}
+    return lazy
+
+
+def imported_modules(source):
+    """ノートブックの起動時に実際に使っている import のトップレベルのモジュール名 (出現順)
+
+    import しただけで名前を一度も使っていないものと、セル以外の関数の中の import は除く
+    (SIDE_EFFECT_IMPORTS は除外しない)。
+    """
+    with open(source, "rb") as f:
+        tree = ast.parse(f.read(), filename=source)
+    used = used_names(tree)
+    lazy = lazy_imports(tree)
+
+    modules = []
+    for node in ast.walk(tree):
+        if id(node) in lazy:
+            continue
+        if isinstance(node, ast.Import):
+            # import a.b は a、import a.b as c は c を束縛する
+            bound = [(alias.name, alias.asname or alias.name.split(".")[0]) for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            bound = [(node.module, alias.asname or alias.name) for alias in node.names]
+        else:
+            continue
+        for name, binding in bound:
+            top = name.split(".")[0]
+            if binding not in used and binding != "*" and top not in SIDE_EFFECT_IMPORTS:
+                continue
+            if top not in modules:
+                modules.append(top)
+    return modules
+
+
+def normalize(package):
+    """PEP 503 の正規化 (比較用)"""
+    return re.sub(r"[-_.]+", "-", package.split("==")[0]).lower()
+
+
+def package_dependencies(package, cache):
+    """インストール済みのメタデータから、Pyodide 上で一緒に入る依存パッケージ (再帰) を求める"""
+    key = normalize(package)
+    if key in cache:
+        return cache[key]
+    cache[key] = set()
+    try:
+        requires = importlib.metadata.requires(package.split("==")[0]) or []
+    except importlib.metadata.PackageNotFoundError:
+        return cache[key]
+
+    deps = set()
+    for line in requires:
+        req = Requirement(line)
+        if req.marker is not None and not req.marker.evaluate(PYODIDE_MARKERS):
+            continue
+        deps.add(normalize(req.name))
+        deps |= package_dependencies(req.name, cache)
+    cache[key] = deps
+    return deps
+
+
+def notebook_requirements(source, marimo_version):
+    """ノートブックの import から、ブラウザ側でインストールする最小のパッケージを求める
+
+    marimo はエクスポートに使ったバージョンに固定し、標準ライブラリと同じフォルダのモジュールは除く。
+    他のパッケージの依存として入るもの (pandas に対する numpy など) も書かない。
+    """
+    folder = os.path.dirname(os.path.abspath(source))
+    local = {os.path.splitext(n)[0] for n in os.listdir(folder) if n.endswith(".py")}
+    distributions = importlib.metadata.packages_distributions()
+
+    packages = []
+    for module in imported_modules(source):
+        if module == "marimo" or module in sys.stdlib_module_names or module in PYODIDE_BUILTINS or module in local:
+            continue
+        package = IMPORT_TO_PACKAGE.get(module) or distributions.get(module, [module])[0]
+        if package not in packages:
+            packages.append(package)
+
+    cache = {}
+    implied = set()
+    for package in packages:
+        implied |= package_dependencies(package, cache)
+    return [f"marimo=={marimo_version}"] + [p for p in packages if normalize(p) not in implied]
+
+
+# ==========================================
+# 3. マウント設定の書き換え
+# ==========================================
+def find_object_end(text, start, state=None):
+    """text[start] の "{" に対応する "}" の位置 (文字列中の括弧は数えない) と、続きを調べるための状態
+
+    まだ閉じていなければ位置は None。text を後ろに伸ばして状態を渡せば、調べ終わった所から再開する
+    (設定が何千行あっても行ごとに先頭から数え直さない)。
+    """
+    depth, in_string, escaped, begin = state or (0, False, False, start)
+    for i in range(begin, len(text)):
+        c = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return i, None
+    return None, (depth, in_string, escaped, len(text))
+
+
+def strip_trailing_commas(text):
+    """文字列の外にある ", }" / ", ]" のカンマを取り除く"""
+    out = []
+    in_string = False
+    escaped = False
+    pending_comma = None
+    for c in text:
+        if in_string:
+            out.append(c)
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+            continue
+        if pending_comma is not None:
+            if c.isspace():
+                pending_comma.append(c)
+                continue
+            if c not in "}]":
+                out.append(",")
+            out.extend(pending_comma)
+            pending_comma = None
+        if c == ",":
+            pending_comma = []
+            continue
+        if c == '"':
+            in_string = True
+        out.append(c)
+    if pending_comma is not None:
+        out.append(",")
+        out.extend(pending_comma)
+    return "".join(out)
+
+
+def scan_mount_config(lines, on_config):
+    """行を順に流しながらマウント設定を探し、見つけたら on_config(前, dict, 後) の戻り値で置き換える
+
+    HTML 全体をメモリに載せず、設定オブジェクトの部分だけをバッファする。
+    """
+    buffer = None
+    state = None
+    for line in lines:
+        if buffer is None:
+            if MOUNT_MARKER not in line:
+                yield line
+                continue
+            buffer = line
+        else:
+            buffer += line
+
+        brace = buffer.find("{", buffer.find(MOUNT_MARKER))
+        if brace < 0:
+            continue
+        end, state = find_object_end(buffer, brace, state)
+        if end is None:
+            continue
+        config = json.loads(strip_trailing_commas(buffer[brace:end + 1]))
+        yield on_config(buffer[:brace], config, buffer[end + 1:])
+        buffer = None
+
+    if buffer is not None:
+        raise ValueError(f"{MOUNT_MARKER} のオブジェクトが閉じていません")
+
+
+def read_mount_config(path):
+    """HTML に埋め込まれたマウント設定 (1つだけのはず) を読む"""
+    configs = []
+
+    def collect(before, config, after):
+        configs.append(config)
+        return ""
+
+    with open(path, "r", encoding="utf-8") as f:
+        for _ in scan_mount_config(f, collect):
+            pass
+    if len(configs) != 1:
+        raise ValueError(f"{path}: {MOUNT_MARKER} が {len(configs)} 個見つかりました (1個のはず)")
+    return configs[0]
+
+
+def update_mount_config(path, values):
+    """マウント設定のキーを values で置き換え、読み直して反映を確認する。失敗すれば ValueError
+
+    values のキーは設定の先頭に並べる (ほかのキーの順番はそのまま)。
+    """
+    count = 0
+
+    def update(before, config, after):
+        nonlocal count
+        count += 1
+        config = {**values, **{k: v for k, v in config.items() if k not in values}}
+        # "</script>" が文字列に入っていてもスクリプトが途中で閉じないようにする
+        body = json.dumps(config, ensure_ascii=False, indent=2).replace("</", "<\\/")
+        return before + body + after
+
+    tmp = path + ".tmp"
+    try:
+        with open(path, "r", encoding="utf-8") as src, open(tmp, "w", encoding="utf-8") as dst:
+            for chunk in scan_mount_config(src, update):
+                dst.write(chunk)
+        if count != 1:
+            raise ValueError(f"{path}: {MOUNT_MARKER} が {count} 個見つかりました (1個のはず)")
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    config = read_mount_config(path)
+    for key, value in values.items():
+        if config.get(key) != value:
+            raise ValueError(f"{path}: {key} が反映されていません")
+
+
+def inject_requirements(path, requirements):
+    """マウント設定の requirements を書き換え、読み直して反映を確認する。失敗すれば ValueError"""
+    update_mount_config(path, {"requirements": requirements})
+
+
+def postprocess_page(html_path, page, marimo_version):
+    """エクスポート直後の HTML に requirements を注入し、注入したリストを返す"""
+    requirements = page.get("requirements") or notebook_requirements(page["source"], marimo_version)
+    inject_requirements(html_path, requirements)
+    return requirements
+
+
+# ==========================================
+# 4. メイン
+# ==========================================
+def main(argv=None):
+    from build_factory import MANIFEST_FILE, load_json, marimo_version
+
+    parser = argparse.ArgumentParser(description="ビルド済みのページに requirements を注入し直す")
+    parser.add_argument("--manifest", default=MANIFEST_FILE)
+    parser.add_argument("--check", action="store_true", help="書き換えずに、注入済みかどうかだけ確認する")
+    args = parser.parse_args(argv)
+
+    version = marimo_version()
+    failed = 0
+    for page in load_json(args.manifest, {"pages": []})["pages"]:
+        try:
+            if args.check:
+                requirements = read_mount_config(page["output"]).get("requirements")
+                if not requirements:
+                    raise ValueError("requirements がありません")
+            else:
+                requirements = postprocess_page(page["output"], page, version)
+            print(f"✅ {page['output']}: {requirements}")
+        except (OSError, ValueError) as e:
+            failed += 1
+            print(f"❌ {page['output']}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
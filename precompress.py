@@ -0,0 +1,176 @@
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from asset_store import ASSET_MANIFEST_FILE, ASSETS_DIR, file_sha256, load_asset_manifest, mb
+from service_worker import STATIC_FILES, SW_FILE
+
+# ==========================================
+# 1. 設定エリア
+# ==========================================
+# 圧縮する拡張子 (png などの圧縮済み形式は対象外)
+# 対象は配信するファイルだけ (ページ、アセットマニフェストのチャンク、sw.js と公開ファイル)
+COMPRESSIBLE_EXTS = (".html", ".js", ".mjs", ".css", ".json", ".webmanifest", ".wasm", ".svg", ".ttf", ".map")
+
+# 事前圧縮なのでサイズ優先 (brotli は最高圧縮、gzip も最大レベル)
+BROTLI_QUALITY = 11
+GZIP_LEVEL = 9
+
+# 圧縮済みファイルの元ファイルのハッシュ (変わっていなければ再圧縮しない、コミットしない)
+STATE_FILE = ".compress_state.json"
+
+# 事前圧縮した兄弟ファイルの拡張子と Content-Encoding
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+
+# ==========================================
+# 2. 圧縮 (ワーカープロセス側)
+# ==========================================
+def compress_file(path):
+    """path の .br / .gz を書き出す。元より小さくならない形式は書かない (消す)"""
+    import brotli
+
+    with open(path, "rb") as f:
+        data = f.read()
+
+    variants = {
+        ".br": brotli.compress(data, quality=BROTLI_QUALITY),
+        # mtime=0 にして、同じ入力からは同じバイト列になるようにする
+        ".gz": gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0),
+    }
+    sizes = {}
+    for ext, body in variants.items():
+        if len(body) < len(data):
+            tmp = path + ext + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(body)
+            os.replace(tmp, path + ext)
+            sizes[ext] = len(body)
+        elif os.path.exists(path + ext):
+            os.remove(path + ext)
+    return path, len(data), sizes
+
+
+# ==========================================
+# 3. 対象ファイルの収集と差分判定 (メインプロセス側)
+# ==========================================
+def site_files(manifest):
+    """配信するファイルのうち圧縮対象のもの (拡張子で拾わず、アセットマニフェストから決める)
+
+    requirements.txt や nisa_grid.bin などトップレベルにあるだけのファイルは含めない。
+    """
+    files = list(manifest["pages"]) + [SW_FILE, *STATIC_FILES]
+    files += [os.path.join(ASSETS_DIR, n) for n in manifest["assets"]]
+    return sorted(f for f in set(files) if f.endswith(COMPRESSIBLE_EXTS) and os.path.isfile(f))
+
+
+def remove_orphans(state, keep):
+    """前回までに書いた .br / .gz のうち、配信対象でなくなったファイルの分を消す
+
+    消すのは STATE_FILE に記録した (このツールが書いた) ものだけ。
+    ユーザーが置いた clients.csv.gz などには触らない。
+    """
+    removed = 0
+    for path, entry in state.items():
+        if path in keep:
+            continue
+        for ext in entry["variants"]:
+            if os.path.exists(path + ext):
+                os.remove(path + ext)
+                removed += 1
+    return removed
+
+
+def precompress_site(manifest, workers=None, force=False):
+    """配信するファイルを事前圧縮し、(圧縮した件数, スキップした件数, 秒数) を返す"""
+    start = time.perf_counter()
+    state = {}
+    if os.path.exists(STATE_FILE):
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+
+    todo, skipped, digests = [], 0, {}
+    for path in site_files(manifest):
+        digest = file_sha256(path)
+        digests[path] = digest
+        entry = state.get(path)
+        # 元ファイルのハッシュが同じで、前回書いた兄弟ファイルが残っていればスキップ
+        if not force and entry and entry["sha256"] == digest and all(
+            os.path.exists(path + ext) for ext in entry["variants"]
+        ):
+            skipped += 1
+        else:
+            todo.append(path)
+
+    if todo:
+        # 大きいファイルから投入して、最後に1つだけ長く残るのを避ける
+        todo.sort(key=os.path.getsize, reverse=True)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path, _, sizes in pool.map(compress_file, todo, chunksize=4):
+                state[path] = {"sha256": digests[path], "variants": sorted(sizes)}
+
+    remove_orphans(state, digests)
+    state = {path: entry for path, entry in state.items() if path in digests}
+    with open(STATE_FILE, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1)
+    return len(todo), skipped, time.perf_counter() - start
+
+
+# ==========================================
+# 4. レポート (転送量の比較)
+# ==========================================
+def wire_size(path, encoding=None):
+    """encoding の兄弟ファイルがあればそのサイズ、無ければ元のサイズ"""
+    ext = ENCODINGS.get(encoding)
+    if ext and os.path.exists(path + ext):
+        return os.path.getsize(path + ext)
+    return os.path.getsize(path)
+
+
+def page_wire_bytes(output, chunks, encoding):
+    return wire_size(output, encoding) + sum(wire_size(os.path.join(ASSETS_DIR, n), encoding) for n in chunks)
+
+
+def print_wire_report(manifest):
+    """ページごとに、初回表示分と全チャンクの転送量を 非圧縮 / gzip / brotli で比べる"""
+    print("-" * 72)
+    print(f"{'page':<16} {'initial raw':>12} {'gzip':>12} {'br':>12} {'total raw':>12} {'total br':>12}")
+    for output, p in manifest["pages"].items():
+        all_chunks = p["initial"] + p["lazy"]
+        raw = page_wire_bytes(output, p["initial"], None)
+        gz = page_wire_bytes(output, p["initial"], "gzip")
+        br = page_wire_bytes(output, p["initial"], "br")
+        total_raw = page_wire_bytes(output, all_chunks, None)
+        total_br = page_wire_bytes(output, all_chunks, "br")
+        print(
+            f"{output:<16} {mb(raw):>12} {mb(gz):>12} {mb(br):>12} {mb(total_raw):>12} {mb(total_br):>12}"
+            f"  (-{1 - br / raw:.0%})"
+        )
+    print("-" * 72)
+
+
+# ==========================================
+# 5. メイン
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ビルド済みサイトの .br / .gz を書き出し、転送量を比較する")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="圧縮ワーカープロセス数")
+    parser.add_argument("--force", action="store_true", help="変更が無くても圧縮し直す")
+    args = parser.parse_args(argv)
+
+    manifest = load_asset_manifest()
+    if manifest is None:
+        print(f"⚠️ {ASSET_MANIFEST_FILE} がありません。build_factory.py を先に実行してください。")
+        return 1
+    done, skipped, elapsed = precompress_site(manifest, args.workers, args.force)
+    print(f"🗜️ Compressed {done} files, {skipped} unchanged ({elapsed:.1f}s)")
+    print_wire_report(manifest)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from postprocess import read_mount_config, update_mount_config
+
+# ==========================================
+# 1. 設定エリア
+# ==========================================
+# marimo がセルごとの出力と code_hash を保存している場所 (ノートブックと同じフォルダの下)
+SESSION_DIR = os.path.join("__marimo__", "session")
+
+
+# ==========================================
+# 2. セッションスナップショット
+# ==========================================
+def session_path(source):
+    """marimo と同じ規則のスナップショットの場所 (例: __marimo__/session/nisa_calc.py.json)"""
+    folder = os.path.dirname(os.path.abspath(source))
+    return os.path.join(folder, SESSION_DIR, f"{os.path.basename(source)}.json")
+
+
+def load_session(source):
+    path = session_path(source)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_session(source, session):
+    """marimo が書くのと同じ形式 (indent=2) で保存する"""
+    path = session_path(source)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(session, f, indent=2)
+    os.replace(tmp, path)
+
+
+def notebook_snapshot(source):
+    """ソースから今のセル一覧 (コードと code_hash) を作る。セルは実行しない"""
+    from marimo._convert.converters import MarimoConvert
+
+    with open(source, "r", encoding="utf-8") as f:
+        return MarimoConvert.from_py(f.read()).to_notebook_v1()
+
+
+def stale_cells(notebook, session, marimo_version):
+    """スナップショットが古くなっているセルの番号 (0始まり) のリスト。空なら最新
+
+    セルは順番で対応させ、code_hash が違うもの・増えたものを古いとみなす。
+    スナップショットが無いか、別の marimo で作ったものなら全セルが古い。
+    """
+    cells = notebook["cells"]
+    if not session or session.get("metadata", {}).get("marimo_version") != marimo_version:
+        return list(range(len(cells)))
+    saved = session["cells"]
+    stale = [i for i, cell in enumerate(cells) if i >= len(saved) or saved[i].get("code_hash") != cell["code_hash"]]
+    if len(saved) > len(cells) and not stale:
+        # セルが削除されただけでも、出力の並びがずれるので作り直す
+        stale = [len(cells) - 1]
+    return stale
+
+
+def render_snapshot(source):
+    """ノートブックを既定の入力値で一度実行し、(セッション, ノートブック) のスナップショットを返す
+
+    marimo export html はセルを実行した結果を静的 HTML のマウント設定に入れるので、それを読み出す。
+    """
+    workdir = tempfile.mkdtemp(prefix="prerender_")
+    out_html = os.path.join(workdir, "snapshot.html")
+    try:
+        proc = subprocess.run(
+            [sys.executable, "-m", "marimo", "export", "html", source, "-o", out_html],
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        if proc.returncode != 0 or not os.path.exists(out_html):
+            raise RuntimeError(proc.stderr.strip() or proc.stdout.strip() or f"exit code {proc.returncode}")
+        config = read_mount_config(out_html)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return config["session"], config["notebook"]
+
+
+def error_cells(session):
+    """出力がエラーになっているセルの id"""
+    return [
+        cell["id"] for cell in session["cells"]
+        if any(output.get("type") == "error" for output in cell.get("outputs", []))
+    ]
+
+
+def ensure_snapshot(source, marimo_version, refresh=False):
+    """最新のスナップショットを返す。古ければ実行し直して __marimo__/session に保存する
+
+    戻り値: (セッション, ノートブック, 作り直したセル数)
+    """
+    notebook = notebook_snapshot(source)
+    session = load_session(source)
+    stale = list(range(len(notebook["cells"]))) if refresh else stale_cells(notebook, session, marimo_version)
+    if stale:
+        session, notebook = render_snapshot(source)
+        save_session(source, session)
+        return session, notebook, len(stale)
+
+    # 最新なら実行しない。セル id はスナップショット側のもの (marimo が順番から決める) を使う
+    for cell, saved in zip(notebook["cells"], session["cells"]):
+        cell["id"] = saved["id"]
+    return session, notebook, 0
+
+
+# ==========================================
+# 3. ページへの埋め込み
+# ==========================================
+def prerender_page(html_path, page, marimo_version):
+    """エクスポート直後の HTML に最初の表示用の出力を埋め込み、計測用の情報を返す
+
+    marimo のフロントエンドはマウント設定の session / notebook を code_hash で突き合わせて
+    カーネルの起動前から出力を表示し、Pyodide が動き出したらセルの実行結果で置き換える。
+    エラーになったセルがあるときは埋め込まない (壊れた画面を先に見せないため)。
+    """
+    if page.get("prerender") is False:
+        return {"first_paint": "off"}
+
+    session, notebook, refreshed = ensure_snapshot(page["source"], marimo_version)
+    errors = error_cells(session)
+    if errors:
+        return {"first_paint": f"skipped (error in {', '.join(errors)})", "refreshed": refreshed}
+
+    update_mount_config(html_path, {"notebook": notebook, "session": session})
+    return {"first_paint": f"{len(session['cells'])} cells", "refreshed": refreshed}
+
+
+# ==========================================
+# 4. メイン
+# ==========================================
+def main(argv=None):
+    from build_factory import MANIFEST_FILE, load_json, marimo_version
+
+    parser = argparse.ArgumentParser(description="ページの最初の表示に使うセッションスナップショットを確認・更新する")
+    parser.add_argument("pages", nargs="*", help="対象のページ (省略時はマニフェストの全ページ)")
+    parser.add_argument("--manifest", default=MANIFEST_FILE)
+    parser.add_argument("--check", action="store_true", help="更新せず、古いスナップショットがあれば終了コード1")
+    parser.add_argument("--refresh", action="store_true", help="最新でも実行し直す")
+    args = parser.parse_args(argv)
+
+    version = marimo_version()
+    pages = load_json(args.manifest, {"pages": []})["pages"]
+    if args.pages:
+        pages = [p for p in pages if p["output"] in args.pages or p["source"] in args.pages]
+
+    outdated = 0
+    for page in pages:
+        source = page["source"]
+        if args.check:
+            stale = stale_cells(notebook_snapshot(source), load_session(source), version)
+            if stale:
+                outdated += 1
+                print(f"⚠️ {source}: {len(stale)} cell(s) changed since the last snapshot")
+            else:
+                print(f"✅ {source}: up to date")
+            continue
+        try:
+            session, _, refreshed = ensure_snapshot(source, version, refresh=args.refresh)
+        except (OSError, RuntimeError, ValueError) as e:
+            outdated += 1
+            print(f"❌ {source}: {e}")
+            continue
+        errors = error_cells(session)
+        mark = f" ⚠️ errors in {', '.join(errors)}" if errors else ""
+        status = f"regenerated ({refreshed} stale cells)" if refreshed else "up to date"
+        print(f"✅ {source}: {status}{mark}")
+    return 1 if outdated else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
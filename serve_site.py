@@ -0,0 +1,137 @@
+import argparse
+import email.utils
+import mimetypes
+import os
+import re
+import sys
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from precompress import ENCODINGS
+
+# ==========================================
+# 1. 設定エリア
+# ==========================================
+# Vite が付けるハッシュ付きファイル名 (例: index-CGfe1Tpd.js)。中身が変われば名前も変わる
+HASHED_NAME = re.compile(r"-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+# HTML などは毎回検証させる (ETag が同じなら 304)
+CACHE_REVALIDATE = "no-cache"
+
+# 優先する順 (サーバー側の好み)
+ENCODING_PREFERENCE = ("br", "gzip")
+
+mimetypes.add_type("application/wasm", ".wasm")
+mimetypes.add_type("text/javascript", ".js")
+mimetypes.add_type("text/javascript", ".mjs")
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+
+
+# ==========================================
+# 2. コンテンツネゴシエーション
+# ==========================================
+def accepted_encodings(header):
+    """Accept-Encoding を {encoding: q} にする (q=0 は拒否)"""
+    accepted = {}
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    return accepted
+
+
+def choose_variant(path, header):
+    """(実際に返すファイル, Content-Encoding) を選ぶ"""
+    accepted = accepted_encodings(header)
+    for encoding in ENCODING_PREFERENCE:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        candidate = path + ENCODINGS[encoding]
+        if q > 0 and os.path.isfile(candidate):
+            return candidate, encoding
+    return path, None
+
+
+def cache_control(url_path):
+    if "/assets/" in url_path and HASHED_NAME.search(url_path):
+        return CACHE_IMMUTABLE
+    return CACHE_REVALIDATE
+
+
+# ==========================================
+# 3. サーバー
+# ==========================================
+class SiteHandler(SimpleHTTPRequestHandler):
+    """事前圧縮した .br / .gz を Accept-Encoding に応じて返す静的ファイルサーバー"""
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            if not self.path.split("?", 1)[0].endswith("/"):
+                # ディレクトリは末尾スラッシュ付きにリダイレクト (標準の動きに任せる)
+                return super().send_head()
+            path = os.path.join(path, "index.html")
+        # .br / .gz を直接取りに来たものはそのまま返す
+        if not os.path.isfile(path) or path.endswith(tuple(ENCODINGS.values())):
+            return super().send_head()
+
+        file_path, encoding = choose_variant(path, self.headers.get("Accept-Encoding"))
+        stat = os.stat(file_path)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+
+        if etag in (self.headers.get("If-None-Match") or ""):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_common_headers(etag)
+            self.end_headers()
+            return None
+
+        f = open(file_path, "rb")
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(stat.st_size))
+        self.send_header("Last-Modified", email.utils.formatdate(stat.st_mtime, usegmt=True))
+        self.send_common_headers(etag)
+        self.end_headers()
+        return f
+
+    def send_common_headers(self, etag):
+        self.send_header("ETag", etag)
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Cache-Control", cache_control(self.path.split("?", 1)[0]))
+
+
+# ==========================================
+# 4. メイン
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ビルド済みサイトを事前圧縮ファイル付きで配信する")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--directory", default=".", help="配信するディレクトリ")
+    args = parser.parse_args(argv)
+
+    def handler(*handler_args, **kwargs):
+        return SiteHandler(*handler_args, directory=args.directory, **kwargs)
+
+    with ThreadingHTTPServer((args.host, args.port), handler) as server:
+        print(f"🌐 Serving {os.path.abspath(args.directory)} at http://{args.host}:{args.port}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import urllib.request
+
+from asset_store import ASSETS_DIR, file_sha256, load_asset_manifest
+
+# ==========================================
+# 1. 設定エリア
+# ==========================================
+SW_FILE = "sw.js"
+
+# ページに差し込む登録スクリプト (最初の表示と競合しないよう load の後に登録する)
+REGISTER_MARKER = "data-sw-register"
+REGISTER_SNIPPET = (
+    f'<script {REGISTER_MARKER}>if ("serviceWorker" in navigator && location.protocol !== "file:") '
+    f'{{ window.addEventListener("load", () => navigator.serviceWorker.register("./{SW_FILE}")); }}</script>'
+)
+
+# HTML 以外に事前キャッシュする公開ファイル (インストール可能にするためのアイコンなど)
+STATIC_FILES = (
+    "manifest.json", "site.webmanifest", "favicon.ico", "favicon-16x16.png", "favicon-32x32.png",
+    "apple-touch-icon.png", "android-chrome-192x192.png", "android-chrome-512x512.png", "logo.png",
+)
+
+# Pyodide の配布元 (marimo のワーカーと同じ URL の組み立て方)
+PYODIDE_CDN = "https://cdn.jsdelivr.net/pyodide/v{version}/full/"
+PYODIDE_LOCK_URL = "https://wasm.marimo.app/pyodide-lock.json?v={marimo}&pyodide=v{version}"
+PYODIDE_CORE_FILES = ("pyodide.asm.js", "pyodide.asm.wasm", "python_stdlib.zip")
+
+# ビルド時に取得した lock ファイルの控え (コミットしない)。取れなければ実行時のキャッシュに任せる
+PYODIDE_LOCK_CACHE = ".pyodide_lock.json"
+
+# URL にバージョンが入っていて中身が変わらない配布元 (キャッシュ優先でよい)
+IMMUTABLE_PREFIXES = ("https://cdn.jsdelivr.net/pyodide/", "https://files.pythonhosted.org/", "https://wasm.marimo.app/")
+
+# marimo のワーカーから Pyodide のバージョンと起動時に読むパッケージを読み取る
+WORKER_PREFIX = "worker-"
+PYODIDE_VERSION_VAR = re.compile(r"`v\$\{(\w+)\}`")
+BOOTSTRAP_PACKAGES = re.compile(r"loadPyodideAndPackages.*?packages:\[([^\]]*)\]", re.S)
+
+SW_TEMPLATE = """// service_worker.py が生成したファイル。直接編集しない
+const CONFIG = __CONFIG__;
+const PRECACHE = `precache-${CONFIG.version}`;
+const RUNTIME = `runtime-${CONFIG.version}`;
+const KEEP = new Set(CONFIG.assets.map((url) => new URL(url, self.location).href));
+const HTML = new Set(CONFIG.html.map((url) => new URL(url, self.location).href));
+// このバージョンが使うファイル (古いキャッシュから引き継いでよいのはこれだけ)
+const CURRENT = new Set([...KEEP, ...CONFIG.precache.map((url) => new URL(url, self.location).href)]);
+
+const isImmutable = (url) =>
+  KEEP.has(url) || CONFIG.immutable.some((prefix) => url.startsWith(prefix));
+
+// 不変のファイルは前のバージョンのキャッシュにあれば使い回す。HTML などは必ず取り直す
+async function precacheResponse(url) {
+  if (isImmutable(url)) {
+    const cached = await caches.match(url);
+    if (cached) return cached;
+  }
+  const response = await fetch(url, { cache: "no-cache" });
+  if (!response.ok) throw new Error(`${url}: ${response.status}`);
+  return response;
+}
+
+self.addEventListener("install", (event) => {
+  event.waitUntil((async () => {
+    const cache = await caches.open(PRECACHE);
+    await Promise.all(CONFIG.precache.map(async (url) => {
+      const href = new URL(url, self.location).href;
+      try {
+        await cache.put(href, await precacheResponse(href));
+      } catch (error) {
+        // 外部の配布元が落ちていてもインストールは続ける (ページが読んだ時点で実行時のキャッシュに入る)
+        if (href.startsWith(self.location.origin)) throw error;
+        console.warn("precache skipped", error);
+      }
+    }));
+    await self.skipWaiting();
+  })());
+});
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil((async () => {
+    // 古いバージョンのキャッシュから、このバージョンも使う不変のファイルだけ引き継いで捨てる
+    // (古い Pyodide やパッケージは CDN の URL でも引き継がない。必要になれば実行時に取り直す)
+    const precache = await caches.open(PRECACHE);
+    const runtime = await caches.open(RUNTIME);
+    for (const name of await caches.keys()) {
+      if (name === PRECACHE || name === RUNTIME) continue;
+      const old = await caches.open(name);
+      for (const request of await old.keys()) {
+        if (CURRENT.has(request.url) && isImmutable(request.url) && !(await precache.match(request)) && !(await runtime.match(request))) {
+          await runtime.put(request, await old.match(request));
+        }
+      }
+      await caches.delete(name);
+    }
+    await self.clients.claim();
+  })());
+});
+
+// HTML: キャッシュをすぐ返し、裏で取り直して次回に反映する
+async function staleWhileRevalidate(event, request) {
+  const cache = await caches.open(PRECACHE);
+  const key = request.mode === "navigate" ? new URL(request.url).pathname.replace(/\\/$/, "/index.html") : request;
+  const cached = await cache.match(key, { ignoreSearch: true });
+  const refresh = fetch(request).then((response) => {
+    if (response.ok) return cache.put(key, response.clone()).then(() => response);
+    return response;
+  });
+  if (cached) {
+    event.waitUntil(refresh.catch(() => undefined));
+    return cached;
+  }
+  return refresh;
+}
+
+// ハッシュ付きのチャンクや Pyodide のパッケージ: キャッシュにあればネットワークに出ない
+async function cacheFirst(request) {
+  const cached = await caches.match(request);
+  if (cached) return cached;
+  const response = await fetch(request);
+  if (response.ok || response.type === "opaque") {
+    const cache = await caches.open(RUNTIME);
+    await cache.put(request, response.clone());
+  }
+  return response;
+}
+
+self.addEventListener("fetch", (event) => {
+  const { request } = event;
+  if (request.method !== "GET") return;
+  const url = new URL(request.url);
+  const href = url.origin + url.pathname;
+
+  if (request.mode === "navigate" || HTML.has(href)) {
+    event.respondWith(staleWhileRevalidate(event, request));
+  } else if (isImmutable(request.url) || (url.origin === self.location.origin && url.pathname.includes("/assets/"))) {
+    event.respondWith(cacheFirst(request));
+  } else if (url.origin === self.location.origin) {
+    event.respondWith(staleWhileRevalidate(event, request));
+  }
+});
+"""
+
+
+# ==========================================
+# 2. Pyodide の事前キャッシュ対象
+# ==========================================
+def detect_pyodide(asset_names):
+    """marimo のワーカーチャンクから (Pyodide のバージョン, 起動時に読むパッケージ) を読み取る"""
+    for name in sorted(asset_names):
+        if not name.startswith(WORKER_PREFIX) or not name.endswith(".js"):
+            continue
+        with open(os.path.join(ASSETS_DIR, name), "r", encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        var = PYODIDE_VERSION_VAR.search(text)
+        version = var and re.search(rf"\b{var.group(1)}=`([0-9.]+)`", text)
+        packages = BOOTSTRAP_PACKAGES.search(text)
+        if version and packages:
+            # `marimo-base` は関数呼び出しで入るので、文字列のものだけ拾ってから足す
+            names = re.findall(r"`([A-Za-z0-9_.\-]+)`", packages.group(1))
+            return version.group(1), sorted(set(names) | {"marimo-base"})
+    return None, []
+
+
+def load_pyodide_lock(url):
+    """lock ファイルを取得する (控えがあればそれを使う)。取れなければ None"""
+    cached = None
+    if os.path.exists(PYODIDE_LOCK_CACHE):
+        with open(PYODIDE_LOCK_CACHE, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("url") == url:
+            return cached["lock"]
+    try:
+        with urllib.request.urlopen(url, timeout=20) as response:
+            lock = json.load(response)
+    except (OSError, ValueError):
+        return None
+    with open(PYODIDE_LOCK_CACHE, "w", encoding="utf-8") as f:
+        json.dump({"url": url, "lock": lock}, f)
+    return lock
+
+
+def lock_closure(lock, names):
+    """lock ファイル上の依存関係をたどった、インストールされるパッケージ名の集合"""
+    packages = lock.get("packages", {})
+    todo = [re.sub(r"[-_.]+", "-", n).lower() for n in names]
+    seen = set()
+    while todo:
+        name = todo.pop()
+        if name in seen or name not in packages:
+            continue
+        seen.add(name)
+        todo.extend(re.sub(r"[-_.]+", "-", d).lower() for d in packages[name].get("depends", []))
+    return seen
+
+
+def pyodide_urls(pages, asset_names, marimo_version):
+    """(Pyodide 本体とページが使うパッケージの URL, Pyodide のバージョン, lock が取れたか)"""
+    version, bootstrap = detect_pyodide(asset_names)
+    if version is None:
+        return [], None, False
+
+    cdn = PYODIDE_CDN.format(version=version)
+    lock_url = PYODIDE_LOCK_URL.format(marimo=marimo_version, version=version)
+    urls = [cdn + name for name in PYODIDE_CORE_FILES] + [lock_url]
+
+    lock = load_pyodide_lock(lock_url)
+    if lock is None:
+        return urls, version, False
+
+    names = set(bootstrap)
+    for page in pages:
+        names |= {r.split("==")[0] for r in page.get("requirements", []) if not r.startswith("marimo")}
+    for name in sorted(lock_closure(lock, names)):
+        file_name = lock["packages"][name]["file_name"]
+        urls.append(file_name if "://" in file_name else cdn + file_name)
+    return urls, version, True
+
+
+# ==========================================
+# 3. 生成
+# ==========================================
+def page_requirements(page):
+    from postprocess import read_mount_config
+
+    try:
+        return read_mount_config(page["output"]).get("requirements") or []
+    except (OSError, ValueError):
+        return []
+
+
+def generate_service_worker(pages, asset_manifest, marimo_version, path=SW_FILE):
+    """ビルド済みのページとアセットマニフェストから sw.js を書き出し、概要を返す
+
+    キャッシュ名のバージョンは、事前キャッシュするファイルの中身のハッシュから決める
+    (どれかが変われば新しい Service Worker になり、参照されなくなったチャンクは捨てられる)。
+    """
+    outputs = [p for p in pages if os.path.exists(p["output"])]
+    pages_info = asset_manifest["pages"]
+    initial = sorted({name for p in outputs for name in pages_info.get(p["output"], {}).get("initial", [])})
+    lazy = sorted({name for p in outputs for name in pages_info.get(p["output"], {}).get("lazy", [])} - set(initial))
+    statics = [name for name in STATIC_FILES if os.path.exists(name)]
+    html = [p["output"] for p in outputs]
+
+    with_requirements = [{**p, "requirements": page_requirements(p)} for p in outputs]
+    pyodide, pyodide_version, locked = pyodide_urls(with_requirements, asset_manifest["assets"], marimo_version)
+
+    h = hashlib.sha256(SW_TEMPLATE.encode("utf-8"))
+    for name in html + statics:
+        h.update(f"{name}:{file_sha256(name)}".encode("utf-8"))
+    for name in initial + lazy:
+        h.update(f"{name}:{asset_manifest['assets'][name]['sha256']}".encode("utf-8"))
+    h.update("\n".join(pyodide).encode("utf-8"))
+
+    config = {
+        "version": h.hexdigest()[:16],
+        "html": [f"./{name}" for name in html] + ["./"],
+        "precache": [f"./{name}" for name in html + statics]
+                    + [f"./{ASSETS_DIR}/{name}" for name in initial] + pyodide,
+        "assets": [f"./{ASSETS_DIR}/{name}" for name in initial + lazy],
+        "immutable": list(IMMUTABLE_PREFIXES),
+    }
+    body = SW_TEMPLATE.replace("__CONFIG__", json.dumps(config, indent=2))
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+        f.write(body)
+    os.replace(tmp, path)
+
+    precache_bytes = sum(os.path.getsize(n) for n in html + statics)
+    precache_bytes += sum(asset_manifest["assets"][n]["size"] for n in initial)
+    return {
+        "version": config["version"],
+        "precache": len(config["precache"]),
+        "precache_bytes": precache_bytes,
+        "pyodide": pyodide_version,
+        "pyodide_files": len(pyodide),
+        "pyodide_locked": locked,
+    }
+
+
+def print_sw_report(info):
+    print(f"👷 {SW_FILE}: cache version {info['version']}, {info['precache']} URLs precached "
+          f"({info['precache_bytes'] / 1024 / 1024:.2f} MB on this site)")
+    if info["pyodide"] is None:
+        print("⚠️ Pyodide version not found in assets/; Pyodide files will be cached on first use.")
+    elif not info["pyodide_locked"]:
+        print(f"⚠️ Pyodide v{info['pyodide']}: lock file unavailable, precaching core files only "
+              f"({info['pyodide_files']}); packages are cached on first use.")
+    else:
+        print(f"🐍 Pyodide v{info['pyodide']}: {info['pyodide_files']} files precached")
+
+
+# ==========================================
+# 4. ページへの登録スクリプトの差し込み
+# ==========================================
+def inject_registration(html_path):
+    """最初の </head> の直前に登録スクリプトを入れる (入っていれば何もしない)。入れたら True"""
+    tmp = html_path + ".tmp"
+    done = False
+    try:
+        with open(html_path, "r", encoding="utf-8") as src, open(tmp, "w", encoding="utf-8") as dst:
+            for line in src:
+                if REGISTER_MARKER in line:
+                    return False
+                if not done and "</head>" in line:
+                    line = line.replace("</head>", REGISTER_SNIPPET + "</head>", 1)
+                    done = True
+                dst.write(line)
+        if not done:
+            raise ValueError(f"{html_path}: </head> が見つかりません")
+        os.replace(tmp, html_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return True
+
+
+# ==========================================
+# 5. メイン
+# ==========================================
+def main(argv=None):
+    from build_factory import MANIFEST_FILE, load_json, marimo_version
+
+    parser = argparse.ArgumentParser(description="ビルド済みサイトの Service Worker (sw.js) を生成する")
+    parser.add_argument("--manifest", default=MANIFEST_FILE)
+    parser.add_argument("--inject", action="store_true", help="各ページに登録スクリプトを差し込む")
+    args = parser.parse_args(argv)
+
+    pages = load_json(args.manifest, {"pages": []})["pages"]
+    asset_manifest = load_asset_manifest()
+    if asset_manifest is None:
+        print("❌ Error: assets_manifest.json がありません。先に asset_store.py --save を実行してください。")
+        return 1
+    if args.inject:
+        for page in pages:
+            if os.path.exists(page["output"]) and inject_registration(page["output"]):
+                print(f"✅ {page['output']}: registration added")
+    print_sw_report(generate_service_worker(pages, asset_manifest, marimo_version()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from batch_cli import CALC_FUNCS, CALCULATORS, validate_row
+
+# ==========================================
+# 1. 設定エリア
+# ==========================================
+# 同一リクエストの結果キャッシュの上限件数
+RESPONSE_CACHE_SIZE = 1024
+
+# /batch で一度に受け付ける件数の上限
+MAX_BATCH_SIZE = 1000
+
+# "detail" を省略したときの既定値 (全エンドポイント共通。batch_cli の --detail なしと同じ)
+# False: NISA は最終年の1行、住宅ローンは返済総額のサマリ1行 / True: 全年・全月の行
+DEFAULT_DETAIL = False
+
+# 計算ワーカー数 (serve --workers で上書き)
+DEFAULT_WORKERS = os.cpu_count()
+
+
+# ==========================================
+# 2. 計算 (ワーカープロセス側)
+# ==========================================
+def warm_worker():
+    """ワーカー起動時にエンジンを読み込み、初期値の結果をキャッシュしておく"""
+    import mortgage_calc
+    import nisa_calc
+    import pfc_calc
+
+    for module in (nisa_calc, mortgage_calc, pfc_calc):
+        module.warm_simulation_cache()
+
+
+def run_one(calculator, params, detail):
+    """1件分の計算 (batch_cli と同じエンジン呼び出し)"""
+    return CALC_FUNCS[calculator](params, detail)
+
+
+# ==========================================
+# 3. キャッシュ
+# ==========================================
+class ResponseCache:
+    """同一リクエストの結果を LRU で保持する
+
+    計算中のリクエストも Future として登録するので、同じ内容が同時に来ても計算は1回で済む。
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_compute(self, key, compute):
+        future = self.entries.get(key)
+        if future is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        future = asyncio.ensure_future(compute())
+        self.entries[key] = future
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            # 失敗した結果はキャッシュに残さない
+            if self.entries.get(key) is future:
+                del self.entries[key]
+            raise
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+# ==========================================
+# 4. API
+# ==========================================
+def normalize_params(calculator, payload):
+    """入力を検証し、既定値を補完した dict を返す
+
+    ノートブックの入力欄で選べない値 (範囲外の数値や選択肢に無い値) は ValueError (400)。
+    計算もキャッシュもしない。
+    """
+    if calculator not in CALCULATORS:
+        raise ValueError(f"unknown calculator: {calculator}")
+    if not isinstance(payload, dict):
+        raise ValueError("params must be an object")
+
+    params = {}
+    for name, default in CALCULATORS[calculator].items():
+        value = payload.get(name, default)
+        if value is None:
+            raise ValueError(f"missing parameter: {name}")
+        params[name] = value
+    validate_row(calculator, params)
+    return params
+
+
+async def compute(request_app, calculator, payload, detail):
+    """キャッシュ経由でワーカープールに計算を投げる"""
+    params = normalize_params(calculator, payload)
+    key = (calculator, json.dumps(params, sort_keys=True, ensure_ascii=False), bool(detail))
+    loop = asyncio.get_running_loop()
+
+    async def run():
+        return await loop.run_in_executor(request_app.state.pool, run_one, calculator, params, bool(detail))
+
+    rows = await request_app.state.cache.get_or_compute(key, run)
+    return {"calculator": calculator, "params": params, "rows": rows}
+
+
+def calculator_endpoint(calculator):
+    async def endpoint(request):
+        """入力パラメータの JSON を1件計算する。"detail" (省略時 DEFAULT_DETAIL) で行の粒度を選ぶ"""
+        try:
+            payload = await request.json()
+            detail = payload.pop("detail", DEFAULT_DETAIL) if isinstance(payload, dict) else DEFAULT_DETAIL
+            return JSONResponse(await compute(request.app, calculator, payload, detail))
+        except (ValueError, TypeError, KeyError, ArithmeticError) as e:
+            return JSONResponse({"error": f"{type(e).__name__}: {e}"}, status_code=400)
+
+    return endpoint
+
+
+async def batch_endpoint(request):
+    """{"requests": [{"calculator": ..., "params": {...}, "detail": bool}, ...]} をまとめて計算する
+
+    "detail" の省略時は DEFAULT_DETAIL (/nisa などと同じ入力なら同じ形の結果になる)。
+    """
+    try:
+        items = (await request.json())["requests"]
+        if len(items) > MAX_BATCH_SIZE:
+            raise ValueError(f"too many requests (max {MAX_BATCH_SIZE})")
+    except (ValueError, TypeError, KeyError) as e:
+        return JSONResponse({"error": f"{type(e).__name__}: {e}"}, status_code=400)
+
+    async def one(item):
+        try:
+            calculator = item["calculator"]
+            return await compute(request.app, calculator, item.get("params", {}), item.get("detail", DEFAULT_DETAIL))
+        except (ValueError, TypeError, KeyError, ArithmeticError) as e:
+            return {"error": f"{type(e).__name__}: {e}"}
+
+    results = await asyncio.gather(*(one(item) for item in items))
+    return JSONResponse({"results": results})
+
+
+async def stats_endpoint(request):
+    return JSONResponse({"cache": request.app.state.cache.stats()})
+
+
+def create_app(workers=DEFAULT_WORKERS):
+    @asynccontextmanager
+    async def lifespan(app):
+        app.state.cache = ResponseCache(RESPONSE_CACHE_SIZE)
+        app.state.pool = ProcessPoolExecutor(max_workers=workers, initializer=warm_worker)
+        try:
+            yield
+        finally:
+            app.state.pool.shutdown(cancel_futures=True)
+
+    routes = [
+        Route("/nisa", calculator_endpoint("nisa"), methods=["POST"]),
+        Route("/mortgage", calculator_endpoint("mortgage"), methods=["POST"]),
+        Route("/pfc", calculator_endpoint("pfc"), methods=["POST"]),
+        Route("/batch", batch_endpoint, methods=["POST"]),
+        Route("/stats", stats_endpoint, methods=["GET"]),
+    ]
+    return Starlette(routes=routes, lifespan=lifespan)
+
+
+# ==========================================
+# 5. 負荷試験
+# ==========================================
+def random_request(rng, repeat_ratio, seen):
+    """負荷試験用のリクエスト (一部は過去と同じ内容にしてキャッシュを効かせる)"""
+    if seen and rng.random() < repeat_ratio:
+        return rng.choice(seen)
+
+    kind = rng.choice(["nisa", "mortgage", "pfc"])
+    if kind == "nisa":
+        body = {"monthly_yen": rng.randrange(1, 301) * 1000, "years": rng.randint(1, 50), "rate_pct": rng.randint(1, 150) / 10}
+    elif kind == "mortgage":
+        body = {
+            "loan_man": rng.randrange(100, 8000, 10), "rate_pct": rng.randint(0, 3000) / 1000,
+            "years": rng.randint(1, 50), "method": rng.choice(["元利均等返済", "元金均等返済"]),
+        }
+    else:
+        body = {
+            "weight": rng.randint(400, 1200) / 10, "body_fat": rng.randint(50, 400) / 10,
+            "activity": rng.choice(["1.2", "1.375", "1.55", "1.725", "1.9"]), "goal": rng.choice(["-500", "0", "500"]),
+            "protein_ratio": rng.randint(10, 40) / 10, "fat_pct": rng.randint(10, 40),
+        }
+    seen.append((kind, body))
+    return kind, body
+
+
+async def load_test(url, total, concurrency, repeat_ratio, seed):
+    """ローカルのAPIに並列でリクエストを送り、レイテンシの分布を表示する"""
+    import httpx
+
+    rng = random.Random(seed)
+    seen = []
+    plan = [random_request(rng, repeat_ratio, seen) for _ in range(total)]
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for item in plan:
+        queue.put_nowait(item)
+
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                kind, body = queue.get_nowait()
+                t = time.perf_counter()
+                response = await client.post(f"/{kind}", json=body)
+                latencies.append(time.perf_counter() - t)
+                errors += response.status_code != 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        stats = (await client.get("/stats")).json()
+
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000
+
+    print("-" * 40)
+    print(f"✅ {total:,} リクエスト / 並列 {concurrency} / エラー {errors}")
+    print(f"⏱️ {elapsed:.2f} 秒 ({total / elapsed:,.0f} req/秒)")
+    print(f"📊 p50 {pct(50):.1f} ms / p99 {pct(99):.1f} ms / 最大 {latencies[-1] * 1000:.1f} ms")
+    print(f"🗃️ キャッシュ: {stats['cache']}")
+
+
+# ==========================================
+# 6. メイン
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="シミュレーション API (Starlette + uvicorn)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="API サーバーを起動する")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="計算ワーカープロセス数")
+
+    load = sub.add_parser("loadtest", help="起動中の API に負荷をかけて p50/p99 を測る")
+    load.add_argument("--url", default="http://127.0.0.1:8000")
+    load.add_argument("--requests", type=int, default=2000)
+    load.add_argument("--concurrency", type=int, default=50)
+    load.add_argument("--repeat-ratio", type=float, default=0.3, help="過去と同じ内容を送る割合")
+    load.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        import uvicorn
+
+        print(f"🚀 Simulation API: http://{args.host}:{args.port} (workers={args.workers})")
+        uvicorn.run(create_app(args.workers), host=args.host, port=args.port, log_level="warning")
+    else:
+        asyncio.run(load_test(args.url, args.requests, args.concurrency, args.repeat_ratio, args.seed))
+
+
+if __name__ == "__main__":
+    main()
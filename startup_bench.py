@@ -0,0 +1,320 @@
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+from bench import REGRESSION_RATIO, load_history, save_history
+from serve_site import SiteHandler
+
+# ==========================================
+# 1. 設定エリア
+# ==========================================
+HISTORY_FILE = "startup_history.json"
+
+# marimo がセルの出力を描画する要素
+# (事前レンダリングしたスナップショットがあるので、最初の出力は HTML を読んだ時点で出る)
+FIRST_OUTPUT_SELECTOR = '[data-cell-role="output"]'
+
+# セルの実行中に marimo が出すインジケーター
+RUNNING_INDICATOR_SELECTOR = '[data-testid="loading-indicator"]'
+
+# 1ページあたりの待ち時間の上限 (秒)。Pyodide とパッケージのダウンロードを含む
+PAGE_TIMEOUT_SEC = 180
+
+# 最初の出力が描画された時刻 (performance.now()) を返す。タイムアウトなら null
+WAIT_FIRST_OUTPUT_JS = """
+const [selector, timeoutMs, done] = arguments;
+const ready = () => Array.from(document.querySelectorAll(selector)).some(
+  (el) => el.textContent.trim() !== "" || el.querySelector("img, svg, canvas")
+);
+if (ready()) { done(performance.now()); return; }
+const observer = new MutationObserver(() => {
+  if (ready()) { observer.disconnect(); done(performance.now()); }
+});
+observer.observe(document.documentElement, {childList: true, subtree: true, characterData: true});
+setTimeout(() => { observer.disconnect(); done(null); }, timeoutMs);
+"""
+
+# カーネルが最初の実行を終えて操作を受け付けるようになった時刻 (performance.now())。タイムアウトなら null
+# marimo は実行が終わるとファビコンを実行結果のアイコン (data: URL) に差し替え、実行中はインジケーターを出す
+WAIT_KERNEL_READY_JS = """
+const [indicator, timeoutMs, done] = arguments;
+const ready = () => {
+  const icon = document.querySelector("link[rel~='icon']");
+  return icon !== null && !icon.href.includes("favicon") && document.querySelector(indicator) === null;
+};
+if (ready()) { done(performance.now()); return; }
+const observer = new MutationObserver(() => {
+  if (ready()) { observer.disconnect(); done(performance.now()); }
+});
+observer.observe(document.documentElement, {childList: true, subtree: true, attributes: true, attributeFilter: ["href"]});
+setTimeout(() => { observer.disconnect(); done(null); }, timeoutMs);
+"""
+
+# ネットワークに出なくてよい URL (ページ内で作られるもの)
+LOCAL_URL_PREFIXES = ("data:", "blob:")
+
+# Service Worker が有効になり、事前キャッシュが終わるまで待つ。登録されなければ false
+WAIT_SW_READY_JS = """
+const [timeoutMs, done] = arguments;
+if (!("serviceWorker" in navigator)) { done(false); return; }
+setTimeout(() => done(false), timeoutMs);
+navigator.serviceWorker.ready.then((reg) => {
+  const active = reg.active;
+  if (active.state === "activated") { done(true); return; }
+  active.addEventListener("statechange", () => { if (active.state === "activated") done(true); });
+});
+"""
+
+# 読み込んだリソースの集計 (Pyodide のパッケージは .whl / .zip / .tar)
+RESOURCE_STATS_JS = """
+const entries = performance.getEntriesByType("resource");
+const nav = performance.getEntriesByType("navigation")[0];
+const isPackage = (e) => /\\.(whl|zip|tar)(\\?|$)/.test(e.name);
+const sum = (list) => list.reduce((acc, e) => acc + (e.transferSize || e.encodedBodySize || 0), 0);
+return {
+  requests: entries.length,
+  transfer_bytes: sum(entries) + (nav ? nav.transferSize : 0),
+  package_requests: entries.filter(isPackage).length,
+  package_bytes: sum(entries.filter(isPackage)),
+  dom_content_loaded_ms: nav ? nav.domContentLoadedEventEnd : null,
+  js_heap_bytes: performance.memory ? performance.memory.usedJSHeapSize : null,
+};
+"""
+
+
+# ==========================================
+# 2. 計測
+# ==========================================
+def start_server(directory):
+    """ビルド済みサイトを空いているポートで配信し、(サーバー, ベースURL) を返す"""
+
+    class QuietHandler(SiteHandler):
+        def log_message(self, format, *args):
+            pass
+
+    def handler(*args, **kwargs):
+        return QuietHandler(*args, directory=directory, **kwargs)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def new_driver(disable_cache=True, network_log=False):
+    """キャッシュの無い新しいプロファイルのヘッドレス Chrome
+
+    network_log=True なら、CDP の Network イベントを性能ログ (get_log("performance")) に残す。
+    """
+    from selenium import webdriver
+
+    try:
+        import chromedriver_binary  # noqa: F401  (PATH に chromedriver を追加する)
+    except ImportError:
+        pass  # Selenium Manager に任せる
+
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--enable-precise-memory-info")
+    if network_log:
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    driver = webdriver.Chrome(options=options)
+    driver.set_script_timeout(PAGE_TIMEOUT_SEC + 10)
+    driver.set_page_load_timeout(PAGE_TIMEOUT_SEC)
+    # ディスクキャッシュも使わせない (毎回コールドスタート)
+    driver.execute_cdp_cmd("Network.setCacheDisabled", {"cacheDisabled": disable_cache})
+    return driver
+
+
+def wait_kernel_ready(driver):
+    return driver.execute_async_script(WAIT_KERNEL_READY_JS, RUNNING_INDICATOR_SELECTOR, PAGE_TIMEOUT_SEC * 1000)
+
+
+def measure_page(url):
+    """1ページをコールドスタートで開き、最初の出力とカーネルの準備完了までの時間などを返す"""
+    driver = new_driver()
+    try:
+        driver.get(url)
+        first_output = driver.execute_async_script(WAIT_FIRST_OUTPUT_JS, FIRST_OUTPUT_SELECTOR, PAGE_TIMEOUT_SEC * 1000)
+        kernel_ready = wait_kernel_ready(driver)
+        stats = driver.execute_script(RESOURCE_STATS_JS)
+    finally:
+        driver.quit()
+    return {"first_output_ms": first_output, "kernel_ready_ms": kernel_ready, **stats}
+
+
+def network_requests(driver):
+    """性能ログの Network イベントから (失敗したリクエスト, Service Worker を通らなかったレスポンス) の URL を返す
+
+    読んだ分のログは消えるので、区切りたいところで一度呼んで捨てる。
+    """
+    urls, failed, network = {}, [], []
+    for entry in driver.get_log("performance"):
+        message = json.loads(entry["message"])["message"]
+        params = message.get("params", {})
+        if message["method"] == "Network.requestWillBeSent":
+            urls[params["requestId"]] = params["request"]["url"]
+        elif message["method"] == "Network.loadingFailed" and not params.get("canceled"):
+            failed.append(urls.get(params["requestId"], params["errorText"]))
+        elif message["method"] == "Network.responseReceived":
+            response = params["response"]
+            if not response.get("fromServiceWorker") and not response["url"].startswith(LOCAL_URL_PREFIXES):
+                network.append(response["url"])
+    return failed, network
+
+
+def measure_offline_repeat(url):
+    """1回目の訪問で Service Worker を入れてから、ネットワークを切って開き直した結果を返す
+
+    スナップショットがあるので出力が出ただけでは起動できたことにならない。
+    カーネルの準備完了まで待ち、その間に失敗したリクエストも、Service Worker を通らずに
+    返ってきたレスポンスも無ければ「オフラインで起動できた」。
+    HTTP キャッシュは無効のままにして、Service Worker のキャッシュだけで動くことを確かめる。
+    """
+    driver = new_driver(network_log=True)
+    try:
+        driver.get(url)
+        wait_kernel_ready(driver)
+        installed = driver.execute_async_script(WAIT_SW_READY_JS, PAGE_TIMEOUT_SEC * 1000)
+        if not installed:
+            return {"offline_kernel_ready_ms": None, "offline_failed": [], "offline_network": [], "sw": False}
+
+        network_requests(driver)  # 1回目の訪問の分を捨てる
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd(
+            "Network.emulateNetworkConditions",
+            {"offline": True, "latency": 0, "downloadThroughput": -1, "uploadThroughput": -1},
+        )
+        driver.get(url)
+        kernel_ready = wait_kernel_ready(driver)
+        failed, network = network_requests(driver)
+    finally:
+        driver.quit()
+    return {"offline_kernel_ready_ms": kernel_ready, "offline_failed": failed, "offline_network": network, "sw": True}
+
+
+def offline_problem(r):
+    """オフラインの再訪問が失敗していればその理由、問題なければ None"""
+    if not r["sw"]:
+        return "no offline start (service worker not active)"
+    if r["offline_kernel_ready_ms"] is None:
+        return "no offline start"
+    if r["offline_failed"]:
+        return f"{len(r['offline_failed'])} request(s) failed (e.g. {r['offline_failed'][0]})"
+    if r["offline_network"]:
+        return f"{len(r['offline_network'])} request(s) bypassed the service worker (e.g. {r['offline_network'][0]})"
+    return None
+
+
+def run_startup_bench(pages, directory=".", runs=1, history_path=HISTORY_FILE, save=True, offline=False):
+    """全ページの起動時間を測って表示し、回帰したページ名のリストを返す
+
+    回帰の判定はカーネルの準備完了までの時間で行う
+    (最初の出力はスナップショットなので HTML の読み込みしか測れない)。
+    offline=True なら、Service Worker を入れた後のネットワーク無しの再訪問も測る
+    (カーネルの準備完了まで届かないか、ネットワークに出たリクエストがあれば回帰として扱う)。
+    """
+    server, base_url = start_server(directory)
+    results = {}
+    try:
+        for page in pages:
+            samples = [measure_page(f"{base_url}/{page['output']}") for _ in range(runs)]
+            first = [s["first_output_ms"] for s in samples if s["first_output_ms"] is not None]
+            timed = [s["kernel_ready_ms"] for s in samples if s["kernel_ready_ms"] is not None]
+            results[page["output"]] = {
+                **samples[-1],
+                "first_output_ms": statistics.median(first) if first else None,
+                "kernel_ready_ms": statistics.median(timed) if timed else None,
+                "runs": runs,
+                "timeouts": runs - len(timed),
+            }
+            if offline:
+                results[page["output"]].update(measure_offline_repeat(f"{base_url}/{page['output']}"))
+    finally:
+        server.shutdown()
+
+    history = load_history(history_path)
+    previous = {}
+    for run in history:
+        previous.update(run["results"])
+
+    regressions = []
+    print("-" * 86)
+    print(f"{'page':<16} {'first output':>13} {'kernel ready':>13} {'requests':>9} {'transfer':>11} {'packages':>11} {'heap':>9} {'offline':>9}")
+    for output, r in results.items():
+        mark = ""
+        # 以前の履歴 (kernel_ready_ms が無い) とは比べない
+        old = previous.get(output, {}).get("kernel_ready_ms")
+        if r["kernel_ready_ms"] is None:
+            mark = f"⏰ TIMEOUT ({PAGE_TIMEOUT_SEC}s)"
+            regressions.append(output)
+        elif old:
+            ratio = r["kernel_ready_ms"] / old
+            if ratio >= REGRESSION_RATIO:
+                mark = f"🐢 x{ratio:.2f} (REGRESSION)"
+                regressions.append(output)
+            else:
+                mark = f"x{ratio:.2f}"
+        first = f"{r['first_output_ms'] / 1000:.2f}s" if r["first_output_ms"] is not None else "-"
+        ready = f"{r['kernel_ready_ms'] / 1000:.2f}s" if r["kernel_ready_ms"] is not None else "-"
+        heap = f"{r['js_heap_bytes'] / 1024 / 1024:.0f} MB" if r["js_heap_bytes"] else "-"
+        repeat = "-"
+        if "offline_kernel_ready_ms" in r:
+            problem = offline_problem(r)
+            if problem is None:
+                repeat = f"{r['offline_kernel_ready_ms'] / 1000:.2f}s"
+            else:
+                repeat = "FAIL"
+                mark += f" 📴 {problem}"
+                if output not in regressions:
+                    regressions.append(output)
+        print(
+            f"{output:<16} {first:>13} {ready:>13} {r['requests']:>9} {r['transfer_bytes'] / 1024 / 1024:>8.2f} MB "
+            f"{r['package_bytes'] / 1024 / 1024:>8.2f} MB {heap:>9} {repeat:>9}  {mark}"
+        )
+    print("-" * 86)
+
+    if save:
+        history.append({"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "results": results})
+        save_history(history_path, history)
+    if regressions:
+        print(f"⚠️ Cold-start regression: {', '.join(regressions)}")
+    return regressions
+
+
+# ==========================================
+# 3. メイン
+# ==========================================
+def main(argv=None):
+    from build_factory import MANIFEST_FILE, load_json
+
+    parser = argparse.ArgumentParser(description="ビルド済みページをヘッドレス Chrome で開き、最初の出力とカーネルの準備完了までの時間を測る")
+    parser.add_argument("pages", nargs="*", help="測るページ (省略時はマニフェストの全ページ)")
+    parser.add_argument("--manifest", default=MANIFEST_FILE)
+    parser.add_argument("--runs", type=int, default=1, help="ページごとの計測回数 (中央値を記録)")
+    parser.add_argument("--history", default=HISTORY_FILE)
+    parser.add_argument("--no-save", action="store_true", help="履歴に記録しない")
+    parser.add_argument("--offline", action="store_true", help="Service Worker のキャッシュだけでの再訪問 (ネットワーク無し) も測る")
+    parser.add_argument("--fail-on-regression", action="store_true", help="回帰があれば終了コード1で終わる")
+    args = parser.parse_args(argv)
+
+    pages = load_json(args.manifest, {"pages": []})["pages"]
+    if args.pages:
+        pages = [p for p in pages if p["output"] in args.pages or p["source"] in args.pages]
+    pages = [p for p in pages if os.path.exists(p["output"])]
+
+    print(f"🌐 Measuring cold start of {len(pages)} page(s)...")
+    regressions = run_startup_bench(
+        pages, runs=args.runs, history_path=args.history, save=not args.no_save, offline=args.offline
+    )
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ==========================================
+# 1. 設定エリア
+# ==========================================
+# Gemini API (REST) と同じ形のエンドポイント。google-genai の base_url をここに向ければネットワーク無しで試せる
+GENERATE_PATH = re.compile(r"^/(v\w+)/models/([^/:]+):generateContent$")
+MODELS_PATH = re.compile(r"^/(v\w+)/models/?$")
+
+# 返答までの待ち時間 (秒)。本物の API の遅さを真似る
+DEFAULT_DELAY_SEC = 1.0
+
+# 一覧で返すモデル
+STUB_MODELS = ("stub-flash", "stub-pro")
+
+# mini_opal.py のプロンプトから現在のコードと指示を取り出す目印
+CODE_MARKER = "【現在のコード】"
+INSTRUCTION_MARKER = "【ユーザーの指示】"
+
+# パッチモードのプロンプトに並んでいるセル (### CELL 番号 ... ### END)
+CELL_BLOCK = re.compile(r"^### CELL (\d+)\n(.*?)\n### END$", re.M | re.S)
+
+
+# ==========================================
+# 2. 応答の中身
+# ==========================================
+def echo_cell_patch(prompt, instruction):
+    """パッチモードのプロンプトなら、送られてきた最後のセルに指示をコメントとして足して返す"""
+    cells = CELL_BLOCK.findall(prompt.split(INSTRUCTION_MARKER, 1)[0])
+    if not cells:
+        return None
+    index, body = cells[-1]
+    lines = body.split("\n")
+    at = next((i for i, line in enumerate(lines) if line.lstrip().startswith(("def ", "async def "))), 0)
+    lines.insert(at + 1, f"    # stub: {instruction}")
+    return f"### CELL {index}\n" + "\n".join(lines) + "\n### END\n"
+
+
+def echo_edit(prompt):
+    """プロンプト中のコードを、指示をコメントとして末尾に足しただけで返す (中身は変えない)
+
+    パッチモード (### CELL の書式) のプロンプトには、セル1つだけの置き換えを返す。
+    """
+    if INSTRUCTION_MARKER in prompt:
+        instruction = prompt.split(INSTRUCTION_MARKER, 1)[1].strip()
+        instruction = instruction.splitlines()[0] if instruction else ""
+        patch = echo_cell_patch(prompt, instruction)
+        if patch is not None:
+            return patch
+    if CODE_MARKER not in prompt or INSTRUCTION_MARKER not in prompt:
+        return "OK"
+    code = prompt.split(CODE_MARKER, 1)[1].split(INSTRUCTION_MARKER, 1)[0]
+    instruction = prompt.split(INSTRUCTION_MARKER, 1)[1].strip()
+    # プロンプトの f-string で付いた前後の空白 (1行目の字下げ) は外す
+    return f"{code.strip()}\n# stub: {instruction.splitlines()[0] if instruction else ''}\n"
+
+
+def prompt_text(body):
+    """generateContent のリクエストボディからテキストを取り出す"""
+    parts = []
+    for content in body.get("contents", []):
+        for part in content.get("parts", []):
+            if "text" in part:
+                parts.append(part["text"])
+    return "\n".join(parts)
+
+
+# ==========================================
+# 3. サーバー
+# ==========================================
+class StubModelHandler(BaseHTTPRequestHandler):
+    """generateContent とモデル一覧だけに答える。同時に処理している数の最大値を記録する"""
+
+    delay = DEFAULT_DELAY_SEC
+    respond = staticmethod(echo_edit)
+    stats = None
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if not MODELS_PATH.match(self.path.split("?")[0]):
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": {"code": 404, "message": "not found"}})
+            return
+        models = [
+            {"name": f"models/{name}", "displayName": name, "supportedGenerationMethods": ["generateContent"]}
+            for name in STUB_MODELS
+        ]
+        self.send_json(HTTPStatus.OK, {"models": models})
+
+    def do_POST(self):
+        match = GENERATE_PATH.match(self.path.split("?")[0])
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not match:
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": {"code": 404, "message": "not found"}})
+            return
+
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+        try:
+            time.sleep(self.delay)
+            text = self.respond(prompt_text(body))
+        finally:
+            with self.lock:
+                self.stats["in_flight"] -= 1
+
+        self.send_json(HTTPStatus.OK, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+            "modelVersion": match.group(2),
+        })
+
+
+def start_stub_server(delay=DEFAULT_DELAY_SEC, respond=echo_edit, port=0):
+    """スタブを別スレッドで起動し、(サーバー, base_url, 統計) を返す"""
+    stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0}
+    handler = type("Handler", (StubModelHandler,), {"delay": delay, "respond": staticmethod(respond), "stats": stats})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", stats
+
+
+# ==========================================
+# 4. メイン
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gemini API の代わりに答えるローカルのスタブサーバー (テスト用)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=DEFAULT_DELAY_SEC, help="1リクエストの応答にかける秒数")
+    args = parser.parse_args(argv)
+
+    server, url, stats = start_stub_server(args.delay, port=args.port)
+    print(f"🧪 Stub model server: {url} (delay {args.delay:.1f}s)")
+    print(f"   mini_opal.py --base-url {url} ...")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        print(f"\n📊 {stats['requests']} requests, max {stats['max_in_flight']} in flight")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import json
+
+import asset_store
+
+# marimo (Vite) の入口チャンクを縮めたもの: 先読みの表、モードごとのページ、CSS だけの先読み
+ENTRY_JS = (
+    'const __vite__mapDeps=(i,m=__vite__mapDeps,d=(m.f||(m.f=["./run-page-AAAAAAAA.js","./shared-BBBBBBBB.js",'
+    '"./edit-page-CCCCCCCC.js","./editor-only-DDDDDDDD.js","./katex-EEEEEEEE.css"])))=>i.map(i=>d[i]);'
+    'import{a as r}from"./react-FFFFFFFF.js";'
+    'var run=()=>vt(()=>import("./run-page-AAAAAAAA.js").then(async t=>(await t.__tla,t)),__vite__mapDeps([0,1]),import.meta.url),'
+    'edit=()=>vt(()=>import("./edit-page-CCCCCCCC.js").then(async t=>(await t.__tla,t)),__vite__mapDeps([2,3,1]),import.meta.url);'
+    'x&&vt(()=>Promise.resolve({}),__vite__mapDeps([4]),import.meta.url);'
+    'new Worker(new URL(""+new URL("worker-GGGGGGGG.js",import.meta.url).href,""+import.meta.url));'
+    'WebAssembly.instantiate(w,{"./loro_wasm_bg.js":k});'
+)
+
+PAGE_HTML = """<!DOCTYPE html>
+<html><head>
+<link rel="preload" href="./assets/font-HHHHHHHH.ttf" as="font" />
+<link rel="icon" href="./favicon.ico" />
+<script data-marimo="true">
+window.__MARIMO_MOUNT_CONFIG__ = {"notebook": {"code": "HEADER_IMAGE = \\"assets/header_pfc.png\\"\\nmo.image(src=\\"assets/header_pfc.png\\")"},
+"files": "HEADER%3D%22assets/header_pfc.png%22%0A"};
+</script>
+<script type="module" crossorigin src="./assets/index-IIIIIIII.js"></script>
+<link rel="stylesheet" crossorigin href="./assets/index-JJJJJJJJ.css">
+</head><body><img src="./assets/logo-KKKKKKKK.png"></body></html>
+"""
+
+
+def test_entry_chunk_refs_follow_run_mode_only():
+    static, lazy = asset_store.parse_chunk_refs(ENTRY_JS)
+    assert static == {"react-FFFFFFFF.js"}
+    # run-page とその先読み、CSS だけの先読み、Web Worker は読まれる
+    assert {"run-page-AAAAAAAA.js", "shared-BBBBBBBB.js", "katex-EEEEEEEE.css", "worker-GGGGGGGG.js"} <= lazy
+    # edit-page とその先読みだけの組は run モードでは読まれない。wasm-bindgen の import オブジェクトのキーは参照ではない
+    assert not lazy & {"edit-page-CCCCCCCC.js", "editor-only-DDDDDDDD.js", "loro_wasm_bg.js"}
+
+
+def test_css_refs_skip_data_uris():
+    css = '@font-face{src:url(./font-HHHHHHHH.woff2) format("woff2"),url(data:font/woff2;base64,AAAA)}'
+    assert asset_store.parse_chunk_refs(css, is_css=True) == ({"font-HHHHHHHH.woff2"}, set())
+
+
+def test_html_refs_only_count_tags_as_chunks():
+    chunks, loose = asset_store.html_refs(PAGE_HTML)
+    assert chunks == {"font-HHHHHHHH.ttf", "index-IIIIIIII.js", "index-JJJJJJJJ.css"}
+    # ノートブックのコードの文字列は (JSON と URL エンコードを戻したうえで) チャンク以外の参照になる
+    assert loose == {"header_pfc.png", "logo-KKKKKKKK.png"}
+
+
+def test_manifest_prunes_editor_only_chunks(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assets = tmp_path / "assets"
+    assets.mkdir()
+    files = {
+        "index-IIIIIIII.js": ENTRY_JS,
+        "index-JJJJJJJJ.css": "body{background:url(./noise-LLLLLLLL.png)}",
+        "react-FFFFFFFF.js": "export const a=1;",
+        "run-page-AAAAAAAA.js": 'import"./shared-BBBBBBBB.js";',
+        "shared-BBBBBBBB.js": "",
+        "edit-page-CCCCCCCC.js": 'import"./editor-only-DDDDDDDD.js";',
+        "editor-only-DDDDDDDD.js": "",
+        "katex-EEEEEEEE.css": "",
+        "worker-GGGGGGGG.js": "",
+        "font-HHHHHHHH.ttf": "",
+        "noise-LLLLLLLL.png": "",
+        "logo-KKKKKKKK.png": "",
+        "stale-MMMMMMMM.js": "",
+    }
+    for name, text in files.items():
+        (assets / name).write_text(text, encoding="utf-8")
+    (tmp_path / "pfc.html").write_text(PAGE_HTML, encoding="utf-8")
+
+    manifest = asset_store.build_asset_manifest([{"source": "pfc_calc.py", "output": "pfc.html"}])
+    page = manifest["pages"]["pfc.html"]
+    assert page["initial"] == ["font-HHHHHHHH.ttf", "index-IIIIIIII.js", "index-JJJJJJJJ.css", "noise-LLLLLLLL.png", "react-FFFFFFFF.js"]
+    assert page["lazy"] == ["katex-EEEEEEEE.css", "run-page-AAAAAAAA.js", "shared-BBBBBBBB.js", "worker-GGGGGGGG.js"]
+    assert asset_store.missing_pages(manifest) == {}
+    assert asset_store.unresolved_pages(manifest) == {"pfc.html": ["header_pfc.png"]}
+
+    # <img> の画像は参照されている扱いにはならないが、存在はするので警告にもならない
+    assert manifest["unreferenced"] == [
+        "edit-page-CCCCCCCC.js", "editor-only-DDDDDDDD.js", "logo-KKKKKKKK.png", "stale-MMMMMMMM.js"
+    ]
+    removed, _ = asset_store.prune_assets(manifest)
+    assert removed == 4
+    assert sorted(p.name for p in assets.iterdir()) == sorted(manifest["assets"])
+    json.dumps(manifest)
+
+
+def test_missing_chunk_fails_but_missing_image_only_warns(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "assets" / "index-IIIIIIII.js").write_text('import"./gone-NNNNNNNN.js";', encoding="utf-8")
+    (tmp_path / "index.html").write_text(
+        '<script type="module" src="./assets/index-IIIIIIII.js"></script><p>assets/header.png</p>', encoding="utf-8"
+    )
+    manifest = asset_store.build_asset_manifest([{"source": "nisa_calc.py", "output": "index.html"}])
+    assert asset_store.missing_pages(manifest) == {"index.html": ["gone-NNNNNNNN.js"]}
+    assert asset_store.unresolved_pages(manifest) == {"index.html": ["header.png"]}
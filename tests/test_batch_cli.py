@@ -0,0 +1,108 @@
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+import batch_cli
+
+RESULT = ["Year", "Principal", "Profit", "Total"]
+
+
+def write_input(path):
+    # 1チャンク目 (2行) はすべてエラー、2チャンク目は正常、3チャンク目はエラーと正常が混在
+    pd.DataFrame({
+        "monthly_yen": ["abc", "xyz", "30000", "10000", "bad"],
+        "years": [20, 20, 20, 5, 5],
+        "rate_pct": [5.0, 5.0, 5.0, 3.0, 3.0],
+    }).to_csv(path, index=False)
+
+
+def run_batch(tmp_path, suffix):
+    src = tmp_path / "in.csv"
+    out = tmp_path / f"out{suffix}"
+    write_input(src)
+    code = batch_cli.main(["nisa", str(src), "-o", str(out), "--workers", "1", "--chunk-rows", "2"])
+    assert code == 1  # エラーの行があるので 1
+    return out
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet"])
+def test_error_only_first_chunk_keeps_result_columns(tmp_path, suffix):
+    out = run_batch(tmp_path, suffix)
+    df = pd.read_csv(out) if suffix == ".csv" else pq.read_table(out).to_pandas()
+
+    assert list(df.columns) == ["row", "monthly_yen", "years", "rate_pct", *RESULT, "error"]
+    assert df["row"].tolist() == [0, 1, 2, 3, 4]
+    assert df.loc[[0, 1, 4], "error"].str.startswith("ValueError").all()
+    assert df.loc[[0, 1, 4], RESULT].isna().all().all()
+
+    ok = df.loc[2]
+    assert ok["Year"] == 20 and ok["Principal"] == 30000 * 12 * 20
+    assert ok["Total"] == ok["Principal"] + ok["Profit"]
+    assert pd.isna(ok["error"])
+    assert df.loc[3, "Year"] == 5 and df.loc[3, "Principal"] == 10000 * 12 * 5
+
+
+def test_csv_integer_results_stay_integers(tmp_path):
+    from nisa_calc import calculate_asset_growth
+
+    out = run_batch(tmp_path, ".csv")
+    lines = out.read_text(encoding="utf-8").splitlines()
+    last = calculate_asset_growth(30000, 20, 5.0).iloc[-1]
+    # 同じチャンクにエラー行があっても、結果の整数は 7200000.0 のようにならない
+    assert lines[3].split(",")[4:8] == [str(int(last[c])) for c in RESULT]
+    assert lines[1].split(",")[4:8] == ["", "", "", ""]
+
+
+def test_parquet_schema_is_declared_up_front(tmp_path):
+    out = run_batch(tmp_path, ".parquet")
+    schema = pq.read_schema(out)
+    assert schema.remove_metadata().equals(batch_cli.output_schema("nisa", False))
+    assert all(schema.field(c).nullable for c in RESULT)
+
+
+@pytest.mark.parametrize("detail", [False, True])
+def test_writer_conforms_any_chunk_shape(tmp_path, detail):
+    writer = batch_cli.ResultWriter(str(tmp_path / "out.parquet"), "mortgage", detail)
+    rows = [{"row": 0, "loan_man": 3500, "rate_pct": 0.5, "years": 35, "method": "元利均等返済", "bonus_man": 0}]
+    errors = pd.DataFrame([{**rows[0], "error": "ValueError: x"}])
+    writer.write(errors)
+    writer.write(batch_cli.run_chunk("mortgage", rows, detail))
+    writer.close()
+
+    table = pq.read_table(tmp_path / "out.parquet")
+    assert table.schema.names == batch_cli.output_schema("mortgage", detail).names
+    assert table.column("error").to_pylist()[0] == "ValueError: x"
+    assert table.column("error").null_count == table.num_rows - 1
+
+
+MORTGAGE_ROW = {"loan_man": 3500, "rate_pct": 0.5, "years": 35, "method": "元利均等返済", "bonus_man": 0}
+PFC_ROW = {"weight": 65.0, "body_fat": 15.0, "activity": "1.375", "goal": "-500", "protein_ratio": 2.5, "fat_pct": 20}
+
+
+@pytest.mark.parametrize("calculator, row, message", [
+    ("mortgage", {**MORTGAGE_ROW, "method": "x"}, "method は"),
+    ("mortgage", {**MORTGAGE_ROW, "years": 0}, "years は 1〜50"),
+    ("mortgage", {**MORTGAGE_ROW, "years": 20.5}, "years は整数"),
+    ("mortgage", {**MORTGAGE_ROW, "bonus_man": 2000}, "借入金額の半分"),
+    ("pfc", {**PFC_ROW, "activity": "9"}, "activity は"),
+    ("pfc", {**PFC_ROW, "goal": "1000"}, "goal は"),
+    ("pfc", {**PFC_ROW, "weight": 0}, "weight は 30〜150"),
+    ("pfc", {**PFC_ROW, "body_fat": float("nan")}, "body_fat は"),
+    ("nisa", {"monthly_yen": 30000, "years": 20, "rate_pct": 40}, "rate_pct は"),
+])
+def test_invalid_inputs_become_error_rows(calculator, row, message):
+    df = batch_cli.run_chunk(calculator, [{"row": 0, **row}], False)
+    assert len(df) == 1
+    assert df.loc[0, "error"].startswith("ValueError") and message in df.loc[0, "error"]
+    result = list(batch_cli.RESULT_COLUMNS[(calculator, False)])
+    assert result[0] not in df.columns or df[result].isna().all().all()
+
+
+def test_choices_read_from_csv_as_numbers(tmp_path):
+    # CSV から読むと activity / goal は数値になる (-500 や 1.375)。選択肢と同じ値なら通る
+    src, out = tmp_path / "in.csv", tmp_path / "out.csv"
+    pd.DataFrame([PFC_ROW, {**PFC_ROW, "activity": "1.9", "goal": "0"}, {**PFC_ROW, "goal": "250"}]).to_csv(src, index=False)
+    assert batch_cli.main(["pfc", str(src), "-o", str(out), "--workers", "1"]) == 1
+    df = pd.read_csv(out)
+    assert df["error"].isna().tolist() == [True, True, False]
+    assert df.loc[2, "error"].startswith("ValueError: goal は")
@@ -0,0 +1,23 @@
+import pytest
+
+import bench
+
+OLD = {"median_ms": 10.0, "peak_kb": 400.0}
+
+
+@pytest.mark.parametrize("median_ms, peak_kb, regressed", [
+    (10.0, 400.0, False),
+    (13.0, 400.0, True),    # 時間だけ回帰
+    (10.0, 600.0, True),    # ピークメモリだけ回帰
+    (10.0, 480.0, False),   # 倍率が足りない
+    (5.0, 200.0, False),    # 速く・小さくなった
+])
+def test_compare_result_checks_time_and_memory(median_ms, peak_kb, regressed):
+    assert bench.compare_result({"median_ms": median_ms, "peak_kb": peak_kb}, OLD)[1] is regressed
+
+
+def test_small_memory_growth_is_noise():
+    # 2 KB -> 20 KB は10倍でも、増加が MEMORY_FLOOR_KB 未満なので回帰にしない
+    assert bench.compare_result({"median_ms": 1.0, "peak_kb": 20.0}, {"median_ms": 1.0, "peak_kb": 2.0}) == ("x1.00", False)
+    mark, regressed = bench.compare_result({"median_ms": 1.0, "peak_kb": 200.0}, {"median_ms": 1.0, "peak_kb": 2.0})
+    assert regressed and "MEMORY REGRESSION" in mark
@@ -0,0 +1,104 @@
+import difflib
+
+import pytest
+
+import cell_patch
+
+NOTEBOOK = '''import marimo
+
+app = marimo.App()
+
+with app.setup:
+    import marimo as mo
+
+    RATE = 5.0
+
+
+@app.cell
+def _():
+    years = mo.ui.slider(1, 30, value=20)
+    return (years,)
+
+
+@app.cell
+def _(years):
+    total = years.value * RATE
+    return (total,)
+
+
+@app.cell
+def _(total):
+    mo.md(f"{total}")
+    return
+
+
+if __name__ == "__main__":
+    app.run()
+'''
+
+
+def test_blocks_and_outline():
+    blocks = cell_patch.notebook_blocks(NOTEBOOK)
+    assert [b["kind"] for b in blocks] == ["setup", "cell", "cell", "cell"]
+    assert blocks[0]["defines"] == ["mo", "RATE"]
+    assert cell_patch.cell_outline(blocks).split("\n")[2] == "2: cell (years) -> total"
+    assert cell_patch.check_notebook(NOTEBOOK) == []
+
+
+def test_cell_patch_replaces_adds_and_deletes():
+    text = """```
+### CELL 2
+@app.cell
+def _(years):
+    total = years.value * RATE * 2
+    return (total,)
+### END
+### CELL new
+@app.cell
+def _(total):
+    half = total / 2
+    return (half,)
+### END
+### DELETE 3
+```"""
+    new_code = cell_patch.apply_patch_text(NOTEBOOK, text)
+    assert "years.value * RATE * 2" in new_code
+    assert 'mo.md(f"{total}")' not in new_code
+    # 新しいセルは if __name__ == "__main__": の前に入る
+    assert new_code.index("half = total / 2") < new_code.index(cell_patch.MAIN_GUARD)
+    assert cell_patch.check_notebook(new_code) == []
+    assert cell_patch.changed_cells(NOTEBOOK, new_code) == [2, 3]
+
+
+@pytest.mark.parametrize("text, message", [
+    ("### CELL 9\n@app.cell\ndef _():\n    return\n### END", "CELL 9 はありません"),
+    ("### CELL 1\n@app.cell\ndef _(:\n### END", "SyntaxError"),
+    ("### CELL 1\nx = 1\n### END", "1つの @app.cell"),
+    ("### CELL 1\n@app.cell\ndef _():\n    return", "閉じていません"),
+    ("ここを直しました\n### DELETE 1", "余分な行"),
+])
+def test_cell_patch_errors(text, message):
+    with pytest.raises(ValueError, match=message):
+        cell_patch.apply_patch_text(NOTEBOOK, text)
+
+
+def test_unified_diff_with_shifted_line_numbers():
+    new = NOTEBOOK.replace("value=20", "value=25")
+    diff = "\n".join(difflib.unified_diff(NOTEBOOK.split("\n"), new.split("\n"), "a/nb.py", "b/nb.py", lineterm=""))
+    # 行番号がずれていても、前後の行が一致する場所に当たる
+    shifted = diff.replace("@@ -10,7 +10,7 @@", "@@ -3,7 +3,7 @@")
+    assert shifted != diff
+    assert cell_patch.apply_patch_text(NOTEBOOK, f"```diff\n{shifted}\n```") == new
+
+    with pytest.raises(ValueError, match="一致しません"):
+        cell_patch.apply_patch_text(NOTEBOOK.replace("value=20", "value=10"), diff)
+
+
+def test_check_notebook_reports_missing_and_duplicate_names():
+    broken = NOTEBOOK.replace("def _(total):", "def _(total, rate):").replace(
+        "    mo.md(f\"{total}\")\n    return\n", "    years = 1\n    return (years,)\n"
+    )
+    problems = cell_patch.check_notebook(broken)
+    assert "years が複数のセルで定義されています (CELL 1, 3)" in problems
+    assert "CELL 3 が参照する rate を返すセルがありません" in problems
+    assert cell_patch.check_notebook("@app.cell\ndef _(:\n")[0].startswith("SyntaxError")
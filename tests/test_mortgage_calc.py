@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+import mortgage_calc
+
+KEYS = ("月", "年", "支払額", "残高", "利息")
+
+CASES = [
+    (3500, 0.525, 35, 0),        # ページの初期値
+    (3500, 0.525, 35, 500),      # ボーナス払いあり
+    (3500, 0.0, 35, 0),          # 金利 0
+    (3500, 0.0, 35, 1000),
+    (100, 1.0, 1, 0),            # 1年 (ボーナスは2回)
+    (100, 1.0, 1, 50),
+    (50000, 20.0, 50, 0),        # 借入額・金利・期間とも最大
+    (50000, 20.0, 50, 25000),    # ボーナス分も上限
+    (2345, 3.333, 27, 770),      # 割り切れない値 (最終月に端数が残る)
+]
+
+
+def schedule_rows(columns):
+    return [dict(zip(KEYS, values)) for values in zip(*(columns[k].tolist() for k in KEYS))]
+
+
+@pytest.mark.parametrize("method", ["元利均等返済", "元金均等返済"])
+@pytest.mark.parametrize("loan_man, rate_pct, years, bonus_man", CASES)
+def test_build_schedule_matches_run_calc(loan_man, rate_pct, years, bonus_man, method):
+    expected, total_pay, total_int = mortgage_calc.run_calc(loan_man, rate_pct, years, method, bonus_man)
+    columns, pay, interest = mortgage_calc.build_schedule.__wrapped__(
+        loan_man, rate_pct, years, method, bonus_man, output="columns"
+    )
+    rows = schedule_rows(columns)
+    assert (pay, interest) == (total_pay, total_int)
+    assert len(rows) == years * 12
+    # 最終月 (残りの端数をまとめて返す行) も含めて、全月が円単位で一致する
+    assert rows[-1] == expected[-1] and rows[-1]["残高"] == 0
+    assert rows == expected
+
+
+def test_build_schedule_matches_run_calc_on_random_inputs():
+    rng = random.Random(0)
+    for _ in range(100):
+        loan_man = rng.randrange(100, 50001, 10)
+        bonus_man = rng.choice([0, rng.randrange(0, loan_man // 2 + 1, 10)])
+        args = (loan_man, rng.randint(0, 20000) / 1000, rng.randint(1, 50), rng.choice(["元利均等返済", "元金均等返済"]), bonus_man)
+        expected, total_pay, total_int = mortgage_calc.run_calc(*args)
+        columns, pay, interest = mortgage_calc.build_schedule.__wrapped__(*args, output="columns")
+        assert (pay, interest) == (total_pay, total_int), args
+        assert schedule_rows(columns) == expected, args
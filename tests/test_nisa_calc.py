@@ -0,0 +1,62 @@
+import json
+import os
+import random
+
+import numpy as np
+import pytest
+
+import nisa_calc
+
+
+def write_table(path, header, totals):
+    # lookup_table.py と同じ形式: マジック + ヘッダー長 + JSON ヘッダー + int64 のデータ
+    body = json.dumps(header).encode("utf-8")
+    offset = len(nisa_calc.GROWTH_TABLE_MAGIC) + 4 + len(body)
+    body = json.dumps({**header, "offset": offset + 16}).encode("utf-8")
+    head = nisa_calc.GROWTH_TABLE_MAGIC + len(body).to_bytes(4, "little") + body
+    with open(path, "wb") as f:
+        f.write(head.ljust(offset + 16, b" "))
+        f.write(np.asarray(totals, dtype=np.int64).tobytes())
+
+
+def test_growth_table_is_picked_up_after_it_is_built(tmp_path):
+    path = str(tmp_path / nisa_calc.GROWTH_TABLE_FILE)
+    # 起動時に表が無くても、None はキャッシュされない
+    assert nisa_calc.load_growth_table(path) is None
+
+    header = {"engine": "old", "dtype": "int64", "shape": [1, 1, 2]}
+    write_table(path, header, [0, 100])
+    assert nisa_calc.load_growth_table(path) is None  # 計算ロジックが古い表は使わない
+
+    write_table(path, {**header, "engine": nisa_calc.growth_engine_fingerprint()}, [0, 123456])
+    os.utime(path, ns=(1, 1))  # 同じ秒に書き直しても区別できるよう、更新時刻を変えておく
+    loaded = nisa_calc.load_growth_table(path)
+    assert loaded is not None and loaded[1][0, 0].tolist() == [0, 123456]
+    assert nisa_calc.load_growth_table(path) is loaded
+
+
+EDGE_CASES = [
+    (30000, 20, 5.0),        # ページの初期値
+    (30000, 20, 0.0),        # 利回り 0
+    (30000, 1, 5.0),         # 1年
+    (30000, 50, 5.0),        # 50年
+    (300000, 50, 15.0),      # 積立額・期間・利回りとも最大
+    (300000, 1, 0.1),
+    (1000, 50, 0.1),         # 最小の積立額
+    (1000, 1, 15.0),
+    (123456, 37, 7.3),       # 刻みに乗らない値
+]
+
+
+@pytest.mark.parametrize("monthly_yen, years, rate_pct", EDGE_CASES)
+def test_closed_form_matches_loop_to_the_yen(monthly_yen, years, rate_pct):
+    assert nisa_calc.asset_growth_rows_closed(monthly_yen, years, rate_pct) == nisa_calc.asset_growth_rows_loop(
+        monthly_yen, years, rate_pct
+    )
+
+
+def test_closed_form_matches_loop_on_random_inputs():
+    rng = random.Random(0)
+    for _ in range(200):
+        args = (rng.randrange(1, 301) * 1000, rng.randint(1, 50), rng.randint(0, 150) / 10)
+        assert nisa_calc.asset_growth_rows_closed(*args) == nisa_calc.asset_growth_rows_loop(*args), args
@@ -0,0 +1,51 @@
+import json
+import os
+
+import precompress
+
+
+def write(path, text="x" * 4096):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_only_served_files_are_compressed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in ("index.html", "manifest.json", "sw.js", "requirements.txt", "nisa_grid.bin", "build_manifest.json",
+                 "assets/index-AAAAAAAA.js", "assets/pruned-BBBBBBBB.js"):
+        write(name)
+    # 以前の版が圧縮して残した配信対象外のファイル (状態ファイルに記録がある)
+    write("requirements.txt.br")
+    write("nisa_grid.bin.gz")
+    with open(precompress.STATE_FILE, "w", encoding="utf-8") as f:
+        json.dump({
+            "requirements.txt": {"sha256": "", "variants": [".br"]},
+            "nisa_grid.bin": {"sha256": "", "variants": [".gz"]},
+        }, f)
+    # ユーザーが置いた圧縮ファイル (このツールが書いたものではない)
+    write("clients.csv.gz")
+    write("assets/backup.tar.gz")
+    manifest = {"pages": {"index.html": {}}, "assets": ["index-AAAAAAAA.js", "logo-CCCCCCCC.png"]}
+
+    assert precompress.site_files(manifest) == [
+        os.path.join("assets", "index-AAAAAAAA.js"), "index.html", "manifest.json", "sw.js"
+    ]
+
+    done, skipped, _ = precompress.precompress_site(manifest, workers=1)
+    assert (done, skipped) == (4, 0)
+    compressed = sorted(n for n in os.listdir(".") if n.endswith((".br", ".gz")))
+    assert compressed == ["clients.csv.gz"] + [
+        f"{n}{ext}" for n in ("index.html", "manifest.json", "sw.js") for ext in (".br", ".gz")
+    ]
+    assert sorted(os.listdir("assets")) == [
+        "backup.tar.gz", "index-AAAAAAAA.js", "index-AAAAAAAA.js.br", "index-AAAAAAAA.js.gz", "pruned-BBBBBBBB.js"
+    ]
+
+    # prune されたアセットの .br / .gz は、前回書いたものなので消える
+    manifest["assets"] = []
+    precompress.precompress_site(manifest, workers=1)
+    assert sorted(os.listdir("assets")) == ["backup.tar.gz", "index-AAAAAAAA.js", "pruned-BBBBBBBB.js"]
+
+    done, skipped, _ = precompress.precompress_site(manifest, workers=1)
+    assert (done, skipped) == (0, 3)
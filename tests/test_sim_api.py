@@ -0,0 +1,21 @@
+import pytest
+
+import sim_api
+
+
+def test_normalize_params_fills_defaults():
+    params = sim_api.normalize_params("mortgage", {"loan_man": 3500, "rate_pct": 0.5, "years": 35})
+    assert params == {"loan_man": 3500, "rate_pct": 0.5, "years": 35, "method": "元利均等返済", "bonus_man": 0}
+
+
+@pytest.mark.parametrize("calculator, payload, message", [
+    ("mortgage", {"loan_man": 3500, "rate_pct": 0.5, "years": 35, "method": "x"}, "method は"),
+    ("pfc", {"weight": 65, "body_fat": 15, "activity": "9", "goal": "-500", "protein_ratio": 2.5, "fat_pct": 20},
+     "activity は"),
+    ("nisa", {"monthly_yen": 30000, "years": 0, "rate_pct": 5.0}, "years は"),
+    ("nisa", {"monthly_yen": 30000, "rate_pct": 5.0}, "missing parameter: years"),
+])
+def test_normalize_params_rejects_what_the_notebook_cannot_enter(calculator, payload, message):
+    # 400 になり、計算もキャッシュもされない
+    with pytest.raises(ValueError, match=message):
+        sim_api.normalize_params(calculator, payload)
@@ -0,0 +1,42 @@
+import json
+
+import startup_bench
+
+
+class FakeDriver:
+    def __init__(self, events):
+        self.events = events
+
+    def get_log(self, kind):
+        assert kind == "performance"
+        events, self.events = self.events, []
+        return [{"message": json.dumps({"message": {"method": m, "params": p}})} for m, p in events]
+
+
+def response(request_id, url, from_sw):
+    return "Network.responseReceived", {"requestId": request_id, "response": {"url": url, "fromServiceWorker": from_sw}}
+
+
+def test_network_requests_flags_failures_and_bypassed_responses():
+    driver = FakeDriver([
+        ("Network.requestWillBeSent", {"requestId": "1", "request": {"url": "http://x/index.html"}}),
+        response("1", "http://x/index.html", True),
+        ("Network.requestWillBeSent", {"requestId": "2", "request": {"url": "https://cdn/pyodide.asm.wasm"}}),
+        ("Network.loadingFailed", {"requestId": "2", "errorText": "net::ERR_INTERNET_DISCONNECTED"}),
+        ("Network.requestWillBeSent", {"requestId": "3", "request": {"url": "http://x/aborted.js"}}),
+        ("Network.loadingFailed", {"requestId": "3", "errorText": "net::ERR_ABORTED", "canceled": True}),
+        response("4", "data:image/png;base64,AAAA", False),
+        response("5", "http://x/assets/late.js", False),
+    ])
+    assert startup_bench.network_requests(driver) == (["https://cdn/pyodide.asm.wasm"], ["http://x/assets/late.js"])
+    assert startup_bench.network_requests(driver) == ([], [])
+
+
+def test_offline_start_needs_kernel_and_no_network():
+    ok = {"sw": True, "offline_kernel_ready_ms": 900.0, "offline_failed": [], "offline_network": []}
+    assert startup_bench.offline_problem(ok) is None
+    # スナップショットの出力だけ出て、カーネルが起動しなかった
+    assert startup_bench.offline_problem({**ok, "offline_kernel_ready_ms": None}) == "no offline start"
+    assert "1 request(s) failed" in startup_bench.offline_problem({**ok, "offline_failed": ["https://cdn/a.whl"]})
+    assert "bypassed" in startup_bench.offline_problem({**ok, "offline_network": ["http://x/a.js"]})
+    assert "service worker" in startup_bench.offline_problem({**ok, "sw": False})